@@ -1,37 +1,110 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+from .authentication import revoke_tokens
 from .models import (
     Genre, Artist, Album, Track, AdCampaign, ServiceRequest,
-    PricingTier, License, Cart, CartItem, Order, OrderItem, UserProfile,
+    PricingTier, License, Cart, CartItem, Order, OrderItem, UserProfile, ApiToken,
 )
 
 
+class EstimatedCountPaginator(Paginator):
+    """Paginator that never runs an unbounded COUNT(*).
+
+    Counts up to ``count_cap`` rows exactly. Beyond that, unfiltered changelists use
+    the planner's row estimate (PostgreSQL) or MAX(pk), and filtered ones report the cap.
+    """
+    count_cap = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        bounded = queryset[:self.count_cap].count()
+        if bounded < self.count_cap or queryset.query.where:
+            return bounded
+        return max(self._estimate_rows(queryset), bounded)
+
+    @staticmethod
+    def _estimate_rows(queryset):
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > 0:
+                return row[0]
+        return queryset.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+
+
+class ScaleModeAdmin(admin.ModelAdmin):
+    """Changelist settings for tables with millions of rows.
+
+    Subclasses set ``list_select_related`` for everything their ``__str__``/list_display
+    touches, use autocomplete widgets for foreign keys, and override
+    ``indexed_search_q`` with lookups that hit an index (exact or case-sensitive prefix,
+    related tables via ``pk__in`` subqueries). ``search_fields`` stays declared because
+    autocomplete requires it, but searches are routed through ``indexed_search_q``; the
+    default is a case-insensitive prefix match on the first ``search_fields`` entry.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def indexed_search_q(self, term):
+        field = self.search_fields[0].lstrip('^=@')
+        return Q(**{f"{field}__istartswith": term})
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+        return queryset.filter(self.indexed_search_q(term)), False
+
+
 @admin.register(Genre)
 class GenreAdmin(admin.ModelAdmin):
     search_fields = ("name",)
 
 
 @admin.register(Artist)
-class ArtistAdmin(admin.ModelAdmin):
+class ArtistAdmin(ScaleModeAdmin):
     list_display = ("name",)
     search_fields = ("name",)
 
+    def indexed_search_q(self, term):
+        return Q(name__startswith=term)
+
 
 @admin.register(Album)
-class AlbumAdmin(admin.ModelAdmin):
+class AlbumAdmin(ScaleModeAdmin):
     list_display = ("title", "artist", "genre")
     list_filter = ("genre",)
+    list_select_related = ("artist", "genre")
     search_fields = ("title", "artist__name")
+    autocomplete_fields = ("artist", "genre")
+
+    def indexed_search_q(self, term):
+        return Q(title__startswith=term) | Q(artist__in=Artist.objects.filter(name__startswith=term).values("pk"))
 
 
 @admin.register(Track)
-class TrackAdmin(admin.ModelAdmin):
+class TrackAdmin(ScaleModeAdmin):
     list_display = ("title", "album")
+    list_select_related = ("album__artist",)
     search_fields = ("title", "album__title", "album__artist__name")
+    autocomplete_fields = ("album",)
+
+    def indexed_search_q(self, term):
+        return Q(title__startswith=term) | Q(album__in=Album.objects.filter(title__startswith=term).values("pk"))
 
 
 @admin.register(AdCampaign)
 class AdCampaignAdmin(admin.ModelAdmin):
-    list_display = ("name", "starts_at", "ends_at")
+    list_display = ("name", "starts_at", "ends_at", "weight")
     search_fields = ("name",)
 
 
@@ -48,36 +121,75 @@ class PricingTierAdmin(admin.ModelAdmin):
 
 
 @admin.register(License)
-class LicenseAdmin(admin.ModelAdmin):
+class LicenseAdmin(ScaleModeAdmin):
     list_display = ("id", "buyer", "track", "tier", "status", "created_at")
     list_filter = ("status", "tier")
+    list_select_related = ("buyer", "track__album__artist", "tier")
     search_fields = ("buyer__username", "track__title")
+    autocomplete_fields = ("buyer", "track", "tier")
+
+    def indexed_search_q(self, term):
+        User = self.model._meta.get_field("buyer").related_model
+        return (
+            Q(buyer__in=User.objects.filter(username=term).values("pk"))
+            | Q(track__in=Track.objects.filter(title__startswith=term).values("pk"))
+        )
 
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
+    autocomplete_fields = ("track", "tier")
 
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ("user", "created_at", "updated_at")
+    list_select_related = ("user",)
+    autocomplete_fields = ("user",)
     inlines = [CartItemInline]
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    autocomplete_fields = ("track", "tier")
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ScaleModeAdmin):
     list_display = ("id", "user", "status", "created_at", "reviewed_by", "reviewed_at")
     list_filter = ("status",)
+    list_select_related = ("user", "reviewed_by")
+    search_fields = ("user__username",)
+    autocomplete_fields = ("user", "reviewed_by")
     inlines = [OrderItemInline]
 
+    def indexed_search_q(self, term):
+        User = self.model._meta.get_field("user").related_model
+        return Q(user__in=User.objects.filter(username=term).values("pk"))
+
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ("user", "role")
     list_filter = ("role",)
+    list_select_related = ("user",)
+    autocomplete_fields = ("user",)
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    """Tokens are issued with ``manage.py issue_token``; the secret itself is never stored."""
+    list_display = ("prefix", "user", "name", "created_at", "expires_at", "revoked_at")
+    list_select_related = ("user",)
+    search_fields = ("prefix", "user__username")
+    readonly_fields = ("user", "prefix", "digest", "created_at")
+    actions = ("revoke",)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Revoke selected tokens")
+    def revoke(self, request, queryset):
+        self.message_user(request, f"Revoked {revoke_tokens(queryset)} token(s).")
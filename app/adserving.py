@@ -0,0 +1,75 @@
+"""
+Live ad campaign selection.
+
+Campaign flights (``starts_at``..``ends_at``, inclusive, open ends unbounded) are
+flattened into a sorted boundary array: every distinct flight edge splits the
+timeline into elementary segments, and each segment stores the campaigns live
+throughout it together with their cumulative weights. A lookup is one bisect to
+find the segment, and a weighted pick is one more bisect over its weights.
+
+The index lives in a VersionedSnapshot: saving or deleting an AdCampaign rebuilds
+it in this worker and bumps the shared version so other workers rebuild on their
+next check. Impressions never touch the database.
+"""
+import random
+from bisect import bisect_right
+from datetime import date, timedelta
+from itertools import accumulate
+from typing import NamedTuple, Optional
+
+from .models import AdCampaign
+from .refcache import VersionedSnapshot
+
+
+class _Segment(NamedTuple):
+    campaigns: tuple
+    cumulative_weights: tuple
+
+    @property
+    def total_weight(self):
+        return self.cumulative_weights[-1] if self.cumulative_weights else 0
+
+
+class CampaignIntervalIndex:
+    def __init__(self, campaigns):
+        starts, ends = {}, {}
+        for campaign in campaigns:
+            if campaign.starts_at and campaign.ends_at and campaign.ends_at < campaign.starts_at:
+                continue
+            starts.setdefault(campaign.starts_at, []).append(campaign)
+            if campaign.ends_at is not None:
+                # Flights are inclusive, so the campaign leaves the live set the day after ends_at.
+                ends.setdefault(campaign.ends_at + timedelta(days=1), []).append(campaign)
+
+        # Segment 0 covers everything before the first boundary; segment i covers [points[i-1], points[i]).
+        live = {c.pk: c for c in starts.pop(None, [])}
+        self.points = sorted(set(starts) | set(ends))
+        self.segments = [self._segment(live)]
+        for point in self.points:
+            for campaign in ends.get(point, ()):
+                live.pop(campaign.pk, None)
+            for campaign in starts.get(point, ()):
+                live[campaign.pk] = campaign
+            self.segments.append(self._segment(live))
+
+    @staticmethod
+    def _segment(live):
+        campaigns = tuple(sorted((c for c in live.values() if c.weight > 0), key=lambda c: c.pk))
+        return _Segment(campaigns, tuple(accumulate(c.weight for c in campaigns)))
+
+    def _segment_at(self, day: date) -> _Segment:
+        return self.segments[bisect_right(self.points, day)]
+
+    def live(self, day: date) -> tuple:
+        """Campaigns whose flight covers ``day``, ordered by id."""
+        return self._segment_at(day).campaigns
+
+    def choose(self, day: date, rng=random) -> Optional[AdCampaign]:
+        """Pick one live campaign with probability proportional to its weight."""
+        segment = self._segment_at(day)
+        if not segment.campaigns:
+            return None
+        return segment.campaigns[bisect_right(segment.cumulative_weights, rng.random() * segment.total_weight)]
+
+
+campaign_index = VersionedSnapshot('adcampaign-index', lambda: CampaignIntervalIndex(AdCampaign.objects.all()))
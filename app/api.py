@@ -1,10 +1,28 @@
+import base64
+import binascii
+import logging
+import math
+import time
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Prefetch, Q, Sum
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 
-from .models import Genre, Artist, Album, Track, AdCampaign, ServiceRequest, PricingTier, License, Cart, CartItem, Order, OrderItem
+from .models import Genre, Artist, Album, Track, AdCampaign, ServiceRequest, PricingTier, License, Cart, CartItem, Order, OrderItem, CatalogChange, TrackNeighbor, RevenueRollup, OrderContract, Payment
 from .serializers import (
     GenreSerializer,
     ArtistSerializer,
@@ -17,8 +35,19 @@ from .serializers import (
     CartSerializer,
     CartItemSerializer,
     OrderSerializer,
+    PaymentSerializer,
+    DiscographySerializer,
 )
 from .permissions import IsLegalReviewer, IsOwnerOrReadOnly
+from .adserving import campaign_index
+from .entitlements import entitlement_index
+from .idempotency import idempotent
+from .contracts import ContractService
+from .refcache import catalog_version
+from .payments import PaymentError, PaymentsService, WebhookVerificationError
+from . import facets, reporting
+
+logger = logging.getLogger(__name__)
 
 
 # Public read-only music catalog
@@ -26,36 +55,225 @@ class GenreViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Genre.objects.all().order_by('name')
     serializer_class = GenreSerializer
     permission_classes = [AllowAny]
+    throttle_scope = 'catalog'
 
 
 class ArtistViewSet(viewsets.ModelViewSet):
     queryset = Artist.objects.all().order_by('name')
     serializer_class = ArtistSerializer
     permission_classes = [AllowAny]
+    throttle_scope = 'catalog'
+
+    @staticmethod
+    def discography_queryset():
+        """Artist + albums + tracks in three queries; genres come from the in-process reference cache."""
+        tracks = Track.objects.only('id', 'album_id', 'title', 'duration_seconds', 'bpm', 'preview_file').order_by('pk')
+        albums = (
+            Album.objects.only(
+                'id', 'artist_id', 'genre_id', 'title', 'cover_image', 'release_date', 'track_count', 'total_duration_seconds'
+            )
+            .order_by(F('release_date').desc(nulls_last=True), 'title', 'pk')
+            .prefetch_related(Prefetch('tracks', queryset=tracks))
+        )
+        return Artist.objects.prefetch_related(Prefetch('albums', queryset=albums))
+
+    @action(detail=True, methods=['get'])
+    def discography(self, request, pk=None):
+        """The artist with all albums (newest first) and their tracks, cached until the catalog changes."""
+        key = f"discography:{catalog_version.get()}:{request.get_host()}:{pk}"
+        data = cache.get(key)
+        if data is None:
+            artist = get_object_or_404(self.discography_queryset(), pk=pk)
+            data = DiscographySerializer(artist, context=self.get_serializer_context()).data
+            cache.set(key, data, timeout=settings.DISCOGRAPHY_CACHE_SECONDS)
+        return Response(data)
+
 
+class FacetedListMixin:
+    """List filters ?genre=&artist=&year=&duration= (comma-separated values are OR'ed).
 
-class AlbumViewSet(viewsets.ModelViewSet):
+    With ?facets=1 the list is returned as {"results": [...], "facets": {...}}; counts
+    come from an in-memory facet index (see app/facets.py).
+    """
+    facet_index = None
+    facet_prefix = ''
+    facet_duration_field = 'duration_seconds'
+    facet_buckets = facets.TRACK_DURATION_BUCKETS
+
+    def facet_selection(self):
+        if not hasattr(self, '_facet_selection'):
+            self._facet_selection = facets.parse_selection(self.request.query_params, self.facet_buckets)
+        return self._facet_selection
+
+    def filter_facets(self, queryset):
+        return facets.filter_queryset(
+            queryset, self.facet_selection(), self.facet_prefix, self.facet_duration_field, self.facet_buckets
+        )
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') in ('1', 'true'):
+            response.data = {"results": response.data, "facets": self.facet_index.get().counts(self.facet_selection())}
+        return response
+
+
+class AlbumViewSet(FacetedListMixin, viewsets.ModelViewSet):
     queryset = Album.objects.select_related('artist', 'genre').all().order_by('title')
     serializer_class = AlbumSerializer
     permission_classes = [AllowAny]
+    throttle_scope = 'catalog'
+    facet_index = facets.album_facets
+    facet_duration_field = 'total_duration_seconds'
+    facet_buckets = facets.ALBUM_DURATION_BUCKETS
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return self.filter_facets(queryset) if self.action == 'list' else queryset
+
 
+class TrackViewSet(FacetedListMixin, viewsets.ModelViewSet):
+    """Tracks; list filters on analyzed features, each served by its own index:
 
-class TrackViewSet(viewsets.ModelViewSet):
+    ?bpm_min=&bpm_max=&loudness_min=&loudness_max=&ordering=bpm|-bpm|loudness_db|-loudness_db
+
+    plus the catalog facets of FacetedListMixin (facet counts ignore the feature filters).
+    """
     queryset = Track.objects.select_related('album', 'album__artist').all().order_by('title')
     serializer_class = TrackSerializer
     permission_classes = [AllowAny]
+    throttle_scope = 'catalog'
+    feature_filters = {
+        'bpm_min': 'bpm__gte', 'bpm_max': 'bpm__lte',
+        'loudness_min': 'loudness_db__gte', 'loudness_max': 'loudness_db__lte',
+    }
+    feature_orderings = ('bpm', '-bpm', 'loudness_db', '-loudness_db')
+    facet_index = facets.track_facets
+    facet_prefix = 'album__'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+        lookups = {}
+        for param, lookup in self.feature_filters.items():
+            if params.get(param):
+                try:
+                    value = float(params[param])
+                except ValueError:
+                    value = math.nan
+                if not math.isfinite(value):
+                    raise ValidationError({param: "Must be a number"})
+                lookups[lookup] = value
+        if lookups:
+            queryset = queryset.filter(**lookups)
+        queryset = self.filter_facets(queryset)
+        ordering = params.get('ordering')
+        if ordering:
+            if ordering not in self.feature_orderings:
+                raise ValidationError({"ordering": f"One of {', '.join(self.feature_orderings)}"})
+            queryset = queryset.exclude(**{f"{ordering.lstrip('-')}__isnull": True}).order_by(ordering, 'pk')
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """Tracks most often co-licensed with this one (see the build_recommendations command)."""
+        track = self.get_object()
+        neighbors = (
+            TrackNeighbor.objects.filter(track=track)
+            .select_related('neighbor__album__artist')
+            .order_by('rank')
+        )
+        context = self.get_serializer_context()
+        return Response([
+            {"score": n.score, "track": TrackSerializer(n.neighbor, context=context).data}
+            for n in neighbors
+        ])
 
 
 class PricingTierViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = PricingTier.objects.all().order_by('price_cents')
     serializer_class = PricingTierSerializer
     permission_classes = [AllowAny]
+    throttle_scope = 'catalog'
+
+
+class CatalogChangesViewSet(viewsets.ViewSet):
+    """Delta sync for device-side catalog caches.
+
+    GET /api/catalog/changes/?since=<token>&limit=<n> returns the upserts and
+    tombstones recorded after ``since``. Repeated edits to the same row within a
+    batch collapse into its latest state, so a refresh costs O(edits), not O(catalog).
+    """
+    permission_classes = [AllowAny]
+    throttle_scope = 'catalog'
+    default_limit = 500
+    max_limit = 2000
+    sources = {
+        'genre': (Genre.objects.all(), GenreSerializer),
+        'artist': (Artist.objects.all(), ArtistSerializer),
+        'album': (Album.objects.select_related('artist', 'genre'), AlbumSerializer),
+        'track': (Track.objects.select_related('album', 'album__artist', 'album__genre'), TrackSerializer),
+        'pricingtier': (PricingTier.objects.all(), PricingTierSerializer),
+    }
+
+    def list(self, request):
+        try:
+            since = int(request.query_params.get('since') or 0)
+            limit = min(int(request.query_params.get('limit') or self.default_limit), self.max_limit)
+        except ValueError:
+            return Response({"detail": "since and limit must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if since < 0 or limit < 1:
+            return Response({"detail": "since must be >= 0 and limit >= 1"}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = list(
+            CatalogChange.objects.filter(pk__gt=since).order_by('pk').values_list('pk', 'model', 'object_id', 'op')[:limit]
+        )
+        # Keep only the latest change per row; re-inserting keeps iteration in seq order.
+        latest = {}
+        for seq, model, object_id, op in entries:
+            latest.pop((model, object_id), None)
+            latest[(model, object_id)] = (seq, op)
+
+        upsert_ids = {}
+        for (model, object_id), (seq, op) in latest.items():
+            if op == CatalogChange.Op.UPSERT:
+                upsert_ids.setdefault(model, []).append(object_id)
+        objects = {
+            model: self.sources[model][0].in_bulk(ids)
+            for model, ids in upsert_ids.items() if model in self.sources
+        }
+
+        changes = []
+        for (model, object_id), (seq, op) in latest.items():
+            if op == CatalogChange.Op.DELETE:
+                changes.append({"seq": seq, "model": model, "id": object_id, "op": op})
+                continue
+            obj = objects.get(model, {}).get(object_id)
+            if obj is None:
+                # Deleted after this batch's window; its tombstone follows in a later batch.
+                continue
+            serializer_class = self.sources[model][1]
+            changes.append({
+                "seq": seq,
+                "model": model,
+                "id": object_id,
+                "op": op,
+                "data": serializer_class(obj, context={"request": request}).data,
+            })
+
+        return Response({
+            "changes": changes,
+            "next": str(entries[-1][0] if entries else since),
+            "has_more": len(entries) == limit,
+        })
 
 
 class ServiceRequestViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     queryset = ServiceRequest.objects.all()
     serializer_class = ServiceRequestSerializer
     permission_classes = [AllowAny]
+    throttle_scope = 'service_requests'
 
 
 # Cart and Orders
@@ -109,6 +327,7 @@ class CartViewSet(viewsets.ViewSet):
         return Response(CartSerializer(cart).data)
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def checkout(self, request):
         cart = self.get_cart(request)
         if cart.items.count() == 0:
@@ -130,6 +349,9 @@ class CartViewSet(viewsets.ViewSet):
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    queue_page_size = 50
+    queue_max_page_size = 200
+    max_claim = 50
 
     def get_queryset(self):
         user = self.request.user
@@ -139,36 +361,392 @@ class OrderViewSet(viewsets.ModelViewSet):
         # Buyers see their own orders
         return Order.objects.filter(user=user).order_by('-created_at')
 
+    @staticmethod
+    def queue_queryset():
+        """Pending orders oldest-first (served by the status/created_at index) with items preloaded.
+
+        Tiers are not joined: OrderItemSerializer resolves them from the reference cache.
+        """
+        return (
+            Order.objects.filter(status=Order.Status.PENDING_REVIEW)
+            .select_related('user')
+            .prefetch_related(Prefetch('items', queryset=OrderItem.objects.select_related('track__album__artist')))
+            .order_by('created_at', 'id')
+        )
+
+    @staticmethod
+    def _encode_cursor(order):
+        raw = f"{order.created_at.isoformat()}|{order.pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            raise ValueError("bad cursor")
+        return created_at, int(pk)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsLegalReviewer])
+    def pending_review(self, request):
+        """Keyset-paginated review queue: GET /api/orders/pending_review/?after=<cursor>&limit=<n>."""
+        queryset = self.queue_queryset()
+        try:
+            limit = min(int(request.query_params.get('limit') or self.queue_page_size), self.queue_max_page_size)
+            if limit < 1:
+                raise ValueError("limit must be >= 1")
+            if request.query_params.get('after'):
+                created_at, pk = self._decode_cursor(request.query_params['after'])
+                queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+        except (ValueError, binascii.Error):
+            return Response({"detail": "Invalid cursor or limit"}, status=status.HTTP_400_BAD_REQUEST)
+        orders = list(queryset[:limit + 1])
+        page = orders[:limit]
+        return Response({
+            "results": OrderSerializer(page, many=True).data,
+            "next": self._encode_cursor(page[-1]) if len(orders) > limit else None,
+        })
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsLegalReviewer])
+    def claim(self, request):
+        """Lease up to ``limit`` unclaimed pending orders to the caller.
+
+        Rows locked by a concurrent claim are skipped rather than waited on, so several
+        reviewers can pull from the queue in parallel without receiving the same orders.
+        """
+        try:
+            limit = max(1, min(int(request.data.get('limit', 10)), self.max_claim))
+        except (TypeError, ValueError):
+            return Response({"detail": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        now = timezone.now()
+        lease = timedelta(seconds=settings.REVIEW_CLAIM_LEASE_SECONDS)
+        with transaction.atomic():
+            ids = list(
+                Order.objects.select_for_update(skip_locked=True)
+                .filter(status=Order.Status.PENDING_REVIEW)
+                .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lte=now) | Q(claimed_by=request.user))
+                .order_by('created_at', 'id')
+                .values_list('pk', flat=True)[:limit]
+            )
+            Order.objects.filter(pk__in=ids).update(claimed_by=request.user, claimed_until=now + lease)
+        return Response(OrderSerializer(self.queue_queryset().filter(pk__in=ids), many=True).data)
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsLegalReviewer])
-    def approve(self, request, pk=None):
+    def release(self, request, pk=None):
         order = self.get_object()
+        released = Order.objects.filter(pk=order.pk, claimed_by=request.user).update(claimed_by=None, claimed_until=None)
+        if not released:
+            return Response({"detail": "Order not claimed by you"}, status=status.HTTP_409_CONFLICT)
+        order.refresh_from_db()
+        return Response(OrderSerializer(order).data)
+
+    def _lock_for_review(self, request):
+        """Re-read the order under a row lock; return (order, None) or (None, error response)."""
+        order = Order.objects.select_for_update().get(pk=self.get_object().pk)
         if order.status != Order.Status.PENDING_REVIEW:
-            return Response({"detail": "Order not pending review"}, status=status.HTTP_400_BAD_REQUEST)
-        order.status = Order.Status.APPROVED
+            return None, Response({"detail": "Order not pending review"}, status=status.HTTP_400_BAD_REQUEST)
+        if order.is_claimed_by_other(request.user):
+            return None, Response({"detail": "Order is claimed by another reviewer"}, status=status.HTTP_409_CONFLICT)
+        return order, None
+
+    def _mark_reviewed(self, order, request, new_status):
+        order.status = new_status
         order.reviewed_by = request.user
         order.reviewed_at = timezone.now()
         order.review_notes = request.data.get('review_notes', '')
+        order.claimed_by = None
+        order.claimed_until = None
         order.save()
-        # Issue licenses for each item
-        for item in order.items.select_related('track', 'tier').all():
-            License.objects.create(
-                buyer=order.user,
-                track=item.track,
-                tier=item.tier,
-                status=License.Status.ACTIVE,
-                starts_at=timezone.now().date(),
-                ends_at=None,
-            )
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsLegalReviewer])
+    @idempotent
+    def approve(self, request, pk=None):
+        with transaction.atomic():
+            order, error = self._lock_for_review(request)
+            if error:
+                return error
+            self._mark_reviewed(order, request, Order.Status.APPROVED)
+            # Issue licenses for each item
+            starts_at = timezone.localdate()
+            for item in order.items.select_related('track', 'tier').all():
+                License.objects.create(
+                    buyer=order.user,
+                    track=item.track,
+                    tier=item.tier,
+                    status=License.Status.ACTIVE,
+                    starts_at=starts_at,
+                    ends_at=item.tier.term_end(starts_at),
+                )
+            reporting.record_review(order)
+            # Rendered later in batches by the generate_contracts command
+            OrderContract.objects.get_or_create(order=order)
         return Response(OrderSerializer(order).data)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsLegalReviewer])
+    @idempotent
     def reject(self, request, pk=None):
-        order = self.get_object()
-        if order.status != Order.Status.PENDING_REVIEW:
-            return Response({"detail": "Order not pending review"}, status=status.HTTP_400_BAD_REQUEST)
-        order.status = Order.Status.REJECTED
-        order.reviewed_by = request.user
-        order.reviewed_at = timezone.now()
-        order.review_notes = request.data.get('review_notes', '')
-        order.save()
+        with transaction.atomic():
+            order, error = self._lock_for_review(request)
+            if error:
+                return error
+            self._mark_reviewed(order, request, Order.Status.REJECTED)
+            reporting.record_review(order)
         return Response(OrderSerializer(order).data)
+
+    @action(detail=True, methods=['get'])
+    def contract(self, request, pk=None):
+        """Contract status and document URL for an order (pending until generate_contracts runs)."""
+        contract = ContractService().get_contract(self.get_object())
+        url = request.build_absolute_uri(contract.url) if contract.url else None
+        return Response({"order_id": contract.order_id, "status": contract.status, "url": url})
+
+    def _payment_order(self, request):
+        order = self.get_object()
+        if order.user_id != request.user.pk:
+            return None, Response({"detail": "Only the buyer can pay for an order"}, status=status.HTTP_403_FORBIDDEN)
+        return order, None
+
+    @action(detail=True, methods=['get', 'post'])
+    def payment(self, request, pk=None):
+        """GET: current payment intent. POST: create one (or return the open intent)."""
+        if request.method == 'GET':
+            payment = Payment.objects.filter(order=self.get_object()).first()
+            if payment is None:
+                return Response({"detail": "No payment intent"}, status=status.HTTP_404_NOT_FOUND)
+            return Response(PaymentSerializer(payment).data)
+        order, error = self._payment_order(request)
+        if error:
+            return error
+        try:
+            PaymentsService().create_intent(order)
+        except PaymentError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(PaymentSerializer(order.payment).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], url_path='payment/confirm')
+    @idempotent
+    def confirm_payment(self, request, pk=None):
+        order, error = self._payment_order(request)
+        if error:
+            return error
+        try:
+            PaymentsService().confirm_intent(order, request.data)
+        except PaymentError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(PaymentSerializer(Payment.objects.get(order=order)).data)
+
+
+class PaymentWebhookViewSet(viewsets.ViewSet):
+    """Provider webhook intake: verify, append to the inbox and return 202.
+
+    Events are applied to payments later, in batches, by process_payment_webhooks.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def create(self, request):
+        try:
+            accepted = PaymentsService().receive_webhook(request.body, request.headers)
+        except WebhookVerificationError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"accepted": accepted}, status=status.HTTP_202_ACCEPTED)
+
+
+# Playback entitlement checks
+class EntitlementViewSet(viewsets.ViewSet):
+    """Answer "may the current buyer play this track?" from the in-process entitlement index."""
+    permission_classes = [IsAuthenticated]
+    max_batch = 500
+
+    @staticmethod
+    def _result(track_id, entitled, ends_at):
+        return {"track_id": track_id, "entitled": entitled, "ends_at": ends_at}
+
+    @action(detail=False, methods=['get'])
+    def check(self, request):
+        try:
+            track_id = int(request.query_params['track_id'])
+        except (KeyError, ValueError):
+            return Response({"detail": "track_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        entitled, ends_at = entitlement_index.check(request.user.pk, track_id)
+        return Response(self._result(track_id, entitled, ends_at))
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        track_ids = request.data.get('track_ids')
+        try:
+            track_ids = [int(t) for t in track_ids]
+        except (TypeError, ValueError):
+            return Response({"detail": "track_ids must be a list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(track_ids) > self.max_batch:
+            return Response({"detail": f"At most {self.max_batch} track_ids per batch"}, status=status.HTTP_400_BAD_REQUEST)
+        results = entitlement_index.check_many(request.user.pk, track_ids)
+        return Response({"results": [self._result(t, *results[t]) for t in track_ids]})
+
+
+# CTV ad insertion
+class AdSelectionViewSet(viewsets.ViewSet):
+    """Live campaign lookups served from the in-memory flight index (no DB hit per impression)."""
+    permission_classes = [AllowAny]
+
+    @staticmethod
+    def _day(request):
+        """Resolve ?at= (ISO date or datetime, default now) to a local date; None if unparseable."""
+        at = request.query_params.get('at')
+        if not at:
+            return timezone.localdate()
+        moment = parse_datetime(at)
+        if moment is not None:
+            return timezone.localdate(moment) if timezone.is_aware(moment) else moment.date()
+        return parse_date(at)
+
+    def _resolve(self, request):
+        try:
+            day = self._day(request)
+        except ValueError:
+            day = None
+        return day, campaign_index.get()
+
+    @action(detail=False, methods=['get'])
+    def live(self, request):
+        day, index = self._resolve(request)
+        if day is None:
+            return Response({"detail": "at must be an ISO date or datetime"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(AdCampaignSerializer(index.live(day), many=True, context={"request": request}).data)
+
+    @action(detail=False, methods=['get'])
+    def select(self, request):
+        day, index = self._resolve(request)
+        if day is None:
+            return Response({"detail": "at must be an ISO date or datetime"}, status=status.HTTP_400_BAD_REQUEST)
+        campaign = index.choose(day)
+        if campaign is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(AdCampaignSerializer(campaign, context={"request": request}).data)
+
+
+
+# Request batching for high-latency clients
+class BatchViewSet(viewsets.ViewSet):
+    """POST /api/batch/ {"requests": ["/api/genres/", {"id": "cart", "path": "/api/cart/"}, ...]}
+
+    Runs GET sub-requests against the API views in this process and returns
+    {"responses": [{"id", "path", "status", "duration_ms", "body"}, ...]} in request order.
+    Sub-requests reuse this request's authenticated user, session and cookies and run
+    one after another on this worker's database connection; each view still applies
+    its own permissions and throttles. A sub-request that raises is logged and
+    reported as that entry's 500; the other entries are unaffected.
+    """
+    permission_classes = [AllowAny]
+    api_prefix = '/api/'
+
+    def _parse(self, request):
+        items = request.data.get('requests') if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            raise ValidationError({"requests": "A non-empty list of paths is required"})
+        if len(items) > settings.BATCH_MAX_REQUESTS:
+            raise ValidationError({"requests": f"At most {settings.BATCH_MAX_REQUESTS} sub-requests"})
+        parsed = []
+        for i, item in enumerate(items):
+            if isinstance(item, str):
+                item = {"path": item}
+            if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+                raise ValidationError({"requests": f"Item {i} needs a path"})
+            if item.get('method', 'GET').upper() != 'GET':
+                raise ValidationError({"requests": f"Item {i}: only GET sub-requests are supported"})
+            parsed.append((item.get('id', i), item['path']))
+        return parsed
+
+    def _subrequest(self, request, path, match, query):
+        outer = request._request
+        sub = HttpRequest()
+        sub.method = 'GET'
+        sub.path = sub.path_info = path
+        sub.META = {**outer.META, 'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query}
+        sub.META.pop('CONTENT_LENGTH', None)
+        sub.META.pop('CONTENT_TYPE', None)
+        sub.GET = QueryDict(query)
+        sub.COOKIES = outer.COOKIES
+        sub.resolver_match = match
+        if hasattr(outer, 'session'):
+            sub.session = outer.session
+        if request.user and request.user.is_authenticated:
+            # Reuse the outer authentication instead of resolving credentials again.
+            sub._force_auth_user, sub._force_auth_token = request.user, request.auth
+        return sub
+
+    def _run(self, request, path):
+        parts = urlsplit(path)
+        if parts.scheme or parts.netloc or not parts.path.startswith(self.api_prefix):
+            return status.HTTP_400_BAD_REQUEST, {"detail": f"Only {self.api_prefix} paths can be batched"}
+        try:
+            match = resolve(parts.path)
+        except Resolver404:
+            return status.HTTP_404_NOT_FOUND, {"detail": "Not found."}
+        view_class = getattr(match.func, 'cls', None)
+        if view_class is None or not issubclass(view_class, APIView) or issubclass(view_class, BatchViewSet):
+            return status.HTTP_400_BAD_REQUEST, {"detail": "This path can't be batched"}
+        try:
+            response = match.func(self._subrequest(request, parts.path, match, parts.query), *match.args, **match.kwargs)
+        except Exception:
+            logger.exception("Batched sub-request to %s failed", path)
+            return status.HTTP_500_INTERNAL_SERVER_ERROR, {"detail": "Internal error"}
+        return response.status_code, getattr(response, 'data', None)
+
+    def create(self, request):
+        responses = []
+        for sub_id, path in self._parse(request):
+            started = time.perf_counter()
+            code, body = self._run(request, path)
+            responses.append({
+                "id": sub_id,
+                "path": path,
+                "status": code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "body": body,
+            })
+        return Response({"responses": responses})
+
+
+# Finance reporting
+class RevenueReportViewSet(viewsets.ViewSet):
+    """Revenue totals read only from RevenueRollup.
+
+    GET /api/reports/revenue/?start=YYYY-MM-DD&end=YYYY-MM-DD&group_by=day,tier&status=approved
+    """
+    permission_classes = [IsAdminUser]
+    group_fields = {"day": "day", "status": "status", "tier": "tier_id", "artist": "artist_id", "genre": "genre_id"}
+
+    @staticmethod
+    def _date_param(params, name):
+        value = params.get(name)
+        if not value:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise ValueError(f"Invalid {name}")
+        return parsed
+
+    def list(self, request):
+        params = request.query_params
+        try:
+            start, end = self._date_param(params, 'start'), self._date_param(params, 'end')
+        except ValueError:
+            return Response({"detail": "start and end must be YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        group_by = [g for g in params.get('group_by', 'day').split(',') if g]
+        unknown = set(group_by) - set(self.group_fields)
+        if unknown:
+            return Response({"detail": f"Unknown group_by: {', '.join(sorted(unknown))}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rollups = RevenueRollup.objects.filter(status=params.get('status', Order.Status.APPROVED))
+        if start:
+            rollups = rollups.filter(day__gte=start)
+        if end:
+            rollups = rollups.filter(day__lte=end)
+        columns = [self.group_fields[g] for g in group_by]
+        rows = (
+            rollups.values(*columns)
+            .annotate(lines=Sum('lines'), quantity=Sum('quantity'), revenue_cents=Sum('revenue_cents'))
+            .order_by(*columns)
+        )
+        return Response({"group_by": group_by, "results": list(rows)})
@@ -0,0 +1,99 @@
+"""
+API token authentication.
+
+Clients send ``Authorization: Bearer <token>`` (``Token <token>`` also works).
+Tokens are random 256-bit secrets, so a single SHA-256 is enough to store them.
+There is no password to stretch, and checking a token costs microseconds,
+where BasicAuthentication runs PBKDF2 on every request.
+
+Resolved principals (the user with its profile, so role checks need no query)
+are kept in a process-local map for API_TOKEN_CACHE_SECONDS. The map lives in a
+VersionedSnapshot. Revoking a token, or saving a user, profile or token, bumps
+the shared version, and every worker drops its map within
+REFERENCE_CACHE_CHECK_SECONDS. Cached users are shared between requests and must
+be treated as read-only.
+"""
+import hashlib
+import secrets
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import authentication, exceptions
+
+from .models import ApiToken
+from .refcache import VersionedSnapshot
+
+TOKEN_PREFIX = 'ctv_'
+KEYWORDS = (b'bearer', b'token')
+
+# digest -> (user, monotonic expiry); replaced with an empty dict whenever the version moves
+principals = VersionedSnapshot('api-tokens', dict)
+
+
+def token_digest(raw: str) -> str:
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def issue_token(user, name='', ttl_days=None):
+    """Create a token for ``user``; returns (ApiToken, raw secret). The secret is not stored."""
+    raw = TOKEN_PREFIX + secrets.token_urlsafe(32)
+    token = ApiToken.objects.create(
+        user=user,
+        name=name,
+        prefix=raw[:len(TOKEN_PREFIX) + 6],
+        digest=token_digest(raw),
+        expires_at=timezone.now() + timedelta(days=ttl_days) if ttl_days else None,
+    )
+    return token, raw
+
+
+def revoke_tokens(queryset) -> int:
+    """Revoke every live token in ``queryset``; cached principals are dropped in all workers."""
+    revoked = queryset.filter(revoked_at__isnull=True).update(revoked_at=timezone.now())
+    if revoked:
+        principals.invalidate()
+    return revoked
+
+
+class ApiTokenAuthentication(authentication.BaseAuthentication):
+    def authenticate(self, request):
+        auth = authentication.get_authorization_header(request).split()
+        if not auth or auth[0].lower() not in KEYWORDS:
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+        try:
+            raw = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+        return self.authenticate_credentials(raw)
+
+    def authenticate_credentials(self, raw):
+        digest = token_digest(raw)
+        cache = principals.get()
+        hit = cache.get(digest)
+        now = time.monotonic()
+        if hit is not None and hit[1] > now:
+            return hit[0], None
+
+        token = (
+            ApiToken.objects.select_related('user__profile')
+            .filter(digest=digest, revoked_at__isnull=True).first()
+        )
+        if token is None or (token.expires_at and token.expires_at <= timezone.now()):
+            raise exceptions.AuthenticationFailed("Invalid or expired token.")
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed("User inactive or deleted.")
+
+        ttl = settings.API_TOKEN_CACHE_SECONDS
+        if token.expires_at:
+            ttl = min(ttl, (token.expires_at - timezone.now()).total_seconds())
+        if len(cache) >= settings.API_TOKEN_CACHE_SIZE:
+            cache.clear()
+        cache[digest] = (token.user, now + ttl)
+        return token.user, None
+
+    def authenticate_header(self, request):
+        return 'Bearer'
@@ -1,13 +1,36 @@
 """
-Contracts module (stub)
+Contract generation for approved orders.
 
-This module will house the contract generation and signing flow for approved orders.
-For now, it exposes interfaces and raises NotImplementedError to indicate TODO work.
+A contract is rendered from ``templates/contracts/license_agreement.txt`` with
+the order's items and tier terms. Its content hash covers exactly what the
+template sees plus TEMPLATE_VERSION, so orders with identical terms share one
+stored document (``contracts/<hash>.txt``) and it is rendered only once.
+Per-order state is persisted in OrderContract.
+
+Batches render their distinct documents in a process pool once there are at
+least POOL_THRESHOLD of them; workers only render text, while the parent
+process does all database and storage work.
 """
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from typing import Optional
 
-from .models import Order
+import django
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Order, OrderContract, OrderItem
+
+TEMPLATE_NAME = 'contracts/license_agreement.txt'
+# Bump whenever the template changes so existing documents are not reused.
+TEMPLATE_VERSION = '1'
+POOL_THRESHOLD = 50
 
 
 @dataclass
@@ -17,14 +40,129 @@ class Contract:
     status: str = "pending"
 
 
+def contract_context(order: Order) -> dict:
+    """Template context for an order; its items should be prefetched with track, artist and tier."""
+    items = sorted(
+        (
+            {
+                "track_id": item.track_id,
+                "track": item.track.title,
+                "artist": item.track.album.artist.name,
+                "tier": item.tier.name,
+                "duration_months": item.tier.duration_months,
+                "price_cents": item.price_cents_snapshot,
+                "quantity": item.quantity,
+            }
+            for item in order.items.all()
+        ),
+        key=lambda i: (i["track_id"], i["tier"], i["price_cents"], i["quantity"]),
+    )
+    context = {
+        "template_version": TEMPLATE_VERSION,
+        "items": items,
+        "total_cents": sum(i["price_cents"] * i["quantity"] for i in items),
+    }
+    context["content_hash"] = hashlib.sha256(json.dumps(context, sort_keys=True).encode()).hexdigest()
+    return context
+
+
+def render_contract(context: dict):
+    """Return (text, None) or (None, error message); runs in pool workers."""
+    try:
+        return render_to_string(TEMPLATE_NAME, context), None
+    except Exception as exc:
+        return None, f"{type(exc).__name__}: {exc}"
+
+
+def _render_all(contexts, workers):
+    """Render {hash: context} into {hash: (text, error)}."""
+    if workers <= 1 or len(contexts) < POOL_THRESHOLD:
+        return {h: render_contract(c) for h, c in contexts.items()}
+    # Children must not share the parent's database sockets.
+    connections.close_all()
+    chunksize = max(1, len(contexts) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        return dict(zip(contexts, pool.map(render_contract, contexts.values(), chunksize=chunksize)))
+
+
+def pending_orders():
+    """Approved orders whose contract has not been generated yet."""
+    return Order.objects.filter(status=Order.Status.APPROVED).exclude(contract__status=OrderContract.Status.GENERATED)
+
+
+def generate(order_ids, workers=1, force=False) -> dict:
+    """Generate contracts for the approved orders among ``order_ids``; returns batch statistics.
+
+    Documents already generated for the same content hash are reused unless ``force``.
+    """
+    orders = Order.objects.filter(pk__in=list(order_ids), status=Order.Status.APPROVED).prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('track__album__artist', 'tier'))
+    )
+    contexts = {order.pk: contract_context(order) for order in orders}
+    unique = {c["content_hash"]: c for c in contexts.values()}
+
+    documents = {}
+    if not force:
+        documents = dict(
+            OrderContract.objects.filter(content_hash__in=list(unique), status=OrderContract.Status.GENERATED)
+            .exclude(document='').values_list('content_hash', 'document')
+        )
+    to_render = {h: c for h, c in unique.items() if h not in documents}
+    errors = {}
+    for content_hash, (text, error) in _render_all(to_render, workers).items():
+        if error:
+            errors[content_hash] = error
+            continue
+        documents[content_hash] = default_storage.save(f"contracts/{content_hash}.txt", ContentFile(text.encode()))
+
+    now = timezone.now()
+    rows = {c.order_id: c for c in OrderContract.objects.filter(order_id__in=list(contexts))}
+    new_rows = []
+    for order_id, context in contexts.items():
+        row = rows.get(order_id)
+        if row is None:
+            row = OrderContract(order_id=order_id)
+            new_rows.append(row)
+        content_hash = context["content_hash"]
+        row.content_hash = content_hash
+        row.updated_at = now
+        if content_hash in errors:
+            row.status, row.document, row.error = OrderContract.Status.FAILED, '', errors[content_hash]
+        else:
+            row.status, row.document, row.error = OrderContract.Status.GENERATED, documents[content_hash], ''
+    fields = ['status', 'content_hash', 'document', 'error', 'updated_at']
+    OrderContract.objects.bulk_update(list(rows.values()), fields, batch_size=1000)
+    OrderContract.objects.bulk_create(new_rows, batch_size=1000)
+    return {
+        "orders": len(contexts),
+        "rendered": len(to_render) - len(errors),
+        "reused": len(unique) - len(to_render),
+        "failed": sum(1 for c in contexts.values() if c["content_hash"] in errors),
+    }
+
+
 class ContractService:
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+
     def create_for_order(self, order: Order) -> Contract:
-        """Create a contract for the approved order and return a representation.
+        """Generate (or reuse) the contract document for an approved order."""
+        if order.status != Order.Status.APPROVED:
+            raise ValueError("Contracts are only generated for approved orders")
+        generate([order.pk], workers=1)
+        return self.get_contract(order)
+
+    def create_for_orders(self, orders) -> dict:
+        """Generate contracts for a batch of orders (non-approved ones are skipped)."""
+        return generate([order.pk for order in orders], workers=self.workers)
 
-        TODO: implement storage, PDF generation, and signing provider integration.
-        """
-        raise NotImplementedError("ContractService.create_for_order is not implemented yet")
+    def get_contract(self, order: Order) -> Contract:
+        row = OrderContract.objects.filter(order=order).first()
+        if row is None:
+            return Contract(order_id=order.pk)
+        return Contract(order_id=order.pk, url=row.document.url if row.document else None, status=row.status)
 
     def get_status(self, order: Order) -> str:
         """Return current status of the contract for an order."""
-        raise NotImplementedError("ContractService.get_status is not implemented yet")
+        status = OrderContract.objects.filter(order=order).values_list('status', flat=True).first()
+        return status or OrderContract.Status.PENDING
@@ -0,0 +1,87 @@
+"""
+Denormalized catalog counters.
+
+Album.track_count and total_duration_seconds, and Artist.album_count and
+track_count, are kept current by the Track/Album signal handlers in
+app/signals.py. The handlers apply deltas as F() updates in the saving
+transaction, so concurrent writers never lose an increment. List pages read the
+columns and need no aggregation.
+
+QuerySet.update(), bulk_create() and raw SQL bypass the handlers; ``recount``
+recomputes the counters in pk chunks and fixes the rows that drifted. A track
+written while its chunk is being repaired can still be off by one; run it off-peak.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Album, Artist, CatalogChange
+from .refcache import catalog_changed
+
+# Fields whose change moves a row's contribution to the counters
+TRACK_FIELDS = frozenset({'album', 'album_id', 'duration_seconds'})
+ALBUM_FIELDS = frozenset({'artist', 'artist_id'})
+
+
+def _log_upserts(model_name, ids):
+    # F() updates send no signals; devices syncing the catalog still need the new counts.
+    CatalogChange.objects.bulk_create(
+        CatalogChange(model=model_name, object_id=pk, op=CatalogChange.Op.UPSERT) for pk in ids
+    )
+
+
+def add_track(album_id, seconds, sign=1):
+    """Count a track (``sign=-1``: uncount it) on its album and that album's artist."""
+    Album.objects.filter(pk=album_id).update(
+        track_count=F('track_count') + sign, total_duration_seconds=F('total_duration_seconds') + sign * seconds
+    )
+    artist_ids = list(Album.objects.filter(pk=album_id).values_list('artist_id', flat=True))
+    Artist.objects.filter(pk__in=artist_ids).update(track_count=F('track_count') + sign)
+    _log_upserts('album', [album_id])
+    _log_upserts('artist', artist_ids)
+
+
+def add_album(artist_id, track_count, sign=1):
+    """Count an album and its tracks on an artist (``sign=-1``: uncount them)."""
+    Artist.objects.filter(pk=artist_id).update(
+        album_count=F('album_count') + sign, track_count=F('track_count') + sign * track_count
+    )
+    _log_upserts('artist', [artist_id])
+
+
+def _repair(model, aggregates, chunk_size) -> int:
+    fields = list(aggregates)
+    actual = {f"actual_{name}": Coalesce(expression, 0) for name, expression in aggregates.items()}
+    fixed, last = 0, 0
+    while True:
+        rows = list(
+            model.objects.filter(pk__gt=last).order_by('pk')
+            .annotate(**actual).values('pk', *fields, *actual)[:chunk_size]
+        )
+        if not rows:
+            return fixed
+        drifted = [
+            model(pk=row['pk'], **{name: row[f"actual_{name}"] for name in fields})
+            for row in rows if any(row[name] != row[f"actual_{name}"] for name in fields)
+        ]
+        with transaction.atomic():
+            model.objects.bulk_update(drifted, fields)
+            _log_upserts(model._meta.model_name, [obj.pk for obj in drifted])
+            if drifted:
+                catalog_changed()
+        fixed += len(drifted)
+        last = rows[-1]['pk']
+
+
+def recount(chunk_size=2000) -> dict:
+    """Recompute all counters from the rows; returns how many albums and artists were off."""
+    return {
+        "albums": _repair(Album, {
+            'track_count': Count('tracks'),
+            'total_duration_seconds': Sum('tracks__duration_seconds'),
+        }, chunk_size),
+        "artists": _repair(Artist, {
+            'album_count': Count('albums', distinct=True),
+            'track_count': Count('albums__tracks'),
+        }, chunk_size),
+    }
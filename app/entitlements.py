@@ -0,0 +1,151 @@
+"""
+In-process license entitlement index.
+
+Playback checks ask "does this buyer hold an ACTIVE, unexpired License for this
+track?" at very high rates, so answers come from a per-process dict of
+(buyer_id, track_id) -> {license_id: ends_at} instead of the ORM.
+
+The index is loaded once with all ACTIVE licenses and then refreshed
+incrementally from ``License.updated_at``. Saves in this process are applied
+immediately via signals; other workers pick them up on the next refresh. A miss
+falls back to the database, and negative answers are cached until the next
+refresh so unlicensed plays don't hammer the DB.
+
+QuerySet.update() bypasses signals; callers doing bulk updates must set
+``updated_at`` so the refresh sees them. Deleted rows leave nothing for
+``updated_at`` to find, so a License delete (including cascades from User or
+Track) bumps a shared version, and every worker does a full reload on its next
+refresh.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import License
+from .refcache import SharedVersion
+
+
+class EntitlementIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.deletions = SharedVersion('entitlement-deletions')
+        self.reset()
+
+    def reset(self):
+        """Drop all state; the next lookup performs a full reload."""
+        with self._lock:
+            self._clear()
+            self._next_refresh = 0.0
+
+    def _clear(self):
+        self._entries = {}
+        self._negative = set()
+        self._watermark = None
+        self._deletions_seen = None
+
+    @property
+    def refresh_seconds(self) -> float:
+        return getattr(settings, 'ENTITLEMENT_REFRESH_SECONDS', 5)
+
+    @property
+    def refresh_overlap(self) -> timedelta:
+        # Rows committed late can carry an updated_at older than the watermark; re-reading
+        # a short overlap catches them. Applying a row twice is harmless.
+        return timedelta(seconds=getattr(settings, 'ENTITLEMENT_REFRESH_OVERLAP_SECONDS', 30))
+
+    def _apply(self, license_id, buyer_id, track_id, status, ends_at):
+        key = (buyer_id, track_id)
+        if status == License.Status.ACTIVE:
+            self._entries.setdefault(key, {})[license_id] = ends_at
+            self._negative.discard(key)
+            return
+        held = self._entries.get(key)
+        if held is not None:
+            held.pop(license_id, None)
+            if not held:
+                del self._entries[key]
+
+    def apply_license(self, license: License):
+        """Apply a saved License to the index (called from signals)."""
+        with self._lock:
+            self._apply(license.pk, license.buyer_id, license.track_id, license.status, license.ends_at)
+
+    def discard_license(self, license: License):
+        """Remove a deleted License from the index (called from signals)."""
+        with self._lock:
+            self._apply(license.pk, license.buyer_id, license.track_id, None, None)
+
+    def announce_deletion(self):
+        """Make every worker fully reload on its next refresh (called from signals)."""
+        self.deletions.bump()
+
+    def refresh(self, force=False):
+        """Pull License changes since the last refresh; throttled to ``refresh_seconds``."""
+        now = time.monotonic()
+        if not force and now < self._next_refresh:
+            return
+        with self._lock:
+            if not force and now < self._next_refresh:
+                return
+            self._next_refresh = now + self.refresh_seconds
+            # Read the version before the rows so a concurrent delete forces another reload.
+            deletions = self.deletions.get()
+            if deletions != self._deletions_seen:
+                self._clear()
+                self._deletions_seen = deletions
+            fields = ('pk', 'buyer_id', 'track_id', 'status', 'ends_at', 'updated_at')
+            if self._watermark is None:
+                rows = License.objects.filter(status=License.Status.ACTIVE)
+            else:
+                rows = License.objects.filter(updated_at__gte=self._watermark - self.refresh_overlap)
+            watermark = self._watermark
+            for pk, buyer_id, track_id, status, ends_at, updated_at in rows.values_list(*fields).iterator(chunk_size=5000):
+                self._apply(pk, buyer_id, track_id, status, ends_at)
+                if watermark is None or updated_at > watermark:
+                    watermark = updated_at
+            self._watermark = watermark or timezone.now()
+            self._negative.clear()
+
+    def _load_misses(self, buyer_id, track_ids):
+        rows = License.objects.filter(
+            buyer_id=buyer_id, track_id__in=track_ids, status=License.Status.ACTIVE,
+        ).values_list('pk', 'track_id', 'ends_at')
+        with self._lock:
+            for pk, track_id, ends_at in rows:
+                self._apply(pk, buyer_id, track_id, License.Status.ACTIVE, ends_at)
+            for track_id in track_ids:
+                if (buyer_id, track_id) not in self._entries:
+                    self._negative.add((buyer_id, track_id))
+
+    @staticmethod
+    def _best(held, today):
+        """Return (entitled, ends_at) for the longest-running unexpired license held."""
+        best = False, None
+        for ends_at in (held or {}).values():
+            if ends_at is None:
+                return True, None
+            if ends_at >= today and (not best[0] or ends_at > best[1]):
+                best = True, ends_at
+        return best
+
+    def check_many(self, buyer_id, track_ids, today=None):
+        """Return {track_id: (entitled, ends_at)} for the given buyer."""
+        self.refresh()
+        today = today or timezone.localdate()
+        misses = [
+            track_id for track_id in track_ids
+            if (buyer_id, track_id) not in self._entries and (buyer_id, track_id) not in self._negative
+        ]
+        if misses:
+            self._load_misses(buyer_id, misses)
+        return {track_id: self._best(self._entries.get((buyer_id, track_id)), today) for track_id in track_ids}
+
+    def check(self, buyer_id, track_id, today=None):
+        """Return (entitled, ends_at) for one (buyer, track) pair."""
+        return self.check_many(buyer_id, [track_id], today=today)[track_id]
+
+
+entitlement_index = EntitlementIndex()
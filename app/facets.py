@@ -0,0 +1,146 @@
+"""
+Faceted catalog browsing: filters on genre, artist, release year and duration
+bucket, with per-value counts.
+
+A FacetIndex keeps, per facet, the list of distinct values and a NumPy array
+holding each row's value code (its index in that list, -1 for none), rows in pk
+order. Counts for a request are computed in memory. For each facet, a boolean
+mask of the rows matching every *other* active filter selects the codes that
+``np.bincount`` tallies, so a count says how many rows selecting that value
+would return. No COUNT query runs per request.
+
+The track and album indexes are VersionedSnapshots rebuilt when a write moves a
+row between facet values (see app/signals.py). Filtering itself stays in SQL on
+indexed columns. Counts in other workers may lag a write by up to
+REFERENCE_CACHE_CHECK_SECONDS.
+"""
+import numpy as np
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Album, Track
+from .refcache import VersionedSnapshot
+
+FACETS = ('genre', 'artist', 'year', 'duration')
+# (upper bound in seconds or None, label), ascending
+TRACK_DURATION_BUCKETS = ((120, 'under_2m'), (240, '2_4m'), (360, '4_6m'), (None, 'over_6m'))
+ALBUM_DURATION_BUCKETS = ((1200, 'under_20m'), (2400, '20_40m'), (3600, '40_60m'), (None, 'over_60m'))
+
+# Fields whose change moves a row between facet values. Album durations follow their
+# tracks' counter updates, which already rebuild both indexes.
+TRACK_FIELDS = frozenset({'album', 'album_id', 'duration_seconds'})
+ALBUM_FIELDS = frozenset({'genre', 'genre_id', 'artist', 'artist_id', 'release_date'})
+
+
+def duration_bucket(seconds, buckets) -> str:
+    for upper, label in buckets:
+        if upper is None or seconds < upper:
+            return label
+
+
+def duration_q(field, labels, buckets) -> Q:
+    """OR of the second ranges covered by the selected bucket labels."""
+    q, lower = Q(pk__in=[]), 0
+    for upper, label in buckets:
+        if label in labels:
+            span = Q(**{f"{field}__gte": lower})
+            if upper is not None:
+                span &= Q(**{f"{field}__lt": upper})
+            q |= span
+        lower = upper
+    return q
+
+
+class FacetIndex:
+    def __init__(self, rows):
+        """``rows``: (genre, artist, year, duration bucket) tuples in pk order; None values are not indexed."""
+        lookups = {name: {} for name in FACETS}
+        codes = {name: [] for name in FACETS}
+        for row in rows:
+            for name, value in zip(FACETS, row):
+                codes[name].append(-1 if value is None else lookups[name].setdefault(value, len(lookups[name])))
+        self.values = {name: list(lookup) for name, lookup in lookups.items()}
+        self.lookups = lookups
+        self.codes = {name: np.array(c, dtype=np.int32) for name, c in codes.items()}
+        self.size = len(self.codes[FACETS[0]])
+
+    def matching(self, selected, skip=None):
+        """Boolean mask of rows matching every selected facet (values OR'ed within a facet) except ``skip``."""
+        mask = np.ones(self.size, dtype=bool)
+        for name, values in selected.items():
+            if name != skip:
+                wanted = [self.lookups[name][v] for v in values if v in self.lookups[name]]
+                mask &= np.isin(self.codes[name], wanted)
+        return mask
+
+    def count(self, selected) -> int:
+        return int(self.matching(selected).sum())
+
+    def counts(self, selected) -> dict:
+        """{facet: [{"value", "count"}, ...]} for values with matches, most frequent first."""
+        out = {}
+        for name, values in self.values.items():
+            codes = self.codes[name][self.matching(selected, skip=name)]
+            tally = np.bincount(codes[codes >= 0], minlength=len(values))
+            out[name] = [
+                {"value": values[i], "count": int(tally[i])}
+                for i in sorted(np.flatnonzero(tally), key=lambda i: (-tally[i], str(values[i])))
+            ]
+        return out
+
+
+def _year(day):
+    return day.year if day else None
+
+
+def _track_rows():
+    rows = Track.objects.order_by('pk').values_list(
+        'album__genre_id', 'album__artist_id', 'album__release_date', 'duration_seconds'
+    )
+    for genre, artist, released, seconds in rows.iterator(chunk_size=5000):
+        yield genre, artist, _year(released), duration_bucket(seconds, TRACK_DURATION_BUCKETS)
+
+
+def _album_rows():
+    rows = Album.objects.order_by('pk').values_list('genre_id', 'artist_id', 'release_date', 'total_duration_seconds')
+    for genre, artist, released, seconds in rows.iterator(chunk_size=5000):
+        yield genre, artist, _year(released), duration_bucket(seconds, ALBUM_DURATION_BUCKETS)
+
+
+track_facets = VersionedSnapshot('facets:track', lambda: FacetIndex(_track_rows()))
+album_facets = VersionedSnapshot('facets:album', lambda: FacetIndex(_album_rows()))
+
+
+def _ids(param, raw):
+    try:
+        return {int(v) for v in raw.split(',') if v.strip()}
+    except ValueError:
+        raise ValidationError({param: "Comma-separated integers expected"})
+
+
+def parse_selection(params, buckets) -> dict:
+    """Selected facet values from ?genre=1,2&artist=3&year=2020&duration=2_4m; 400 on bad values."""
+    selected = {}
+    for name in ('genre', 'artist', 'year'):
+        if params.get(name):
+            selected[name] = _ids(name, params[name])
+    if params.get('duration'):
+        labels = {v.strip() for v in params['duration'].split(',') if v.strip()}
+        known = {label for _, label in buckets}
+        if not labels <= known:
+            raise ValidationError({"duration": f"One of {', '.join(label for _, label in buckets)}"})
+        selected['duration'] = labels
+    return {name: values for name, values in selected.items() if values}
+
+
+def filter_queryset(queryset, selected, prefix, duration_field, buckets):
+    """Apply a selection in SQL. ``prefix`` leads from the queryset's model to Album ('' or 'album__')."""
+    if 'genre' in selected:
+        queryset = queryset.filter(**{f"{prefix}genre_id__in": selected['genre']})
+    if 'artist' in selected:
+        queryset = queryset.filter(**{f"{prefix}artist_id__in": selected['artist']})
+    if 'year' in selected:
+        queryset = queryset.filter(**{f"{prefix}release_date__year__in": selected['year']})
+    if 'duration' in selected:
+        queryset = queryset.filter(duration_q(duration_field, selected['duration'], buckets))
+    return queryset
@@ -0,0 +1,102 @@
+"""
+Idempotency-Key support for mutating API actions.
+
+Clients on flaky networks send the same ``Idempotency-Key`` header when they
+retry. The first request claims the key by inserting an IN_PROGRESS row; its
+response is then stored and replayed verbatim for retries until the key
+expires, without re-running the action. Concurrent duplicates get 409 while
+the first is still running, and reusing a key for a different request gets 422.
+Server errors (5xx) and exceptions release the key so the client can retry.
+A worker killed mid-request releases nothing; its IN_PROGRESS row is reclaimed
+once it is older than IDEMPOTENCY_IN_PROGRESS_TIMEOUT_SECONDS.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def _fingerprint(request):
+    data = request.data
+    if hasattr(data, 'dict'):
+        data = data.dict()
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _claim(request, scope, key, fingerprint):
+    """Insert the IN_PROGRESS row; return (record, None) or (None, response to send instead)."""
+    now = timezone.now()
+    ttl = timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS)
+    abandoned_before = now - timedelta(seconds=settings.IDEMPOTENCY_IN_PROGRESS_TIMEOUT_SECONDS)
+    lookup = {"user": request.user, "scope": scope, "key": key}
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(**lookup, request_hash=fingerprint, expires_at=now + ttl), None
+        except IntegrityError:
+            existing = IdempotencyKey.objects.filter(**lookup).first()
+        if existing is None or existing.expires_at <= now:
+            # Released or expired between our insert and read: drop it and try once more.
+            IdempotencyKey.objects.filter(**lookup, expires_at__lte=now).delete()
+            continue
+        if existing.state == IdempotencyKey.State.IN_PROGRESS and existing.created_at <= abandoned_before:
+            # The worker that claimed it died without releasing it; take it over.
+            IdempotencyKey.objects.filter(
+                pk=existing.pk, state=IdempotencyKey.State.IN_PROGRESS, created_at__lte=abandoned_before
+            ).delete()
+            continue
+        if existing.request_hash != fingerprint:
+            return None, Response(
+                {"detail": f"{HEADER} was already used for a different request"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if existing.state == IdempotencyKey.State.IN_PROGRESS:
+            return None, Response(
+                {"detail": f"A request with this {HEADER} is still in progress"},
+                status=status.HTTP_409_CONFLICT, headers={"Retry-After": "1"},
+            )
+        return None, Response(existing.response_body, status=existing.response_status, headers={"Idempotent-Replayed": "true"})
+    return None, Response({"detail": f"Could not reserve {HEADER}; retry"}, status=status.HTTP_409_CONFLICT)
+
+
+def idempotent(view_method):
+    """Decorate a ViewSet action so requests carrying an Idempotency-Key run at most once."""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"detail": f"{HEADER} must be at most 255 characters"}, status=status.HTTP_400_BAD_REQUEST)
+
+        record, early_response = _claim(request, f"{self.basename}.{self.action}", key, _fingerprint(request))
+        if early_response is not None:
+            return early_response
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500:
+            record.delete()
+        else:
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                state=IdempotencyKey.State.COMPLETED,
+                response_status=response.status_code,
+                response_body=response.data,
+            )
+        return response
+
+    return wrapper
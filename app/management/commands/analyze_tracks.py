@@ -0,0 +1,39 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import audio_features
+from app.models import Track
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute loudness, peak and tempo for tracks not analyzed yet, in parallel batches. "
+        "Progress is committed per batch, so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help="Tracks per batch")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Analysis processes (1 = inline)")
+        parser.add_argument('--force', action='store_true', help="Re-analyze tracks that already have features")
+
+    def handle(self, *args, **options):
+        queryset = Track.objects.all() if options['force'] else Track.objects.filter(analyzed_at__isnull=True)
+        analyzed = failed = 0
+        started = time.perf_counter()
+        last_id = 0
+        while True:
+            ids = list(queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']])
+            if not ids:
+                break
+            stats = audio_features.analyze_tracks(ids, workers=options['workers'])
+            analyzed += stats["tracks"]
+            failed += stats["failed"]
+            last_id = ids[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Up to track #{last_id}: {stats}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Analyzed tracks: {analyzed} (unreadable: {failed}) in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+
+from app import renderers
+from app.api import TrackViewSet
+from app.middleware import brotli
+from app.serializers import TrackSerializer
+
+
+def _cpu_ms(fn, repeat):
+    """Average process CPU time of ``fn()`` in milliseconds, and its last result."""
+    start = time.process_time()
+    for _ in range(repeat):
+        result = fn()
+    return (time.process_time() - start) * 1000 / repeat, result
+
+
+class Command(BaseCommand):
+    help = (
+        "Render a page of /api/tracks/ with every available renderer and report bytes on the wire "
+        "(raw, gzip, brotli) and server CPU per response."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help="Tracks in the rendered page")
+        parser.add_argument('--repeat', type=int, default=50, help="Renders averaged per measurement")
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        tracks = list(TrackViewSet.queryset[:options['limit']])
+        data = TrackSerializer(tracks, many=True).data
+
+        candidates = [("json (drf)", JSONRenderer()), ("json (orjson)", renderers.ORJSONRenderer())]
+        if renderers.msgpack is not None:
+            candidates.append(("msgpack", renderers.MessagePackRenderer()))
+        if renderers.cbor2 is not None:
+            candidates.append(("cbor", renderers.CBORRenderer()))
+
+        self.stdout.write(f"{len(tracks)} tracks, {repeat} renders per measurement")
+        self.stdout.write(f"{'format':<14}{'bytes':>10}{'gzip':>10}{'br':>10}{'render ms':>12}{'gzip ms':>10}{'br ms':>10}")
+        for name, renderer in candidates:
+            render_ms, body = _cpu_ms(lambda: renderer.render(data), repeat)
+            gzip_ms, gzipped = _cpu_ms(lambda: compress_string(body), repeat)
+            if brotli is not None:
+                quality = settings.RESPONSE_COMPRESSION_BROTLI_QUALITY
+                br_ms, brotlied = _cpu_ms(lambda: brotli.compress(body, quality=quality), repeat)
+                br_bytes, br_ms = str(len(brotlied)), f"{br_ms:.3f}"
+            else:
+                br_bytes = br_ms = "-"
+            self.stdout.write(
+                f"{name:<14}{len(body):>10}{len(gzipped):>10}{br_bytes:>10}"
+                f"{render_ms:>12.3f}{gzip_ms:>10.3f}{br_ms:>10}"
+            )
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from app import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Incrementally fold new licenses into the track co-licensing matrix and refresh the "
+        "top-K related tracks served by /api/tracks/{id}/related/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=20000, help="Licenses consumed per transaction")
+        parser.add_argument('--top-k', type=int, default=20)
+        parser.add_argument('--full', action='store_true', help="Discard the matrix and rebuild from the first license")
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        stats = recommendations.build(
+            chunk_size=options['chunk_size'], top_k=options['top_k'], full=options['full'], log=log,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Licenses: {stats['licenses']}, pair updates: {stats['pairs']}, tracks rescored: {stats['tracks_rescored']}"
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from app import storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Collapse duplicate files under MEDIA_ROOT/{artists,albums,tracks,ads} into single "
+        "content-addressed blobs, repoint FileFields and recount references."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would change")
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        stats = storage.dedupe(dry_run=options['dry_run'], log=log)
+        self.stdout.write(self.style.SUCCESS(
+            f"Files: {stats['files']}, moved: {stats['moved']}, duplicates removed: {stats['duplicates']} "
+            f"({stats['bytes_reclaimed']} bytes){' [dry run]' if options['dry_run'] else ''}"
+        ))
@@ -0,0 +1,44 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.models import License
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark ACTIVE licenses whose ends_at has passed as EXPIRED. Runs in short bulk UPDATE "
+        "chunks driven by the (status, ends_at) index, so it is safe to schedule every minute."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between chunks")
+        parser.add_argument('--max-chunks', type=int, default=0, help="Stop after this many chunks (0 = no limit)")
+        parser.add_argument('--today', type=date.fromisoformat, default=None, help="Override today's date (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        today = options['today'] or timezone.localdate()
+        chunk_size = options['chunk_size']
+        due = License.objects.filter(status=License.Status.ACTIVE, ends_at__lt=today)
+
+        expired = chunks = 0
+        while True:
+            ids = list(due.order_by('ends_at').values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+            # Each chunk is its own autocommit UPDATE, so row locks are held only briefly.
+            # The status predicate makes overlapping runs harmless. updated_at is bumped
+            # because QuerySet.update() skips auto_now and the entitlement index keys off it.
+            expired += License.objects.filter(pk__in=ids, status=License.Status.ACTIVE).update(
+                status=License.Status.EXPIRED, updated_at=timezone.now(),
+            )
+            chunks += 1
+            if options['max_chunks'] and chunks >= options['max_chunks']:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Expired licenses: {expired} in {chunks} chunk(s)"))
@@ -0,0 +1,41 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import contracts
+from app.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Render contracts for approved orders that don't have one yet, in chunks, using a process "
+        "pool, and report batch throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Orders per batch")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Render processes (1 = inline)")
+        parser.add_argument('--force', action='store_true', help="Re-render every approved order, ignoring cached documents")
+
+    def handle(self, *args, **options):
+        queryset = Order.objects.filter(status=Order.Status.APPROVED) if options['force'] else contracts.pending_orders()
+        totals = dict.fromkeys(("orders", "rendered", "reused", "failed"), 0)
+        started = time.perf_counter()
+        last_id = 0
+        while True:
+            ids = list(queryset.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']])
+            if not ids:
+                break
+            stats = contracts.generate(ids, workers=options['workers'], force=options['force'])
+            for key in totals:
+                totals[key] += stats[key]
+            last_id = ids[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Up to order #{last_id}: {stats}")
+        elapsed = time.perf_counter() - started
+        rate = totals["orders"] / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Orders: {totals['orders']}, rendered: {totals['rendered']}, reused: {totals['reused']}, "
+            f"failed: {totals['failed']} in {elapsed:.2f}s ({rate:.1f} orders/s)"
+        ))
@@ -0,0 +1,38 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import previews
+from app.models import Track
+
+
+class Command(BaseCommand):
+    help = (
+        "Cut faded preview clips from WAV masters for every track whose preview is missing or "
+        "made with different settings, using a process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help="Tracks per batch")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Cutting processes (1 = inline)")
+        parser.add_argument('--force', action='store_true', help="Regenerate previews that are already current")
+
+    def handle(self, *args, **options):
+        totals = dict.fromkeys(("tracks", "generated", "skipped", "failed"), 0)
+        started = time.perf_counter()
+        last_id = 0
+        while True:
+            ids = list(Track.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:options['chunk_size']])
+            if not ids:
+                break
+            stats = previews.generate(ids, workers=options['workers'], force=options['force'])
+            for key in totals:
+                totals[key] += stats[key]
+            last_id = ids[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Up to track #{last_id}: {stats}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Tracks: {totals['tracks']}, generated: {totals['generated']}, up to date: {totals['skipped']}, "
+            f"failed (not PCM WAV): {totals['failed']} in {time.perf_counter() - started:.2f}s"
+        ))
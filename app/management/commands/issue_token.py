@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from app.authentication import issue_token
+
+
+class Command(BaseCommand):
+    help = "Issue an API token for a user and print it once (only its digest is stored)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--name', default='', help="Label shown in the admin, e.g. the device or integration")
+        parser.add_argument('--ttl-days', type=int, default=None, help="Expire the token after this many days")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}")
+        token, raw = issue_token(user, name=options['name'], ttl_days=options['ttl_days'])
+        if options['verbosity'] > 1:
+            expiry = token.expires_at.isoformat() if token.expires_at else "never"
+            self.stdout.write(f"Token #{token.pk} for {user.username}, expires {expiry}")
+        self.stdout.write(self.style.SUCCESS(raw))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import payments
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply queued payment webhook events to payments, one transaction per batch. "
+        "Drains the inbox and exits, or keeps polling with --forever."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--forever', action='store_true', help="Keep polling for new events")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the inbox is empty (--forever)")
+
+    def handle(self, *args, **options):
+        totals = dict.fromkeys(("events", "applied", "ignored", "unknown_intent"), 0)
+        batches = 0
+        while True:
+            stats = payments.apply_pending_events(batch_size=options['batch_size'])
+            if stats["events"]:
+                batches += 1
+                for key in totals:
+                    totals[key] += stats[key]
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"Batch {batches}: {stats}")
+                continue
+            if not options['forever']:
+                break
+            time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Events: {totals['events']} in {batches} batch(es); applied: {totals['applied']}, "
+            f"ignored: {totals['ignored']}, unknown intent: {totals['unknown_intent']}"
+        ))
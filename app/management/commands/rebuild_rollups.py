@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from app import reporting
+
+
+class Command(BaseCommand):
+    help = "Recompute RevenueRollup from reviewed orders in chunks and swap the result in atomically."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Orders aggregated per query")
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        rows = reporting.rebuild(chunk_size=options['chunk_size'], log=log)
+        self.stdout.write(self.style.SUCCESS(f"Rollup rows: {rows}"))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.counters import recount
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized album/artist counters and fix rows that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        fixed = recount(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Fixed albums: {fixed['albums']}, artists: {fixed['artists']} in {time.monotonic() - started:.1f}s"
+        ))
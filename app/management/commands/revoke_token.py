@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.authentication import revoke_tokens
+from app.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = "Revoke API tokens by prefix (as shown in the admin) or all tokens of a user."
+
+    def add_arguments(self, parser):
+        parser.add_argument('prefix', nargs='?')
+        parser.add_argument('--user', help="Revoke every token of this username")
+
+    def handle(self, *args, **options):
+        if bool(options['prefix']) == bool(options['user']):
+            raise CommandError("Give either a token prefix or --user")
+        if options['user']:
+            tokens = ApiToken.objects.filter(user__username=options['user'])
+        else:
+            tokens = ApiToken.objects.filter(prefix=options['prefix'])
+        revoked = revoke_tokens(tokens)
+        self.stdout.write(self.style.SUCCESS(f"Revoked tokens: {revoked}"))
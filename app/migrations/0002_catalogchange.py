@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+def seed_catalog_changes(apps, schema_editor):
+    """Record an upsert for every existing catalog row so a sync from 0 is complete."""
+    CatalogChange = apps.get_model('app', 'CatalogChange')
+    for model_name in ('genre', 'pricingtier', 'artist', 'album', 'track'):
+        Model = apps.get_model('app', model_name)
+        ids = Model.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=2000)
+        batch = []
+        for pk in ids:
+            batch.append(CatalogChange(model=model_name, object_id=pk, op='upsert'))
+            if len(batch) >= 2000:
+                CatalogChange.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            CatalogChange.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=32)),
+                ('object_id', models.BigIntegerField()),
+                ('op', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(seed_catalog_changes, migrations.RunPython.noop),
+    ]
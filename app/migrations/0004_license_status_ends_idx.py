@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_license_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='license',
+            index=models.Index(fields=['status', 'ends_at'], name='license_status_ends_idx'),
+        ),
+    ]
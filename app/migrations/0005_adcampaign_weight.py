@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_license_status_ends_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adcampaign',
+            name='weight',
+            field=models.PositiveIntegerField(default=1, help_text='Relative share of impressions while live'),
+        ),
+    ]
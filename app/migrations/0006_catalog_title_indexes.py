@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_adcampaign_weight'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='album',
+            name='title',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='artist',
+            name='name',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='track',
+            name='title',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+    ]
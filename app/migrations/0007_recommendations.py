@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_catalog_title_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrackNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.track')),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='app.track')),
+            ],
+            options={
+                'ordering': ['track', 'rank'],
+                'unique_together': {('track', 'rank')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackPairCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('buyers', models.PositiveIntegerField(default=0)),
+                ('track_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.track')),
+                ('track_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.track')),
+            ],
+            options={
+                'unique_together': {('track_a', 'track_b')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderContract',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('generated', 'Generated'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20)),
+                ('content_hash', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('document', models.FileField(blank=True, upload_to='contracts/')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='contract', to='app.order')),
+            ],
+        ),
+    ]
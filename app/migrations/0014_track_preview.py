@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:48
+
+import app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_media_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='preview_file',
+            field=models.FileField(blank=True, upload_to=app.models.track_audio_upload_to),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='preview_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
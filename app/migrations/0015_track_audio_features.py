@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_track_preview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='analyzed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='bpm',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='loudness_db',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='peak_db',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:58
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def _aggregate(queryset, outer, expression):
+    sub = queryset.filter(**{outer: OuterRef('pk')}).order_by().values(outer).annotate(v=expression).values('v')
+    return Coalesce(Subquery(sub, output_field=IntegerField()), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    Artist = apps.get_model('app', 'Artist')
+    Album = apps.get_model('app', 'Album')
+    Track = apps.get_model('app', 'Track')
+    Album.objects.update(
+        track_count=_aggregate(Track.objects, 'album', Count('pk')),
+        total_duration_seconds=_aggregate(Track.objects, 'album', Sum('duration_seconds')),
+    )
+    Artist.objects.update(
+        album_count=_aggregate(Album.objects, 'artist', Count('pk')),
+        track_count=_aggregate(Track.objects, 'album__artist', Count('pk')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_api_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='total_duration_seconds',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='track_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='album_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='track_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,29 @@
+import calendar
 import uuid
+from datetime import date, timedelta
 from pathlib import Path
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+
+def shard_path(subdir: str, key: str, filename: str) -> str:
+    """``subdir/ab/cd/filename``: two levels of fan-out taken from ``key``, a random hex string."""
+    return f"{subdir}/{key[:2]}/{key[2:4]}/{filename}"
 
 
 def _uuid_filename(instance, filename: str, subdir: str) -> str:
     ext = Path(filename).suffix.lower()
-    return f"{subdir}/{uuid.uuid4()}{ext}"
+    name = uuid.uuid4()
+    return shard_path(subdir, name.hex, f"{name}{ext}")
+
+
+def add_months(d: date, months: int) -> date:
+    """Shift a date by whole months, clamping the day to the target month's length."""
+    month_index = d.month - 1 + months
+    year, month = d.year + month_index // 12, month_index % 12 + 1
+    return d.replace(year=year, month=month, day=min(d.day, calendar.monthrange(year, month)[1]))
 
 
 def artist_image_upload_to(instance, filename):
@@ -25,6 +42,31 @@ def ad_video_upload_to(instance, filename):
     return _uuid_filename(instance, filename, 'ads')
 
 
+class CounterFieldsMixin:
+    """Denormalized counters are only ever changed with F() updates (see app/counters.py).
+
+    A plain save() of an existing row writes every field except the counters, so an
+    instance loaded before a track was added can't overwrite the newer count.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class AtomicSaveMixin:
+    """save() runs in one transaction, so the row the counter handlers lock in pre_save
+    (see app/signals.py) stays locked until their post_save has applied the delta."""
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
 class Genre(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
@@ -32,30 +74,47 @@ class Genre(models.Model):
         return self.name
 
 
-class Artist(models.Model):
-    name = models.CharField(max_length=200)
+class Artist(CounterFieldsMixin, models.Model):
+    name = models.CharField(max_length=200, db_index=True)
     image = models.ImageField(upload_to=artist_image_upload_to, blank=True, null=True)
+    album_count = models.PositiveIntegerField(default=0)
+    track_count = models.PositiveIntegerField(default=0)
+
+    counter_fields = ('album_count', 'track_count')
 
     def __str__(self):
         return self.name
 
 
-class Album(models.Model):
-    title = models.CharField(max_length=200)
+class Album(CounterFieldsMixin, AtomicSaveMixin, models.Model):
+    title = models.CharField(max_length=200, db_index=True)
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='albums')
     genre = models.ForeignKey(Genre, on_delete=models.SET_NULL, null=True, blank=True, related_name='albums')
     cover_image = models.ImageField(upload_to=album_cover_upload_to, blank=True, null=True)
     release_date = models.DateField(null=True, blank=True)
+    track_count = models.PositiveIntegerField(default=0)
+    total_duration_seconds = models.PositiveIntegerField(default=0)
+
+    counter_fields = ('track_count', 'total_duration_seconds')
 
     def __str__(self):
         return f"{self.title} — {self.artist.name}"
 
 
-class Track(models.Model):
-    title = models.CharField(max_length=200)
+class Track(AtomicSaveMixin, models.Model):
+    title = models.CharField(max_length=200, db_index=True)
     album = models.ForeignKey(Album, on_delete=models.CASCADE, related_name='tracks')
     audio_file = models.FileField(upload_to=track_audio_upload_to)
     duration_seconds = models.PositiveIntegerField(default=0)
+    # Short faded clip cut from audio_file by app/previews.py; preview_key identifies the
+    # master and cut settings it was made from, so unchanged previews are not regenerated.
+    preview_file = models.FileField(upload_to=track_audio_upload_to, blank=True)
+    preview_key = models.CharField(max_length=64, blank=True)
+    # Audio features from app/audio_features.py (null until analyzed); indexed for catalog filters
+    loudness_db = models.FloatField(null=True, blank=True, db_index=True)
+    peak_db = models.FloatField(null=True, blank=True)
+    bpm = models.FloatField(null=True, blank=True, db_index=True)
+    analyzed_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     def __str__(self):
         return f"{self.title} — {self.album.artist.name}"
@@ -66,6 +125,7 @@ class AdCampaign(models.Model):
     video = models.FileField(upload_to=ad_video_upload_to, blank=True, null=True)
     starts_at = models.DateField(null=True, blank=True)
     ends_at = models.DateField(null=True, blank=True)
+    weight = models.PositiveIntegerField(default=1, help_text="Relative share of impressions while live")
 
     def __str__(self):
         return self.name
@@ -108,6 +168,12 @@ class PricingTier(models.Model):
     def __str__(self):
         return f"{self.name} (${self.price_cents / 100:.2f} / {self.duration_months}m)"
 
+    def term_end(self, starts_at: date):
+        """Last day (inclusive) covered by a license starting on ``starts_at``; None if perpetual."""
+        if not self.duration_months:
+            return None
+        return add_months(starts_at, self.duration_months) - timedelta(days=1)
+
 
 class License(models.Model):
     class Status(models.TextChoices):
@@ -123,6 +189,13 @@ class License(models.Model):
     starts_at = models.DateField(null=True, blank=True)
     ends_at = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Drives the expire_licenses sweep: ACTIVE rows ordered by ends_at
+            models.Index(fields=["status", "ends_at"], name="license_status_ends_idx"),
+        ]
 
     def __str__(self):
         return f"License[{self.id}] {self.track.title} for {self.buyer} ({self.tier.name})"
@@ -162,10 +235,22 @@ class Order(models.Model):
     reviewed_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='reviewed_orders')
     reviewed_at = models.DateTimeField(null=True, blank=True)
     review_notes = models.TextField(blank=True)
+    claimed_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='claimed_orders')
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Drives the legal review queue: pending orders, oldest first
+            models.Index(fields=["status", "created_at"], name="order_status_created_idx"),
+        ]
 
     def __str__(self):
         return f"Order[{self.id}] {self.user} — {self.status}"
 
+    def is_claimed_by_other(self, user, now=None) -> bool:
+        now = now or timezone.now()
+        return bool(self.claimed_by_id and self.claimed_by_id != user.pk and self.claimed_until and self.claimed_until > now)
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -176,3 +261,237 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"OrderItem[{self.id}] {self.track.title} ({self.tier.name}) x{self.quantity}"
+
+
+# --- Catalog change tracking (delta sync) ---
+
+class CatalogChange(models.Model):
+    """Append-only change log for catalog models.
+
+    The auto-incrementing primary key doubles as the monotonic sync sequence:
+    clients store the last ``seq`` they applied and ask for everything after it.
+    Deletes are recorded as tombstones so device caches can drop stale rows.
+    """
+
+    class Op(models.TextChoices):
+        UPSERT = 'upsert', 'Upsert'
+        DELETE = 'delete', 'Delete'
+
+    model = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    op = models.CharField(max_length=10, choices=Op.choices)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"CatalogChange[{self.id}] {self.op} {self.model}:{self.object_id}"
+
+
+# --- Batch jobs / recommendations ---
+
+class JobCheckpoint(models.Model):
+    """Resume position for incremental batch jobs (e.g. the last License id processed)."""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+class TrackPairCount(models.Model):
+    """Number of distinct buyers licensing both tracks.
+
+    Stored in both directions; the diagonal (track_a == track_b) holds each
+    track's buyer count, which normalizes the similarity score.
+    """
+    track_a = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='+')
+    track_b = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='+')
+    buyers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("track_a", "track_b")
+
+    def __str__(self):
+        return f"{self.track_a_id}~{self.track_b_id}: {self.buyers}"
+
+
+class TrackNeighbor(models.Model):
+    """Top-K co-licensed tracks per track, served by /api/tracks/{id}/related/."""
+    track = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Track, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ("track", "rank")
+        ordering = ["track", "rank"]
+
+    def __str__(self):
+        return f"{self.track_id} -> {self.neighbor_id} ({self.score:.3f})"
+
+
+# --- Reporting ---
+
+class RevenueRollup(models.Model):
+    """Order line totals per review day, outcome, tier, artist and genre.
+
+    Maintained incrementally on approve/reject and rebuilt by ``rebuild_rollups``.
+    Rows for the same key may repeat (increments don't lock), so always aggregate
+    with SUM. Dimension FKs skip DB constraints so rollups outlive catalog edits.
+    """
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.Status.choices)
+    tier = models.ForeignKey(PricingTier, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    artist = models.ForeignKey(Artist, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    genre = models.ForeignKey(Genre, null=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    lines = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue_cents = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "day"], name="rollup_status_day_idx")]
+
+    def __str__(self):
+        return f"{self.day} {self.status} tier={self.tier_id} artist={self.artist_id}: {self.revenue_cents}c"
+
+
+# --- Request idempotency ---
+
+class IdempotencyKey(models.Model):
+    """Outcome of a mutating request sent with an ``Idempotency-Key`` header (see app/idempotency.py)."""
+
+    class State(models.TextChoices):
+        IN_PROGRESS = 'in_progress', 'In progress'
+        COMPLETED = 'completed', 'Completed'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    scope = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    state = models.CharField(max_length=20, choices=State.choices, default=State.IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ("user", "scope", "key")
+
+    def __str__(self):
+        return f"{self.scope}:{self.key} ({self.state})"
+
+
+# --- Contracts ---
+
+class OrderContract(models.Model):
+    """Persisted state of an approved order's contract document (see app/contracts.py)."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        GENERATED = 'generated', 'Generated'
+        FAILED = 'failed', 'Failed'
+
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='contract')
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING, db_index=True)
+    # sha256 of (order items, tier terms, template version); orders with equal hashes share one document
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    document = models.FileField(upload_to='contracts/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Contract for order {self.order_id} ({self.status})"
+
+
+# --- Payments ---
+
+class Payment(models.Model):
+    """Payment intent for an order; ``status`` only moves along TRANSITIONS (see app/payments.py)."""
+
+    class Status(models.TextChoices):
+        REQUIRES_CONFIRMATION = 'requires_confirmation', 'Requires confirmation'
+        PROCESSING = 'processing', 'Processing'
+        SUCCEEDED = 'succeeded', 'Succeeded'
+        FAILED = 'failed', 'Failed'
+        CANCELED = 'canceled', 'Canceled'
+
+    TRANSITIONS = {
+        Status.REQUIRES_CONFIRMATION: {Status.PROCESSING, Status.SUCCEEDED, Status.FAILED, Status.CANCELED},
+        Status.PROCESSING: {Status.SUCCEEDED, Status.FAILED, Status.CANCELED},
+        Status.SUCCEEDED: set(),
+        Status.FAILED: set(),
+        Status.CANCELED: set(),
+    }
+
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='payment')
+    provider = models.CharField(max_length=32)
+    provider_ref = models.CharField(max_length=128, unique=True)
+    client_secret = models.CharField(max_length=255, blank=True)
+    amount_cents = models.PositiveIntegerField()
+    currency = models.CharField(max_length=3, default='usd')
+    status = models.CharField(max_length=32, choices=Status.choices, default=Status.REQUIRES_CONFIRMATION)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Payment {self.provider_ref} for order {self.order_id} ({self.status})"
+
+    def can_transition(self, to) -> bool:
+        return to in self.TRANSITIONS[self.status]
+
+    @property
+    def is_open(self) -> bool:
+        return self.status in (self.Status.REQUIRES_CONFIRMATION, self.Status.PROCESSING)
+
+
+class WebhookEvent(models.Model):
+    """Inbox of provider webhook deliveries; rows are only inserted, then marked processed in batches."""
+    provider = models.CharField(max_length=32)
+    event_id = models.CharField(max_length=128)
+    event_type = models.CharField(max_length=64)
+    intent_ref = models.CharField(max_length=128)
+    payload = models.JSONField(default=dict)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    outcome = models.CharField(max_length=32, blank=True)
+
+    class Meta:
+        unique_together = ("provider", "event_id")
+        indexes = [
+            # The worker only ever scans the unprocessed tail
+            models.Index(fields=["id"], condition=models.Q(processed_at__isnull=True), name="webhook_unprocessed_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.provider}:{self.event_id} {self.event_type}"
+
+
+# --- Media storage ---
+
+class MediaBlob(models.Model):
+    """A stored media file and how many FileField values point at it (see app/storage.py)."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
+
+
+# --- API tokens ---
+
+class ApiToken(models.Model):
+    """Bearer token for API clients; only the SHA-256 digest of the secret is stored (see app/authentication.py)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='api_tokens')
+    name = models.CharField(max_length=100, blank=True)
+    # First characters of the token, so people can tell their tokens apart
+    prefix = models.CharField(max_length=12, db_index=True)
+    digest = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.prefix}… ({self.user})"
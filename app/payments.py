@@ -1,13 +1,42 @@
 """
-Payments module (stub)
+Payment intents for orders, behind a pluggable provider.
 
-This module will define interfaces for creating and confirming payment intents.
-No provider integration is included yet; methods raise NotImplementedError.
+Each Order has at most one Payment row whose status follows
+``Payment.TRANSITIONS``. The provider (PAYMENTS_PROVIDER, a dotted path) talks
+to the processor; FakePaymentProvider ships for tests and load runs and needs
+no network.
+
+Provider webhooks are not applied inline. The webhook endpoint verifies the
+delivery and inserts it into the WebhookEvent inbox (duplicates by event id
+are dropped by the unique constraint), and ``apply_pending_events`` folds the
+inbox into Payment rows a batch at a time, in one transaction per batch. A
+burst of webhooks therefore costs one small insert per request, and the
+payment/order locking happens in the worker (``process_payment_webhooks``).
 """
+import hashlib
+import hmac
+import json
+import secrets
+import uuid
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from typing import Optional
 
-from .models import Order
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Order, Payment, WebhookEvent
+
+
+class PaymentError(Exception):
+    pass
+
+
+class WebhookVerificationError(PaymentError):
+    pass
 
 
 @dataclass
@@ -15,16 +44,186 @@ class PaymentIntent:
     order_id: int
     client_secret: Optional[str] = None
     status: str = "requires_confirmation"
+    amount_cents: int = 0
+
+
+@dataclass
+class ProviderIntent:
+    ref: str
+    client_secret: str
+    status: str
+
+
+# Provider event types -> the Payment status they move an intent to
+EVENT_STATUSES = {
+    'payment_intent.processing': Payment.Status.PROCESSING,
+    'payment_intent.succeeded': Payment.Status.SUCCEEDED,
+    'payment_intent.payment_failed': Payment.Status.FAILED,
+    'payment_intent.canceled': Payment.Status.CANCELED,
+}
+
+
+class PaymentProvider(ABC):
+    name = ''
+
+    @abstractmethod
+    def create_intent(self, amount_cents: int, currency: str, metadata: dict) -> ProviderIntent:
+        ...
+
+    @abstractmethod
+    def confirm_intent(self, ref: str, payload: dict) -> str:
+        """Submit the client's confirmation; return the resulting Payment status."""
+
+    @abstractmethod
+    def parse_webhook(self, body: bytes, headers) -> list:
+        """Verify a delivery and return its events as dicts with ``id``, ``type`` and ``intent``.
+
+        Raises WebhookVerificationError when the signature does not match.
+        """
+
+
+class FakePaymentProvider(PaymentProvider):
+    """Local provider: intents live only in our database and outcomes arrive as signed webhooks.
+
+    Confirming with ``payment_method="pm_card_declined"`` ends in failure, anything
+    else succeeds; ``outcome_webhook`` builds the delivery a real processor would send.
+    """
+    name = 'fake'
+    signature_header = 'X-Fake-Signature'
+    declined_method = 'pm_card_declined'
+
+    def __init__(self, secret=None):
+        self.secret = (secret or settings.PAYMENTS_WEBHOOK_SECRET).encode()
+
+    def create_intent(self, amount_cents, currency, metadata):
+        ref = f"fake_pi_{uuid.uuid4().hex}"
+        return ProviderIntent(ref=ref, client_secret=f"{ref}_secret_{secrets.token_hex(12)}",
+                              status=Payment.Status.REQUIRES_CONFIRMATION)
+
+    def confirm_intent(self, ref, payload):
+        return Payment.Status.PROCESSING
+
+    def sign(self, body: bytes) -> str:
+        return hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+
+    def outcome_webhook(self, ref, payment_method='pm_card_visa', event_id=None):
+        """Return (body, headers) of the webhook that settles a confirmed intent."""
+        event_type = 'payment_intent.payment_failed' if payment_method == self.declined_method else 'payment_intent.succeeded'
+        body = json.dumps({"events": [
+            {"id": event_id or f"evt_{uuid.uuid4().hex}", "type": event_type, "intent": ref},
+        ]}).encode()
+        return body, {self.signature_header: self.sign(body)}
+
+    def parse_webhook(self, body, headers):
+        if not hmac.compare_digest(self.sign(body), headers.get(self.signature_header, '')):
+            raise WebhookVerificationError("Bad webhook signature")
+        try:
+            events = json.loads(body)["events"]
+        except (ValueError, KeyError, TypeError):
+            raise WebhookVerificationError("Malformed webhook body")
+        return [e for e in events if isinstance(e, dict) and {"id", "type", "intent"} <= e.keys()]
+
+
+def get_provider() -> PaymentProvider:
+    return import_string(settings.PAYMENTS_PROVIDER)()
+
+
+def _intent(payment: Payment) -> PaymentIntent:
+    return PaymentIntent(order_id=payment.order_id, client_secret=payment.client_secret,
+                         status=payment.status, amount_cents=payment.amount_cents)
 
 
 class PaymentsService:
+    def __init__(self, provider: Optional[PaymentProvider] = None):
+        self.provider = provider or get_provider()
+
     def create_intent(self, order: Order) -> PaymentIntent:
-        """Create a payment intent for an order.
+        """Create a payment intent for an order, or return the one still open.
 
-        TODO: integrate with a real payment processor and persist state.
+        A failed or canceled intent is replaced by a fresh one from the provider.
         """
-        raise NotImplementedError("PaymentsService.create_intent is not implemented yet")
+        if order.status == Order.Status.REJECTED:
+            raise PaymentError("Rejected orders cannot be paid")
+        with transaction.atomic():
+            payment = Payment.objects.select_for_update().filter(order=order).first()
+            if payment is not None and (payment.is_open or payment.status == Payment.Status.SUCCEEDED):
+                return _intent(payment)
+            amount = order.items.aggregate(total=Sum(F('price_cents_snapshot') * F('quantity')))['total'] or 0
+            created = self.provider.create_intent(amount, 'usd', {"order_id": order.pk})
+            payment = payment or Payment(order=order)
+            payment.provider = self.provider.name
+            payment.provider_ref = created.ref
+            payment.client_secret = created.client_secret
+            payment.amount_cents = amount
+            payment.status = created.status
+            payment.save()
+        return _intent(payment)
 
     def confirm_intent(self, order: Order, payload: dict) -> PaymentIntent:
         """Confirm a previously created intent for an order."""
-        raise NotImplementedError("PaymentsService.confirm_intent is not implemented yet")
+        with transaction.atomic():
+            payment = Payment.objects.select_for_update().filter(order=order).first()
+            if payment is None:
+                raise PaymentError("No payment intent for this order")
+            if payment.status != Payment.Status.REQUIRES_CONFIRMATION:
+                raise PaymentError(f"Payment is {payment.status}")
+            new_status = self.provider.confirm_intent(payment.provider_ref, payload)
+            if payment.can_transition(new_status):
+                payment.status = new_status
+                payment.save(update_fields=['status', 'updated_at'])
+        return _intent(payment)
+
+    def receive_webhook(self, body: bytes, headers) -> int:
+        """Verify a delivery and append its events to the inbox; returns how many it carried."""
+        events = self.provider.parse_webhook(body, headers)
+        rows = [
+            WebhookEvent(
+                provider=self.provider.name, event_id=str(e["id"])[:128], event_type=str(e["type"])[:64],
+                intent_ref=str(e["intent"])[:128], payload=e,
+            )
+            for e in events
+        ]
+        # ignore_conflicts drops redeliveries; one INSERT, no locks on payments or orders.
+        WebhookEvent.objects.bulk_create(rows, ignore_conflicts=True)
+        return len(rows)
+
+
+def apply_pending_events(batch_size=500) -> dict:
+    """Apply one batch of unprocessed inbox events, in arrival order, in a single transaction.
+
+    Events that would move a payment backwards (late or out-of-order deliveries)
+    are marked ``ignored``; events for intents we don't know are marked ``unknown_intent``.
+    """
+    counts = {"events": 0, "applied": 0, "ignored": 0, "unknown_intent": 0}
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects.filter(processed_at__isnull=True)
+            .select_for_update(skip_locked=True).order_by('id')[:batch_size]
+        )
+        if not events:
+            return counts
+        payments = {
+            p.provider_ref: p
+            # Locked in pk order so concurrent workers can't deadlock on each other's payments
+            for p in Payment.objects.select_for_update().filter(provider_ref__in={e.intent_ref for e in events}).order_by('pk')
+        }
+        changed = {}
+        now = timezone.now()
+        for event in events:
+            payment = payments.get(event.intent_ref)
+            target = EVENT_STATUSES.get(event.event_type)
+            if payment is None:
+                event.outcome = 'unknown_intent'
+            elif target is None or not payment.can_transition(target):
+                event.outcome = 'ignored'
+            else:
+                payment.status = target
+                payment.updated_at = now
+                changed[payment.pk] = payment
+                event.outcome = 'applied'
+            event.processed_at = now
+            counts[event.outcome] += 1
+        Payment.objects.bulk_update(list(changed.values()), ['status', 'updated_at'])
+        WebhookEvent.objects.bulk_update(events, ['processed_at', 'outcome'])
+    counts["events"] = len(events)
+    return counts
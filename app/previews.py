@@ -0,0 +1,133 @@
+"""
+Preview clips for auditioning tracks.
+
+``cut_preview`` copies PREVIEW_LENGTH_SECONDS of a PCM WAV master starting at
+PREVIEW_OFFSET_SECONDS (moved earlier when the track is too short), with a
+linear fade over PREVIEW_FADE_SECONDS at both ends. Frames are streamed with
+``wave`` in CHUNK_FRAMES blocks. Only blocks inside a fade are decoded and
+scaled with NumPy; the rest are copied byte for byte.
+
+Previews are stored like masters, under tracks/ (so they are content-addressed
+and served through signed links). Track.preview_key records the master name and
+cut settings, and ``generate`` skips tracks whose preview is current. Bulk runs
+cut clips in a process pool; the parent process does all database and storage work.
+"""
+import hashlib
+import os
+import tempfile
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+import numpy as np
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connections
+
+from .models import Track
+
+CHUNK_FRAMES = 65536
+POOL_THRESHOLD = 8
+
+
+def decode_pcm(raw: bytes, width: int) -> np.ndarray:
+    """Interleaved PCM bytes (8/16/24/32-bit, as stored in WAV) -> float samples at integer scale."""
+    if width == 1:
+        return np.frombuffer(raw, np.uint8).astype(np.float64) - 128
+    if width == 3:
+        b = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int32)
+        v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        return np.where(v & 0x800000, v - (1 << 24), v).astype(np.float64)
+    return np.frombuffer(raw, {2: '<i2', 4: '<i4'}[width]).astype(np.float64)
+
+
+def encode_pcm(samples: np.ndarray, width: int) -> bytes:
+    s = np.rint(samples)
+    if width == 1:
+        return (s + 128).astype(np.uint8).tobytes()
+    if width == 3:
+        v = s.astype(np.int32) & 0xFFFFFF
+        return np.stack([v & 0xFF, (v >> 8) & 0xFF, v >> 16], axis=-1).astype(np.uint8).tobytes()
+    return s.astype({2: '<i2', 4: '<i4'}[width]).tobytes()
+
+
+def cut_preview(src, dst, offset, length, fade) -> int:
+    """Write the faded preview of WAV ``src`` to ``dst``; returns frames written."""
+    with wave.open(src, 'rb') as master:
+        channels, width, rate = master.getnchannels(), master.getsampwidth(), master.getframerate()
+        total = master.getnframes()
+        count = min(int(length * rate), total)
+        start = max(0, min(int(offset * rate), total - count))
+        fade_frames = min(int(fade * rate), count // 2)
+        master.setpos(start)
+        with wave.open(dst, 'wb') as out:
+            out.setnchannels(channels)
+            out.setsampwidth(width)
+            out.setframerate(rate)
+            done = 0
+            while done < count:
+                raw = master.readframes(min(CHUNK_FRAMES, count - done))
+                n = len(raw) // (width * channels)
+                if not n:
+                    break
+                if fade_frames and (done < fade_frames or done + n > count - fade_frames):
+                    idx = np.arange(done, done + n)
+                    gain = np.clip(np.minimum((idx + 1) / fade_frames, (count - idx) / fade_frames), 0.0, 1.0)
+                    raw = encode_pcm(decode_pcm(raw, width).reshape(n, channels) * gain[:, None], width)
+                out.writeframes(raw)
+                done += n
+    return done
+
+
+def _cut_job(job):
+    """Pool entry point: (track_id, src, dst, settings) -> (track_id, error or None)."""
+    track_id, src, dst, params = job
+    try:
+        cut_preview(src, dst, *params)
+        return track_id, None
+    except (wave.Error, EOFError, KeyError, ValueError, OSError) as exc:
+        return track_id, f"{type(exc).__name__}: {exc}"
+
+
+def cut_settings():
+    return (settings.PREVIEW_OFFSET_SECONDS, settings.PREVIEW_LENGTH_SECONDS, settings.PREVIEW_FADE_SECONDS)
+
+
+def preview_key(audio_name: str) -> str:
+    raw = "|".join(str(part) for part in (audio_name, *cut_settings()))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def generate(track_ids, workers=1, force=False) -> dict:
+    """Cut previews for tracks whose preview is missing or stale; returns batch statistics."""
+    tracks = {t.pk: t for t in Track.objects.filter(pk__in=list(track_ids)).only('audio_file', 'preview_file', 'preview_key')}
+    stats = {"tracks": len(tracks), "generated": 0, "skipped": 0, "failed": 0}
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = []
+        for track in tracks.values():
+            if not force and track.preview_file and track.preview_key == preview_key(track.audio_file.name):
+                stats["skipped"] += 1
+                continue
+            src = default_storage.path(track.audio_file.name)
+            jobs.append((track.pk, src, os.path.join(tmp, f"{track.pk}.wav"), cut_settings()))
+
+        if workers > 1 and len(jobs) >= POOL_THRESHOLD:
+            # Children must not share the parent's database sockets.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+                results = list(pool.map(_cut_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+        else:
+            results = [_cut_job(job) for job in jobs]
+
+        for (track_id, error), (_, _, dst, _) in zip(results, jobs):
+            if error:
+                stats["failed"] += 1
+                continue
+            track = tracks[track_id]
+            with open(dst, 'rb') as fh:
+                track.preview_file = File(fh, name='preview.wav')
+                track.preview_key = preview_key(track.audio_file.name)
+                track.save(update_fields=['preview_file', 'preview_key'])
+            stats["generated"] += 1
+    return stats
@@ -0,0 +1,140 @@
+"""
+Opt-in profiling of live requests.
+
+With PROFILING_ENABLED, ProfilingMiddleware runs a view under cProfile when the
+request carries a valid signed ``X-Profile`` header, or for a random
+PROFILING_SAMPLE_RATE share of requests. DRF responses are rendered inside the
+profile, so serialization is included. Each profile is written with pstats
+``dump_stats`` to PROFILING_DIR, which works as a ring buffer: only the newest
+PROFILING_MAX_FILES files are kept. The response carries ``X-Profile-Id``.
+Staff can list and download profiles at /profiles/. Open them with
+``python -m pstats``, snakeviz, or flameprof for a flame graph.
+
+When PROFILING_ENABLED is off, the middleware raises MiddlewareNotUsed and is
+dropped from the stack, so requests pay nothing.
+"""
+import cProfile
+import hashlib
+import hmac
+import io
+import pstats
+import random
+import re
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.text import slugify
+
+HEADER = 'HTTP_X_PROFILE'
+PROFILE_NAME = re.compile(r'^(?P<ts>[0-9]+)-(?P<ms>[0-9]+)ms-(?P<method>[A-Z]+)-(?P<path>[a-z0-9_-]*)\.prof$')
+
+
+def _signature(expires: int) -> str:
+    return hmac.new(settings.PROFILING_SIGNING_KEY.encode(), f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def sign_header(ttl_seconds=3600, now=None) -> str:
+    """A value for the ``X-Profile`` request header, valid for ``ttl_seconds``."""
+    expires = int((time.time() if now is None else now) + ttl_seconds)
+    return f"{expires}.{_signature(expires)}"
+
+
+def verify_header(value, now=None) -> bool:
+    expires, _, sig = (value or '').partition('.')
+    try:
+        expires = int(expires)
+    except ValueError:
+        return False
+    if expires < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(_signature(expires), sig)
+
+
+def profile_dir() -> Path:
+    return Path(settings.PROFILING_DIR)
+
+
+def list_profiles() -> list:
+    """Stored profiles, newest first, with the metadata encoded in their names."""
+    profiles = []
+    for path in profile_dir().glob('*.prof'):
+        match = PROFILE_NAME.match(path.name)
+        if match:
+            profiles.append({
+                "name": path.name,
+                "recorded_at": datetime.fromtimestamp(int(match['ts']) / 1e9, tz=timezone.utc),
+                "duration_ms": int(match['ms']),
+                "method": match['method'],
+                "path": match['path'],
+                "size": path.stat().st_size,
+            })
+    return sorted(profiles, key=lambda p: p["name"], reverse=True)
+
+
+def profile_path(name: str):
+    """Filesystem path of a stored profile, or None if ``name`` isn't one."""
+    if not PROFILE_NAME.match(name or ''):
+        return None
+    path = profile_dir() / name
+    return path if path.is_file() else None
+
+
+def summary(path, limit=40) -> str:
+    out = io.StringIO()
+    pstats.Stats(str(path), stream=out).sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+def save(profiler, request, elapsed) -> str:
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = slugify(request.path.replace('/', ' ').strip())[:80].replace('-', '_') or 'root'
+    name = f"{time.time_ns()}-{int(elapsed * 1000)}ms-{request.method}-{slug}.prof"
+    profiler.dump_stats(str(directory / name))
+    # Ring buffer: names sort by time, so the oldest files beyond the cap go first.
+    stored = sorted(p for p in directory.glob('*.prof') if PROFILE_NAME.match(p.name))
+    for old in stored[:max(0, len(stored) - settings.PROFILING_MAX_FILES)]:
+        old.unlink(missing_ok=True)
+    return name
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    @staticmethod
+    def wants_profile(request) -> bool:
+        if HEADER in request.META:
+            return verify_header(request.META[HEADER])
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.wants_profile(request):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler already owns this thread
+            return None
+        started = time.perf_counter()
+        try:
+            response = view_func(request, *view_args, **view_kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        finally:
+            profiler.disable()
+            try:
+                name = save(profiler, request, time.perf_counter() - started)
+            except OSError:
+                name = None
+        if name:
+            response['X-Profile-Id'] = name
+        return response
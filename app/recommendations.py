@@ -0,0 +1,152 @@
+"""
+Co-licensing recommendations ("buyers who licensed this also licensed ...").
+
+``build()`` consumes License rows past a JobCheckpoint in chunks. For every
+buyer in a chunk it emits the ordered track pairs the new licenses add to that
+buyer's history, aggregates them with NumPy, and folds the counts into the
+sparse TrackPairCount table with an atomic ``INSERT ... ON CONFLICT`` increment.
+The checkpoint advances in the same transaction, so an interrupted run resumes
+where it stopped.
+
+Tracks touched by new pairs are then rescored with cosine similarity
+(``buyers(a, b) / sqrt(buyers(a) * buyers(b))``), computed vectorized per batch
+of tracks, and their top-K neighbors rewritten in TrackNeighbor. Scores of
+untouched tracks whose neighbors gained buyers drift slightly until the next
+``full=True`` rebuild.
+"""
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import License, JobCheckpoint, TrackPairCount, TrackNeighbor
+
+CHECKPOINT_NAME = 'recommendations.colicensing'
+# Keeps IN (...) lists well under database parameter limits.
+LOOKUP_BATCH = 500
+
+
+def _batches(values, size=LOOKUP_BATCH):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _history(buyer_ids, position):
+    """Tracks each buyer already licensed at or before ``position``."""
+    history = {}
+    for batch in _batches(buyer_ids):
+        rows = (
+            License.objects.filter(buyer_id__in=batch, pk__lte=position)
+            .values_list('buyer_id', 'track_id').distinct()
+        )
+        for buyer_id, track_id in rows:
+            history.setdefault(buyer_id, []).append(track_id)
+    return {buyer_id: np.array(tracks, dtype=np.int64) for buyer_id, tracks in history.items()}
+
+
+def _new_pairs(rows, position):
+    """Return unique (a, b) pairs and counts contributed by a chunk of (buyer_id, track_id) rows."""
+    buyer_tracks = np.unique(np.array(rows, dtype=np.int64), axis=0)
+    buyers = buyer_tracks[:, 0]
+    splits = np.flatnonzero(buyers[1:] != buyers[:-1]) + 1
+    history = _history(np.unique(buyers).tolist(), position)
+    empty = np.empty(0, dtype=np.int64)
+
+    a_parts, b_parts = [], []
+    for group in np.split(buyer_tracks, splits):
+        old = history.get(int(group[0, 0]), empty)
+        new = np.setdiff1d(group[:, 1], old, assume_unique=True)
+        if not new.size:
+            continue
+        owned = np.concatenate([old, new])
+        # new x everything owned (includes the new x new block and the diagonal) ...
+        a_parts += [np.repeat(new, owned.size), np.repeat(old, new.size)]
+        # ... plus old x new, the mirror of new x old.
+        b_parts += [np.tile(owned, new.size), np.tile(new, old.size)]
+    if not a_parts:
+        return np.empty((0, 2), dtype=np.int64), empty
+    pairs = np.stack([np.concatenate(a_parts), np.concatenate(b_parts)], axis=1)
+    return np.unique(pairs, axis=0, return_counts=True)
+
+
+def _increment_pairs(pairs, counts):
+    table = connection.ops.quote_name(TrackPairCount._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} (track_a_id, track_b_id, buyers) VALUES (%s, %s, %s) "
+        f"ON CONFLICT (track_a_id, track_b_id) DO UPDATE SET buyers = {table}.buyers + excluded.buyers"
+    )
+    params = [(int(a), int(b), int(c)) for (a, b), c in zip(pairs, counts)]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _track_buyers(track_ids):
+    """Sorted (track_ids, buyer_counts) arrays from the diagonal of TrackPairCount."""
+    rows = []
+    for batch in _batches(track_ids):
+        rows += TrackPairCount.objects.filter(track_a__in=batch, track_b=F('track_a')).values_list('track_a', 'buyers')
+    rows.sort()
+    data = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    return data[:, 0], data[:, 1]
+
+
+def _rescore(track_ids, top_k):
+    for batch in _batches(sorted(track_ids)):
+        rows = TrackPairCount.objects.filter(track_a__in=batch).exclude(track_b=F('track_a'))
+        data = np.array(list(rows.values_list('track_a', 'track_b', 'buyers')), dtype=np.int64).reshape(-1, 3)
+        neighbors = []
+        if len(data):
+            a, b, together = data.T
+            ids, buyers = _track_buyers(np.unique(np.concatenate([a, b])).tolist())
+            buyers_a = buyers[np.searchsorted(ids, a)]
+            buyers_b = buyers[np.searchsorted(ids, b)]
+            score = together / np.sqrt(np.maximum(buyers_a * buyers_b, 1))
+
+            # Sort by track, then score descending (neighbor id breaks ties), and rank within each track.
+            order = np.lexsort((b, -score, a))
+            a, b, score = a[order], b[order], score[order]
+            starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]])
+            rank = np.arange(a.size) - np.repeat(starts, np.diff(np.r_[starts, a.size]))
+            keep = rank < top_k
+            neighbors = [
+                TrackNeighbor(track_id=int(t), neighbor_id=int(n), score=float(s), rank=int(r) + 1)
+                for t, n, s, r in zip(a[keep], b[keep], score[keep], rank[keep])
+            ]
+        with transaction.atomic():
+            TrackNeighbor.objects.filter(track_id__in=batch).delete()
+            TrackNeighbor.objects.bulk_create(neighbors, batch_size=2000)
+
+
+def build(chunk_size=20000, top_k=20, full=False, log=None):
+    """Fold new licenses into pair counts and refresh neighbors; returns run statistics."""
+    log = log or (lambda message: None)
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+    if full:
+        with transaction.atomic():
+            TrackPairCount.objects.all().delete()
+            TrackNeighbor.objects.all().delete()
+            checkpoint.position = 0
+            checkpoint.save()
+
+    licenses = pairs_written = 0
+    affected = set()
+    while True:
+        chunk = list(
+            License.objects.filter(pk__gt=checkpoint.position).order_by('pk')
+            .values_list('pk', 'buyer_id', 'track_id')[:chunk_size]
+        )
+        if not chunk:
+            break
+        pairs, counts = _new_pairs([(buyer, track) for _, buyer, track in chunk], checkpoint.position)
+        with transaction.atomic():
+            if len(pairs):
+                _increment_pairs(pairs, counts)
+            checkpoint.position = chunk[-1][0]
+            checkpoint.save()
+        affected.update(np.unique(pairs[:, 0]).tolist())
+        licenses += len(chunk)
+        pairs_written += len(pairs)
+        log(f"Consumed licenses up to #{checkpoint.position} ({len(pairs)} pair updates)")
+
+    _rescore(affected, top_k)
+    return {"licenses": licenses, "pairs": pairs_written, "tracks_rescored": len(affected)}
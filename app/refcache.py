@@ -0,0 +1,160 @@
+"""
+Process-local caches for small, read-mostly tables.
+
+Each worker keeps an immutable snapshot in memory and swaps it wholesale when
+a shared version key (stored in the Django cache) changes. Writers bump the
+version after commit; readers poll it at most every REFERENCE_CACHE_CHECK_SECONDS,
+so steady-state lookups never leave the process.
+
+Cross-worker invalidation needs a shared CACHES backend (Redis, Memcached, ...);
+with the default LocMemCache each process only sees its own bumps.
+"""
+import threading
+import time
+from typing import Any, Callable, NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Genre, PricingTier
+
+
+class SharedVersion:
+    """An opaque version counter in the shared cache."""
+
+    def __init__(self, name: str):
+        self.key = f"ctvmusic:version:{name}"
+
+    def get(self):
+        version = cache.get(self.key)
+        if version is None:
+            cache.add(self.key, time.time_ns(), timeout=None)
+            version = cache.get(self.key)
+        return version
+
+    def bump(self):
+        try:
+            return cache.incr(self.key)
+        except ValueError:
+            # Evicted or never set: any fresh value differs from what readers hold.
+            cache.set(self.key, time.time_ns(), timeout=None)
+
+
+class _State(NamedTuple):
+    version: Any
+    data: Any
+    loaded_at: float
+    next_check: float
+
+
+class VersionedSnapshot:
+    """Lazily loaded data that is rebuilt when its SharedVersion changes."""
+
+    def __init__(self, name: str, loader: Callable[[], Any]):
+        self.version = SharedVersion(name)
+        self.loader = loader
+        self._state = None
+        self._lock = threading.Lock()
+
+    @property
+    def check_seconds(self) -> float:
+        return getattr(settings, 'REFERENCE_CACHE_CHECK_SECONDS', 1.0)
+
+    def _load(self, now: float) -> _State:
+        # Read the version before the data so a concurrent bump forces another reload.
+        version = self.version.get()
+        state = _State(version, self.loader(), now, now + self.check_seconds)
+        self._state = state
+        return state
+
+    def get(self):
+        state = self._state
+        now = time.monotonic()
+        if state is not None and now < state.next_check:
+            return state.data
+        with self._lock:
+            state = self._state
+            if state is None:
+                return self._load(now).data
+            if now < state.next_check:
+                return state.data
+            if self.version.get() != state.version:
+                return self._load(now).data
+            self._state = state._replace(next_check=now + self.check_seconds)
+            return state.data
+
+    def age(self) -> float:
+        state = self._state
+        return time.monotonic() - state.loaded_at if state else float('inf')
+
+    def reload(self):
+        with self._lock:
+            return self._load(time.monotonic()).data
+
+    def invalidate(self):
+        """Drop this process's copy and tell other workers to drop theirs."""
+        self._state = None
+        self.version.bump()
+
+
+class ReferenceTable:
+    """Instances and serialized representations of a whole table, keyed by pk.
+
+    Cached instances are shared between requests and must be treated as read-only.
+    """
+
+    # A lookup miss reloads the snapshot at most this often, so bogus ids can't force reload storms.
+    miss_reload_seconds = 1.0
+
+    def __init__(self, model, serializer: str):
+        self.model = model
+        self.serializer = serializer
+        self._snapshot = VersionedSnapshot(f"ref:{model._meta.label_lower}", self._load)
+
+    def __deepcopy__(self, memo):
+        # Process-wide singleton; DRF deep-copies field arguments per serializer instance.
+        return self
+
+    def _load(self):
+        serializer_class = import_string(self.serializer)
+        instances = {obj.pk: obj for obj in self.model.objects.all()}
+        representations = {pk: dict(serializer_class(obj).data) for pk, obj in instances.items()}
+        return instances, representations
+
+    def _lookup(self, pk):
+        instances, representations = self._snapshot.get()
+        if pk not in instances and self._snapshot.age() > self.miss_reload_seconds:
+            instances, representations = self._snapshot.reload()
+        return instances, representations
+
+    def get(self, pk):
+        """Return the cached instance for ``pk`` or None."""
+        return self._lookup(pk)[0].get(pk)
+
+    def representation(self, pk):
+        """Return a copy of the serialized form of ``pk`` or None."""
+        data = self._lookup(pk)[1].get(pk)
+        return dict(data) if data is not None else None
+
+    def invalidate(self):
+        self._snapshot.invalidate()
+
+
+# Serializers are resolved lazily because app.serializers imports this module.
+pricing_tiers = ReferenceTable(PricingTier, serializer='app.serializers.PricingTierSerializer')
+genres = ReferenceTable(Genre, serializer='app.serializers.GenreSerializer')
+
+# Bumped on every catalog edit (see app/signals.py); keys derived responses such as artist discographies.
+catalog_version = SharedVersion('catalog')
+
+
+def catalog_changed():
+    """Retire cached catalog responses now and again after commit.
+
+    Model signals do this for ordinary saves; bulk writes (QuerySet.update,
+    bulk_update) send no signals and must call it themselves.
+    """
+    catalog_version.bump()
+    transaction.on_commit(catalog_version.bump)
@@ -0,0 +1,103 @@
+"""
+Compact API encodings negotiated via ``Accept`` (or ``?format=``).
+
+- ORJSONRenderer: the default JSON renderer, encoding through orjson when it is
+  installed and falling back to DRF's JSONRenderer otherwise (and for indented output).
+- MessagePack (``application/msgpack``) needs the ``msgpack`` package.
+- CBOR (``application/cbor``) needs the ``cbor2`` package.
+
+settings.py only registers the binary formats whose package is importable.
+"""
+import datetime
+import decimal
+import uuid
+
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover - optional dependency
+    cbor2 = None
+
+
+def encode_default(obj):
+    """Fallback for types the binary encoders don't know, mirroring DRF's JSONEncoder."""
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, 'tolist'):  # NumPy scalars and arrays
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+class MessagePackParser(parsers.BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except Exception as exc:
+            raise ParseError(f"MessagePack parse error - {exc}")
+
+
+class CBORRenderer(renderers.BaseRenderer):
+    media_type = 'application/cbor'
+    format = 'cbor'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return cbor2.dumps(data, default=lambda encoder, value: encoder.encode(encode_default(value)))
+
+
+class CBORParser(parsers.BaseParser):
+    media_type = 'application/cbor'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return cbor2.loads(stream.read())
+        except Exception as exc:
+            raise ParseError(f"CBOR parse error - {exc}")
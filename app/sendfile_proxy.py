@@ -0,0 +1,69 @@
+"""
+Local stand-in for the front proxy's X-Accel-Redirect / X-Sendfile handling.
+
+    python -m app.sendfile_proxy [port]
+
+serves the Django app through wsgiref on 127.0.0.1 (default port 8001). When a
+response asks for a file handoff, the stub replaces it with the file from
+MEDIA_ROOT, as nginx's ``internal`` location or mod_xsendfile would in
+production. For development and tests only.
+"""
+import os
+import sys
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
+
+OFFLOAD_HEADERS = ('x-accel-redirect', 'x-sendfile')
+
+
+class SendfileProxy:
+    def __init__(self, application):
+        self.application = application
+        self.media_root = os.path.realpath(settings.MEDIA_ROOT)
+        self.accel_prefix = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/'
+
+    def resolve(self, header, value):
+        """Filesystem path for an offload header, or None if it points outside MEDIA_ROOT."""
+        if header == 'x-accel-redirect':
+            if not value.startswith(self.accel_prefix):
+                return None
+            value = os.path.join(self.media_root, value[len(self.accel_prefix):])
+        path = os.path.realpath(value)
+        return path if path.startswith(self.media_root + os.sep) else None
+
+    def __call__(self, environ, start_response):
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured.update(status=status, headers=headers)
+            return lambda data: None
+
+        body = self.application(environ, capture)
+        offload = [(k.lower(), v) for k, v in captured['headers'] if k.lower() in OFFLOAD_HEADERS]
+        if not offload:
+            start_response(captured['status'], captured['headers'])
+            return body
+        if hasattr(body, 'close'):
+            body.close()
+
+        path = self.resolve(*offload[0])
+        if path is None or not os.path.isfile(path):
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+        headers = [(k, v) for k, v in captured['headers'] if k.lower() not in OFFLOAD_HEADERS + ('content-length',)]
+        headers.append(('Content-Length', str(os.path.getsize(path))))
+        start_response(captured['status'], headers)
+        return FileWrapper(open(path, 'rb'))
+
+
+if __name__ == '__main__':
+    from wsgiref.simple_server import make_server
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ctvmusic.settings')
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8001
+    print(f"Serving with sendfile emulation on http://127.0.0.1:{port}/")
+    make_server('127.0.0.1', port, SendfileProxy(application)).serve_forever()
@@ -1,6 +1,53 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Genre, Artist, Album, Track, AdCampaign, ServiceRequest, PricingTier, License, Cart, CartItem, Order, OrderItem, UserProfile
+from .models import Genre, Artist, Album, Track, AdCampaign, ServiceRequest, PricingTier, License, Cart, CartItem, Order, OrderItem, UserProfile, Payment
+from .refcache import genres, pricing_tiers
+from .signed_media import signed_url
+
+
+class CachedReferenceField(serializers.Field):
+    """Read-only nested representation served from a process-local ReferenceTable.
+
+    Use with ``source="<fk>_id"`` so the related row is never fetched.
+    """
+
+    def __init__(self, table, **kwargs):
+        self.table = table
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, pk):
+        return self.table.representation(pk)
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField that validates ids against a ReferenceTable instead of the DB."""
+
+    def __init__(self, table, **kwargs):
+        self.table = table
+        kwargs.setdefault("queryset", table.model.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        obj = self.table.get(pk)
+        if obj is None:
+            self.fail("does_not_exist", pk_value=data)
+        return obj
+
+
+class SignedFileField(serializers.FileField):
+    """FileField whose output is a signed, expiring URL served through the front proxy."""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return signed_url(value.name, self.context.get("request"))
 
 
 class GenreSerializer(serializers.ModelSerializer):
@@ -12,33 +59,72 @@ class GenreSerializer(serializers.ModelSerializer):
 class ArtistSerializer(serializers.ModelSerializer):
     class Meta:
         model = Artist
-        fields = ["id", "name", "image"]
+        fields = ["id", "name", "image", "album_count", "track_count"]
+        read_only_fields = ["album_count", "track_count"]
 
 
 class AlbumSerializer(serializers.ModelSerializer):
     artist = ArtistSerializer(read_only=True)
     artist_id = serializers.PrimaryKeyRelatedField(queryset=Artist.objects.all(), source="artist", write_only=True)
-    genre = GenreSerializer(read_only=True)
-    genre_id = serializers.PrimaryKeyRelatedField(queryset=Genre.objects.all(), source="genre", allow_null=True, required=False, write_only=True)
+    genre = CachedReferenceField(genres, source="genre_id")
+    genre_id = CachedPrimaryKeyRelatedField(genres, source="genre", allow_null=True, required=False, write_only=True)
 
     class Meta:
         model = Album
-        fields = ["id", "title", "artist", "artist_id", "genre", "genre_id", "cover_image", "release_date"]
+        fields = [
+            "id", "title", "artist", "artist_id", "genre", "genre_id", "cover_image", "release_date",
+            "track_count", "total_duration_seconds",
+        ]
+        read_only_fields = ["track_count", "total_duration_seconds"]
 
 
 class TrackSerializer(serializers.ModelSerializer):
     album = AlbumSerializer(read_only=True)
     album_id = serializers.PrimaryKeyRelatedField(queryset=Album.objects.all(), source="album", write_only=True)
+    audio_file = SignedFileField()
+    preview_file = SignedFileField(read_only=True)
 
     class Meta:
         model = Track
-        fields = ["id", "title", "album", "album_id", "audio_file", "duration_seconds"]
+        fields = ["id", "title", "album", "album_id", "audio_file", "preview_file", "duration_seconds", "loudness_db", "peak_db", "bpm"]
+        read_only_fields = ["loudness_db", "peak_db", "bpm"]
+
+
+class DiscographyTrackSerializer(serializers.ModelSerializer):
+    preview_file = SignedFileField(read_only=True)
+
+    class Meta:
+        model = Track
+        fields = ["id", "title", "duration_seconds", "bpm", "preview_file"]
+        read_only_fields = fields
+
+
+class DiscographyAlbumSerializer(serializers.ModelSerializer):
+    genre = CachedReferenceField(genres, source="genre_id")
+    tracks = DiscographyTrackSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Album
+        fields = ["id", "title", "genre", "cover_image", "release_date", "track_count", "total_duration_seconds", "tracks"]
+        read_only_fields = fields
+
+
+class DiscographySerializer(serializers.ModelSerializer):
+    """An artist with every album and track, nested (GET /artists/{id}/discography/)."""
+    albums = DiscographyAlbumSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Artist
+        fields = ["id", "name", "image", "album_count", "track_count", "albums"]
+        read_only_fields = fields
 
 
 class AdCampaignSerializer(serializers.ModelSerializer):
+    video = SignedFileField(required=False, allow_null=True)
+
     class Meta:
         model = AdCampaign
-        fields = ["id", "name", "video", "starts_at", "ends_at"]
+        fields = ["id", "name", "video", "starts_at", "ends_at", "weight"]
 
 
 class ServiceRequestSerializer(serializers.ModelSerializer):
@@ -57,8 +143,8 @@ class PricingTierSerializer(serializers.ModelSerializer):
 class LicenseSerializer(serializers.ModelSerializer):
     track = TrackSerializer(read_only=True)
     track_id = serializers.PrimaryKeyRelatedField(queryset=Track.objects.all(), source="track", write_only=True)
-    tier = PricingTierSerializer(read_only=True)
-    tier_id = serializers.PrimaryKeyRelatedField(queryset=PricingTier.objects.all(), source="tier", write_only=True)
+    tier = CachedReferenceField(pricing_tiers, source="tier_id")
+    tier_id = CachedPrimaryKeyRelatedField(pricing_tiers, source="tier", write_only=True)
 
     class Meta:
         model = License
@@ -86,8 +172,8 @@ class LicenseSerializer(serializers.ModelSerializer):
 class CartItemSerializer(serializers.ModelSerializer):
     track = TrackSerializer(read_only=True)
     track_id = serializers.PrimaryKeyRelatedField(queryset=Track.objects.all(), source="track", write_only=True)
-    tier = PricingTierSerializer(read_only=True)
-    tier_id = serializers.PrimaryKeyRelatedField(queryset=PricingTier.objects.all(), source="tier", write_only=True)
+    tier = CachedReferenceField(pricing_tiers, source="tier_id")
+    tier_id = CachedPrimaryKeyRelatedField(pricing_tiers, source="tier", write_only=True)
 
     class Meta:
         model = CartItem
@@ -105,7 +191,7 @@ class CartSerializer(serializers.ModelSerializer):
 
 class OrderItemSerializer(serializers.ModelSerializer):
     track = TrackSerializer(read_only=True)
-    tier = PricingTierSerializer(read_only=True)
+    tier = CachedReferenceField(pricing_tiers, source="tier_id")
 
     class Meta:
         model = OrderItem
@@ -118,8 +204,15 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ["id", "user", "status", "created_at", "reviewed_by", "reviewed_at", "review_notes", "items"]
-        read_only_fields = ["user", "status", "created_at", "reviewed_by", "reviewed_at"]
+        fields = ["id", "user", "status", "created_at", "reviewed_by", "reviewed_at", "review_notes", "claimed_by", "claimed_until", "items"]
+        read_only_fields = ["user", "status", "created_at", "reviewed_by", "reviewed_at", "claimed_by", "claimed_until"]
+
+
+class PaymentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ["order", "provider", "provider_ref", "client_secret", "amount_cents", "currency", "status", "created_at", "updated_at"]
+        read_only_fields = fields
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
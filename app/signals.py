@@ -1,18 +1,262 @@
 from django.conf import settings
 from django.apps import apps
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
 
-from .models import UserProfile
+from . import counters, facets
+from .adserving import campaign_index
+from .authentication import principals
+from .entitlements import entitlement_index
+from .refcache import catalog_changed, genres, pricing_tiers
+from .storage import MEDIA_FIELDS
+from .models import ApiToken, UserProfile, CatalogChange, Genre, Artist, Album, Track, PricingTier, License, AdCampaign
 
 
 # Resolve the User model after apps are ready via apps.get_model in AppConfig.ready()
 app_label, model_name = settings.AUTH_USER_MODEL.split('.')
 User = apps.get_model(app_label, model_name)
 
+# Models mirrored by device-side catalog caches (see /api/catalog/changes/)
+CATALOG_MODELS = (Genre, Artist, Album, Track, PricingTier)
+
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """Automatically create a UserProfile for each new user (default role = buyer)."""
     if created:
         UserProfile.objects.get_or_create(user=instance, defaults={"role": UserProfile.Role.BUYER})
+
+
+def record_catalog_upsert(sender, instance, raw=False, **kwargs):
+    """Append an upsert to the catalog change log. Fixture loads are skipped."""
+    if raw:
+        return
+    CatalogChange.objects.create(model=sender._meta.model_name, object_id=instance.pk, op=CatalogChange.Op.UPSERT)
+
+
+def record_catalog_delete(sender, instance, **kwargs):
+    """Append a tombstone to the catalog change log."""
+    CatalogChange.objects.create(model=sender._meta.model_name, object_id=instance.pk, op=CatalogChange.Op.DELETE)
+
+
+def bump_catalog_version(sender, raw=False, **kwargs):
+    """Retire cached catalog responses now and again after commit, like invalidate_on_change."""
+    if raw:
+        return
+    catalog_changed()
+
+
+@receiver(pre_delete, sender=Genre)
+def record_genre_detach(sender, instance, **kwargs):
+    """Albums lose their genre via SET_NULL without a post_save, so log them explicitly."""
+    album_ids = list(instance.albums.values_list('pk', flat=True))
+    CatalogChange.objects.bulk_create(
+        CatalogChange(model='album', object_id=pk, op=CatalogChange.Op.UPSERT) for pk in album_ids
+    )
+
+
+for _model in CATALOG_MODELS:
+    _name = _model._meta.model_name
+    post_save.connect(record_catalog_upsert, sender=_model, dispatch_uid=f"catalog_upsert_{_name}")
+    post_delete.connect(record_catalog_delete, sender=_model, dispatch_uid=f"catalog_delete_{_name}")
+    post_save.connect(bump_catalog_version, sender=_model, dispatch_uid=f"catalog_version_save_{_name}")
+    post_delete.connect(bump_catalog_version, sender=_model, dispatch_uid=f"catalog_version_delete_{_name}")
+
+
+@receiver(post_save, sender=License)
+def index_license(sender, instance, **kwargs):
+    """Keep this process's entitlement index current once the license commits."""
+    transaction.on_commit(lambda: entitlement_index.apply_license(instance))
+
+
+@receiver(post_delete, sender=License)
+def unindex_license(sender, instance, **kwargs):
+    # Other workers can't see a deleted row in their incremental refresh; have them reload.
+    entitlement_index.announce_deletion()
+    transaction.on_commit(lambda: entitlement_index.discard_license(instance))
+    transaction.on_commit(entitlement_index.announce_deletion)
+
+
+def invalidate_on_change(cached):
+    """Build a save/delete receiver that invalidates a process-local cache (see app/refcache.py)."""
+    def handler(sender, **kwargs):
+        # Drop the local copy now so this request sees its own write, and bump again
+        # after commit so other workers never reload pre-commit data.
+        cached.invalidate()
+        transaction.on_commit(cached.invalidate)
+    return handler
+
+
+for _model, _cached in ((PricingTier, pricing_tiers), (Genre, genres), (AdCampaign, campaign_index)):
+    _handler = invalidate_on_change(_cached)
+    _name = _model._meta.model_name
+    post_save.connect(_handler, sender=_model, weak=False, dispatch_uid=f"snapshot_save_{_name}")
+    post_delete.connect(_handler, sender=_model, weak=False, dispatch_uid=f"snapshot_delete_{_name}")
+
+
+# Facet indexes read genre/artist/date from albums and durations from tracks; deleting a
+# genre detaches albums without a save signal, and artist deletes cascade to albums.
+# Saves only rebuild them when a facet value moves (see count_track / count_album).
+for _model in (Genre, Album, Track):
+    for _key, _cached in (('track', facets.track_facets), ('album', facets.album_facets)):
+        post_delete.connect(
+            invalidate_on_change(_cached), sender=_model, weak=False,
+            dispatch_uid=f"facets_{_key}_{_model._meta.model_name}_delete",
+        )
+
+
+def invalidate_facets():
+    for cached in (facets.track_facets, facets.album_facets):
+        cached.invalidate()
+        transaction.on_commit(cached.invalidate)
+
+
+def invalidate_principals(sender, update_fields=None, **kwargs):
+    """Cached API token principals carry is_active and the profile role; drop them when those may change."""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    principals.invalidate()
+    transaction.on_commit(principals.invalidate)
+
+
+for _model in (User, UserProfile, ApiToken):
+    _name = _model._meta.model_name
+    post_save.connect(invalidate_principals, sender=_model, dispatch_uid=f"principals_save_{_name}")
+    post_delete.connect(invalidate_principals, sender=_model, dispatch_uid=f"principals_delete_{_name}")
+
+
+# Marks a save that can't move counters or facets (e.g. update_fields=['preview_key']); distinct from
+# None, which means the row wasn't in the database yet.
+UNAFFECTED = object()
+
+
+def _counted_row(sender, instance, fields, update_fields, columns):
+    """The row's current counter/facet-relevant columns, or UNAFFECTED if this save can't change them.
+
+    The row is locked until the save commits (AtomicSaveMixin), so concurrent saves of the
+    same row apply their deltas one after another, each from the values it replaced.
+    """
+    if instance.pk is None:
+        return None
+    if update_fields is not None and not fields & set(update_fields):
+        return UNAFFECTED
+    return sender.objects.select_for_update().filter(pk=instance.pk).values_list(*columns).first()
+
+
+@receiver(pre_save, sender=Track)
+def remember_track_counts(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        instance._counted_as = _counted_row(
+            sender, instance, counters.TRACK_FIELDS | facets.TRACK_FIELDS, update_fields, ('album_id', 'duration_seconds')
+        )
+
+
+@receiver(post_save, sender=Track)
+def count_track(sender, instance, created, raw=False, **kwargs):
+    """Keep album/artist counters and the facet indexes in step (see app/counters.py)."""
+    if raw:
+        # Fixture loads leave the counters to ``recount`` but can still move facet values.
+        invalidate_facets()
+        return
+    old, new = instance.__dict__.pop('_counted_as', UNAFFECTED), (instance.album_id, instance.duration_seconds)
+    if created:
+        counters.add_track(*new)
+    elif old not in (None, UNAFFECTED) and old != new:
+        counters.add_track(*old, sign=-1)
+        counters.add_track(*new)
+    else:
+        return
+    invalidate_facets()
+
+
+@receiver(post_delete, sender=Track)
+def uncount_track(sender, instance, **kwargs):
+    counters.add_track(instance.album_id, instance.duration_seconds, sign=-1)
+
+
+@receiver(pre_save, sender=Album)
+def remember_album_counts(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        instance._counted_as = _counted_row(
+            sender, instance, counters.ALBUM_FIELDS | facets.ALBUM_FIELDS, update_fields,
+            ('artist_id', 'track_count', 'genre_id', 'release_date'),
+        )
+
+
+@receiver(post_save, sender=Album)
+def count_album(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        invalidate_facets()
+        return
+    old = instance.__dict__.pop('_counted_as', UNAFFECTED)
+    if created:
+        counters.add_album(instance.artist_id, 0)
+    elif old not in (None, UNAFFECTED) and old[0] != instance.artist_id:
+        counters.add_album(old[0], old[1], sign=-1)
+        counters.add_album(instance.artist_id, old[1])
+    moved = old not in (None, UNAFFECTED) and (old[0], *old[2:]) != (instance.artist_id, instance.genre_id, instance.release_date)
+    if created or moved:
+        invalidate_facets()
+
+
+@receiver(post_delete, sender=Album)
+def uncount_album(sender, instance, **kwargs):
+    # The album's tracks were deleted (and uncounted) first by the cascade.
+    counters.add_album(instance.artist_id, 0, sign=-1)
+
+
+def _release_on_commit(field, name):
+    transaction.on_commit(lambda: field.storage.delete(name))
+
+
+def _media_fields(model):
+    return [model._meta.get_field(name) for m, name in MEDIA_FIELDS if m is model]
+
+
+def release_media(sender, instance, **kwargs):
+    """Drop the deleted row's references to shared media blobs (see app/storage.py)."""
+    for field in _media_fields(sender):
+        if getattr(instance, field.attname):
+            _release_on_commit(field, getattr(instance, field.attname).name)
+
+
+def release_replaced_media(sender, instance, raw=False, **kwargs):
+    """When a new upload replaces a file, drop the reference to the old one.
+
+    Only fields holding a not-yet-saved upload are checked, so ordinary saves cost
+    no extra query. Clearing a field keeps the old reference until ``dedupe_media`` recounts.
+    """
+    if raw or instance.pk is None:
+        return
+    replaced = [
+        field for field in _media_fields(sender)
+        if getattr(instance, field.attname) and not getattr(instance, field.attname)._committed
+    ]
+    if not replaced:
+        return
+    old = sender.objects.filter(pk=instance.pk).values(*[f.attname for f in replaced]).first() or {}
+    for field in replaced:
+        if old.get(field.attname):
+            _release_on_commit(field, old[field.attname])
+
+
+for _model in {model for model, _ in MEDIA_FIELDS}:
+    _name = _model._meta.model_name
+    pre_save.connect(release_replaced_media, sender=_model, dispatch_uid=f"media_replace_{_name}")
+    post_delete.connect(release_media, sender=_model, dispatch_uid=f"media_release_{_name}")
+
+
+FEATURE_FIELDS = ('loudness_db', 'peak_db', 'bpm', 'analyzed_at')
+
+
+@receiver(pre_save, sender=Track)
+def reset_replaced_features(sender, instance, raw=False, update_fields=None, **kwargs):
+    """A new master upload invalidates its audio features, so ``analyze_tracks`` picks the track up again."""
+    if raw or instance.pk is None or not instance.audio_file or instance.audio_file._committed:
+        return
+    for name in FEATURE_FIELDS:
+        setattr(instance, name, None)
+    if update_fields is not None and not set(FEATURE_FIELDS) <= set(update_fields):
+        # The save won't write the reset columns itself.
+        Track.objects.filter(pk=instance.pk).update(**dict.fromkeys(FEATURE_FIELDS))
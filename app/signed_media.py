@@ -0,0 +1,72 @@
+"""
+HMAC-signed, expiring media URLs.
+
+Serializers hand out ``/media-signed/<name>?exp=<unix time>&sig=<hmac>`` for
+protected files (track audio, ad video). The verification view only checks the
+signature and replies with an empty response carrying ``X-Accel-Redirect``
+(nginx) or ``X-Sendfile`` (Apache/lighttpd), so the front proxy streams the
+bytes and no Django worker is tied up. ``app/sendfile_proxy.py`` emulates that
+proxy for local development.
+
+Expiry times are rounded up to EXPIRY_GRANULARITY, so a file's URL stays the
+same for a few minutes and API responses and clients can cache it.
+"""
+import hashlib
+import hmac
+import math
+import mimetypes
+import os
+import time
+from pathlib import PurePosixPath
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.urls import reverse
+
+# Top-level media directories that are only reachable through signed URLs
+PROTECTED_DIRS = ('tracks', 'ads')
+EXPIRY_GRANULARITY = 300
+
+
+def _signature(name: str, expires: int) -> str:
+    message = f"{name}\n{expires}".encode()
+    return hmac.new(settings.MEDIA_SIGNING_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def sign(name: str, now=None):
+    """Return (expires, signature) for a storage name."""
+    now = time.time() if now is None else now
+    expires = math.ceil((now + settings.MEDIA_URL_TTL_SECONDS) / EXPIRY_GRANULARITY) * EXPIRY_GRANULARITY
+    return expires, _signature(name, expires)
+
+
+def signed_url(name: str, request=None) -> str:
+    expires, sig = sign(name)
+    url = f"{reverse('signed_media', args=[name])}?{urlencode({'exp': expires, 'sig': sig})}"
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def is_protected(name: str) -> bool:
+    parts = PurePosixPath(name).parts
+    return len(parts) > 1 and parts[0] in PROTECTED_DIRS and '..' not in parts
+
+
+def verify(name: str, expires, sig, now=None) -> bool:
+    """True if ``sig`` is valid for ``name`` and ``expires`` hasn't passed."""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < (time.time() if now is None else now) or not is_protected(name):
+        return False
+    return hmac.compare_digest(_signature(name, expires), str(sig or ''))
+
+
+def offload_headers(name: str) -> dict:
+    """Headers telling the front proxy which file to send."""
+    headers = {"Content-Type": mimetypes.guess_type(name)[0] or 'application/octet-stream'}
+    if settings.MEDIA_SENDFILE_HEADER == 'X-Sendfile':
+        headers['X-Sendfile'] = os.path.join(settings.MEDIA_ROOT, name)
+    else:
+        headers['X-Accel-Redirect'] = f"{settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{name}"
+    return headers
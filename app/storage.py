@@ -0,0 +1,305 @@
+"""
+Content-addressed media storage.
+
+Uploads under the deduplicated directories (artists, albums, tracks, ads) are
+hashed with SHA-256 while they are streamed to a temporary file, then stored
+once as ``<subdir>/<d[:2]>/<d[2:4]>/<digest><ext>``; an upload whose bytes already exist just
+adds a reference. MediaBlob keeps a reference count per stored name and
+``delete()`` only removes the file when the last reference goes away. Model
+rows release their references through signals (see app/signals.py).
+
+Other paths (e.g. contracts/) behave exactly like FileSystemStorage.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import MediaBlob, JobCheckpoint, Artist, Album, Track, AdCampaign, shard_path
+from .refcache import catalog_changed
+
+DEDUPE_DIRS = ('artists', 'albums', 'tracks', 'ads')
+# FileFields whose files live in DEDUPE_DIRS
+MEDIA_FIELDS = (
+    (Artist, 'image'), (Album, 'cover_image'), (Track, 'audio_file'), (Track, 'preview_file'), (AdCampaign, 'video'),
+)
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(fileobj, chunk_size=CHUNK_SIZE) -> str:
+    """SHA-256 of a file object, read in chunks."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def count_references(name) -> int:
+    """How many FileField values currently point at ``name``."""
+    return sum(model.objects.filter(**{field: name}).count() for model, field in MEDIA_FIELDS)
+
+
+def blob_name(subdir: str, digest: str, ext: str) -> str:
+    return shard_path(subdir, digest, f"{digest}{ext.lower()}")
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, dedupe_dirs=DEDUPE_DIRS, **kwargs):
+        super().__init__(**kwargs)
+        self.dedupe_dirs = tuple(dedupe_dirs)
+
+    def is_deduplicated(self, name) -> bool:
+        parts = PurePosixPath(name.replace('\\', '/')).parts
+        return len(parts) > 1 and parts[0] in self.dedupe_dirs
+
+    def _save(self, name, content):
+        if not self.is_deduplicated(name):
+            return super()._save(name, content)
+        name = name.replace('\\', '/')
+        subdir, ext = PurePosixPath(name).parts[0], PurePosixPath(name).suffix
+
+        # Stream to a temp file on the same filesystem, hashing as we go, so the
+        # final placement is a rename and the upload is read exactly once.
+        incoming = os.path.join(self.location, '.incoming')
+        os.makedirs(incoming, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            final = blob_name(subdir, digest.hexdigest(), ext)
+            self.add_reference(final, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return final
+
+    def add_reference(self, name, source_path=None):
+        """Count one more reference to ``name``, moving ``source_path`` into place if it isn't stored yet."""
+        path = self.path(name)
+        with transaction.atomic():
+            blob, _ = MediaBlob.objects.select_for_update().get_or_create(name=name)
+            if not os.path.exists(path):
+                if source_path is None:
+                    raise FileNotFoundError(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(source_path, path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+            MediaBlob.objects.filter(pk=blob.pk).update(refs=F('refs') + 1, size=os.path.getsize(path))
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is chosen from the content in _save().
+        if self.is_deduplicated(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def delete(self, name):
+        """Drop one reference; the file is removed with its last reference."""
+        if not name or not self.is_deduplicated(name):
+            return super().delete(name)
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.refs > 1:
+                MediaBlob.objects.filter(pk=blob.pk).update(refs=F('refs') - 1)
+                return
+            # Last counted reference: confirm against the rows themselves before unlinking,
+            # in case a name was copied between rows without going through save().
+            remaining = count_references(name)
+            if remaining:
+                MediaBlob.objects.update_or_create(name=name, defaults={"refs": remaining})
+                return
+            if blob is not None:
+                blob.delete()
+            super().delete(name)
+
+
+def recount(storage=None) -> int:
+    """Rebuild MediaBlob from the FileField values that point into DEDUPE_DIRS."""
+    storage = storage or default_storage
+    refs = {}
+    for model, field in MEDIA_FIELDS:
+        for row in model.objects.exclude(**{field: ''}).exclude(**{f"{field}__isnull": True}).values(field).annotate(n=Count('pk')):
+            refs[row[field]] = refs.get(row[field], 0) + row['n']
+    blobs = [
+        MediaBlob(name=name, refs=n, size=storage.size(name) if storage.exists(name) else 0)
+        for name, n in refs.items() if storage.is_deduplicated(name)
+    ]
+    with transaction.atomic():
+        MediaBlob.objects.all().delete()
+        MediaBlob.objects.bulk_create(blobs, batch_size=2000)
+    return len(blobs)
+
+
+def dedupe(storage=None, dry_run=False, log=None) -> dict:
+    """Move files under DEDUPE_DIRS to their content address, dropping duplicate copies.
+
+    Each file is hashed in a streaming pass. Its canonical copy is hard-linked into
+    place, rows are repointed, and only then is the old name unlinked, so readers
+    always find the file under either name. References are recounted at the end.
+    """
+    storage = storage or default_storage
+    log = log or (lambda message: None)
+    stats = {"files": 0, "moved": 0, "duplicates": 0, "bytes_reclaimed": 0}
+    seen = set()
+    for subdir in DEDUPE_DIRS:
+        root = Path(storage.path(subdir))
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                stats["files"] += 1
+                name = path.relative_to(storage.location).as_posix()
+                with open(path, 'rb') as fh:
+                    target = blob_name(subdir, file_digest(fh), path.suffix)
+                if target == name:
+                    seen.add(target)
+                    continue
+                target_path = Path(storage.path(target))
+                duplicate = target in seen or target_path.exists()
+                seen.add(target)
+                if duplicate:
+                    stats["duplicates"] += 1
+                    stats["bytes_reclaimed"] += path.stat().st_size
+                else:
+                    stats["moved"] += 1
+                if dry_run:
+                    continue
+                if not duplicate:
+                    target_path.parent.mkdir(parents=True, exist_ok=True)
+                    try:
+                        os.link(path, target_path)
+                    except OSError:
+                        shutil.copy2(path, target_path)
+                for model, field in MEDIA_FIELDS:
+                    model.objects.filter(**{field: name}).update(**{field: target})
+                # Cached responses may carry signed links to the name about to be unlinked.
+                catalog_changed()
+                path.unlink()
+                log(f"{name} -> {target}{' (duplicate)' if duplicate else ''}")
+    if not dry_run:
+        stats["blobs"] = recount(storage)
+    return stats
+
+
+def sharded_name(name: str) -> str:
+    """Where a flat ``subdir/file`` name lives in the fan-out layout; other names are returned unchanged.
+
+    UUID and digest names shard on their own hex characters, anything else on a hash of the file name.
+    """
+    path = PurePosixPath(name)
+    if len(path.parts) != 2:
+        return name
+    stem = path.stem.replace('-', '')
+    key = stem.lower() if re.fullmatch(r'[0-9a-fA-F]{4,}', stem) else hashlib.sha256(path.name.encode()).hexdigest()
+    return shard_path(path.parts[0], key, path.name)
+
+
+def _link_into_place(storage, old, new) -> bool:
+    """Make ``new`` an additional name for ``old``'s file; False if neither exists."""
+    new_path = Path(storage.path(new))
+    if new_path.exists():
+        return True
+    old_path = Path(storage.path(old))
+    if not old_path.exists():
+        return False
+    new_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(old_path, new_path)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(old_path, new_path)
+    return True
+
+
+def rebalance(storage=None, chunk_size=1000, workers=8, restart=False, log=None) -> dict:
+    """Move flat media files into the sharded layout, one chunk of rows at a time.
+
+    Per chunk: hard-link every file under its new name (in a thread pool), then
+    repoint rows, rename MediaBlob entries and advance a JobCheckpoint in one
+    transaction, and finally unlink old names that no row references any more.
+    Rows are locked and re-read before they are repointed, so a file uploaded
+    while the chunk was being linked is left alone. Readers find each file under
+    its old or new name throughout, and an interrupted run resumes from the checkpoint.
+    """
+    storage = storage or default_storage
+    log = log or (lambda message: None)
+    stats = {"rows": 0, "moved": 0, "missing": 0}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for model, field in MEDIA_FIELDS:
+            checkpoint, _ = JobCheckpoint.objects.get_or_create(name=f"rebalance_media.{model._meta.model_name}.{field}")
+            if restart:
+                checkpoint.position = 0
+            while True:
+                rows = list(
+                    model.objects.filter(pk__gt=checkpoint.position).order_by('pk')
+                    .values_list('pk', field)[:chunk_size]
+                )
+                if not rows:
+                    break
+                moves = {name: sharded_name(name) for _, name in rows if name and sharded_name(name) != name}
+                placed = dict(zip(moves, pool.map(lambda item: _link_into_place(storage, *item), moves.items())))
+                planned = {}
+                for pk, name in rows:
+                    if name in moves and placed[name]:
+                        planned[pk] = name
+                    elif name in moves:
+                        stats["missing"] += 1
+                with transaction.atomic():
+                    # Only repoint rows still holding the name we linked; a concurrent upload keeps its own.
+                    current = model.objects.select_for_update().filter(pk__in=list(planned)).values_list('pk', field)
+                    updates = []
+                    for pk, name in current:
+                        if planned[pk] == name:
+                            obj = model(pk=pk)
+                            setattr(obj, field, moves[name])
+                            updates.append(obj)
+                    model.objects.bulk_update(updates, [field], batch_size=chunk_size)
+                    if updates:
+                        # Cached responses may carry signed links to names unlinked below.
+                        catalog_changed()
+                    done = {planned[obj.pk] for obj in updates}
+                    blobs = list(MediaBlob.objects.filter(name__in=list(done)))
+                    # The sharded name may already be stored (same content re-uploaded after
+                    # sharding); fold the flat blob's references into that row.
+                    existing = {
+                        b.name: b for b in MediaBlob.objects.select_for_update()
+                        .filter(name__in=[moves[b.name] for b in blobs])
+                    }
+                    renamed, merged = [], []
+                    for blob in blobs:
+                        target = existing.get(moves[blob.name])
+                        if target is None:
+                            blob.name = moves[blob.name]
+                            renamed.append(blob)
+                        else:
+                            target.refs += blob.refs
+                            merged.append(blob.pk)
+                    MediaBlob.objects.filter(pk__in=merged).delete()
+                    MediaBlob.objects.bulk_update(renamed, ['name'])
+                    MediaBlob.objects.bulk_update(list(existing.values()), ['refs'])
+                    checkpoint.position = rows[-1][0]
+                    checkpoint.save()
+
+                # Old names still used by rows not yet visited keep their file until those move too.
+                for other_model, other_field in MEDIA_FIELDS:
+                    done -= set(other_model.objects.filter(**{f"{other_field}__in": list(done)}).values_list(other_field, flat=True))
+                for name in done:
+                    Path(storage.path(name)).unlink(missing_ok=True)
+                stats["rows"] += len(rows)
+                stats["moved"] += len(updates)
+                log(f"{model._meta.model_name}.{field}: up to #{checkpoint.position}, {len(updates)} moved")
+    return stats
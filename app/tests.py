@@ -1,14 +1,43 @@
-from datetime import date
+import hashlib
+import io
+import json
+import tempfile
+import wave
+from pathlib import Path
+from datetime import date, timedelta
+from unittest import mock
+
+import numpy as np
+from django.contrib import admin as django_admin
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db import IntegrityError
-from django.test import TestCase
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
+from . import (
+    audio_features, authentication, contracts, counters, facets, payments, previews, profiling, recommendations,
+    signed_media, storage, throttling,
+)
+from .admin import ScaleModeAdmin
+from .adserving import CampaignIntervalIndex
+from .api import GenreViewSet
+from .entitlements import EntitlementIndex, entitlement_index
+from .refcache import genres, pricing_tiers
+from .sendfile_proxy import SendfileProxy
+from .serializers import CartItemSerializer
 from .models import (
-    Genre, Artist, Album, Track, PricingTier,
-    Cart, CartItem, Order, License, UserProfile,
+    Genre, Artist, Album, Track, PricingTier, AdCampaign,
+    Cart, CartItem, Order, License, UserProfile, add_months, TrackPairCount, RevenueRollup, IdempotencyKey,
+    OrderContract, Payment, WebhookEvent, MediaBlob, ApiToken,
 )
 
 
@@ -21,6 +50,19 @@ def create_sample_track():
     return track
 
 
+class TempMediaMixin:
+    """Give each test a fresh temporary directory as MEDIA_ROOT (or ``temp_dir_setting``), removed afterwards."""
+    temp_dir_setting = "MEDIA_ROOT"
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(**{self.temp_dir_setting: self.media.name})
+        override.enable()
+        self.addCleanup(override.disable)
+
+
 def create_pricing_tier(name="Standard", months=12, price=999):
     return PricingTier.objects.create(name=name, duration_months=months, price_cents=price)
 
@@ -174,3 +216,1170 @@ class ModelConstraintsTests(TestCase):
         CartItem.objects.create(cart=self.cart, track=self.track, tier=self.tier, quantity=1)
         with self.assertRaises(IntegrityError):
             CartItem.objects.create(cart=self.cart, track=self.track, tier=self.tier, quantity=2)
+
+
+class CatalogChangesTests(APITestCase):
+    def test_initial_sync_then_delta(self):
+        track = create_sample_track()
+        resp = self.client.get("/api/catalog/changes/", {"since": 0})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        models_seen = {c["model"] for c in resp.data["changes"]}
+        self.assertTrue({"genre", "artist", "album", "track"} <= models_seen)
+        token = resp.data["next"]
+
+        # Nothing changed since the token
+        resp = self.client.get("/api/catalog/changes/", {"since": token})
+        self.assertEqual(resp.data["changes"], [])
+        self.assertEqual(resp.data["next"], token)
+
+        # Two edits collapse into one upsert; deletes produce tombstones
+        track.title = "Renamed"
+        track.save()
+        track.title = "Renamed Again"
+        track.save()
+        resp = self.client.get("/api/catalog/changes/", {"since": token})
+        self.assertEqual(len(resp.data["changes"]), 1)
+        self.assertEqual(resp.data["changes"][0]["data"]["title"], "Renamed Again")
+
+        token = resp.data["next"]
+        track_id = track.id
+        track.delete()
+        resp = self.client.get("/api/catalog/changes/", {"since": token})
+        changes = {(c["model"], c["op"]): c for c in resp.data["changes"]}
+        self.assertEqual(changes[("track", "delete")], {"seq": changes[("track", "delete")]["seq"], "model": "track", "id": track_id, "op": "delete"})
+        # The album and artist counters changed with it
+        self.assertEqual(set(changes), {("track", "delete"), ("album", "upsert"), ("artist", "upsert")})
+        self.assertEqual(changes[("album", "upsert")]["data"]["track_count"], 0)
+
+    def test_bounded_batches(self):
+        for i in range(5):
+            Genre.objects.create(name=f"G{i}")
+        resp = self.client.get("/api/catalog/changes/", {"since": 0, "limit": 2})
+        self.assertEqual(len(resp.data["changes"]), 2)
+        self.assertTrue(resp.data["has_more"])
+        self.assertEqual(self.client.get("/api/catalog/changes/", {"since": "abc"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class EntitlementTests(APITestCase):
+    def setUp(self):
+        entitlement_index.reset()
+        self.user = User.objects.create_user(username="player", password="pass1234")
+        self.client.login(username="player", password="pass1234")
+        self.track = create_sample_track()
+        self.tier = create_pricing_tier()
+
+    def test_check_active_expired_and_missing(self):
+        resp = self.client.get("/api/entitlements/check/", {"track_id": self.track.id})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertFalse(resp.data["entitled"])
+
+        lic = License.objects.create(
+            buyer=self.user, track=self.track, tier=self.tier,
+            status=License.Status.ACTIVE, ends_at=date.today() + timedelta(days=30),
+        )
+        # Negative answers are cached until the next refresh
+        entitlement_index.refresh(force=True)
+        resp = self.client.get("/api/entitlements/check/", {"track_id": self.track.id})
+        self.assertTrue(resp.data["entitled"])
+        self.assertEqual(resp.data["ends_at"], lic.ends_at)
+
+        lic.ends_at = date.today() - timedelta(days=1)
+        lic.save()
+        entitlement_index.refresh(force=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(entitlement_index.check(self.user.id, self.track.id), (False, None))
+
+    def test_batch_uses_db_fallback_once(self):
+        License.objects.create(buyer=self.user, track=self.track, tier=self.tier, status=License.Status.ACTIVE)
+        entitlement_index.refresh(force=True)
+        resp = self.client.post("/api/entitlements/batch/", {"track_ids": [self.track.id, 999999]}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([r["entitled"] for r in resp.data["results"]], [True, False])
+        with self.assertNumQueries(0):
+            entitlement_index.check_many(self.user.id, [self.track.id, 999999])
+
+
+    def test_deletes_reach_other_workers(self):
+        License.objects.create(buyer=self.user, track=self.track, tier=self.tier, status=License.Status.ACTIVE)
+        other_worker = EntitlementIndex()
+        self.assertEqual(other_worker.check(self.user.id, self.track.id), (True, None))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.track.delete()  # cascades to the license
+        other_worker.refresh(force=True)
+        self.assertEqual(other_worker.check(self.user.id, self.track.id), (False, None))
+
+
+class LicenseExpiryTests(APITestCase):
+    def setUp(self):
+        self.buyer = User.objects.create_user(username="exp", password="pass1234")
+        self.track = create_sample_track()
+        self.tier = create_pricing_tier(months=6)
+
+    def test_add_months_clamps_day(self):
+        self.assertEqual(add_months(date(2025, 1, 31), 1), date(2025, 2, 28))
+        self.assertEqual(add_months(date(2024, 11, 15), 14), date(2026, 1, 15))
+        self.assertEqual(self.tier.term_end(date(2025, 1, 1)), date(2025, 6, 30))
+
+    def test_approval_sets_ends_at(self):
+        legal = User.objects.create_user(username="legal3", password="pass1234")
+        legal.profile.role = "legal"
+        legal.profile.save()
+        order = Order.objects.create(user=self.buyer)
+        order.items.create(track=self.track, tier=self.tier, price_cents_snapshot=999)
+        self.client.login(username="legal3", password="pass1234")
+        resp = self.client.post(f"/api/orders/{order.id}/approve/", {}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        lic = License.objects.get(buyer=self.buyer)
+        self.assertEqual(lic.ends_at, self.tier.term_end(timezone.localdate()))
+
+    def test_expire_licenses_command(self):
+        today = date(2025, 6, 1)
+        make = lambda ends_at, st=License.Status.ACTIVE: License.objects.create(
+            buyer=self.buyer, track=self.track, tier=self.tier, status=st, ends_at=ends_at)
+        past = [make(date(2025, 5, d)) for d in (1, 2, 3)]
+        current = make(today)
+        perpetual = make(None)
+        revoked = make(date(2025, 1, 1), License.Status.REVOKED)
+
+        call_command("expire_licenses", "--chunk-size", "2", "--today", today.isoformat(), stdout=io.StringIO())
+        for lic in past:
+            lic.refresh_from_db()
+            self.assertEqual(lic.status, License.Status.EXPIRED)
+        for lic in (current, perpetual):
+            lic.refresh_from_db()
+            self.assertEqual(lic.status, License.Status.ACTIVE)
+        revoked.refresh_from_db()
+        self.assertEqual(revoked.status, License.Status.REVOKED)
+
+
+class ReferenceCacheTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="refs", password="pass1234")
+        self.track = create_sample_track()
+        self.tiers = [create_pricing_tier(name=f"T{i}") for i in range(3)]
+        self.cart = Cart.objects.create(user=self.user)
+        for tier in self.tiers:
+            CartItem.objects.create(cart=self.cart, track=self.track, tier=tier)
+
+    def test_tiers_resolved_from_memory(self):
+        pricing_tiers.get(self.tiers[0].id)  # warm both reference tables
+        genres.get(self.track.album.genre_id)
+        items = list(self.cart.items.select_related("track__album__artist"))
+        with self.assertNumQueries(0):
+            data = CartItemSerializer(items, many=True).data
+        self.assertEqual([d["tier"]["name"] for d in data], ["T0", "T1", "T2"])
+
+        serializer = CartItemSerializer(data={"track_id": self.track.id, "tier_id": self.tiers[1].id})
+        with self.assertNumQueries(1):  # the track lookup only
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data["tier"].name, "T1")
+
+    def test_save_invalidates(self):
+        self.assertEqual(pricing_tiers.representation(self.tiers[0].id)["name"], "T0")
+        self.tiers[0].name = "Renamed"
+        self.tiers[0].save()
+        self.assertEqual(pricing_tiers.representation(self.tiers[0].id)["name"], "Renamed")
+        serializer = CartItemSerializer(data={"track_id": self.track.id, "tier_id": 987654})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("tier_id", serializer.errors)
+
+
+class AdSelectionTests(APITestCase):
+    def setUp(self):
+        self.always = AdCampaign.objects.create(name="Always", weight=1)
+        self.june = AdCampaign.objects.create(name="June", starts_at=date(2025, 6, 1), ends_at=date(2025, 6, 30), weight=3)
+        self.from_mid_june = AdCampaign.objects.create(name="Mid June on", starts_at=date(2025, 6, 15))
+        self.paused = AdCampaign.objects.create(name="Paused", weight=0)
+
+    def test_interval_index(self):
+        index = CampaignIntervalIndex(AdCampaign.objects.all())
+        names = lambda day: [c.name for c in index.live(day)]
+        self.assertEqual(names(date(2025, 5, 31)), ["Always"])
+        self.assertEqual(names(date(2025, 6, 1)), ["Always", "June"])
+        self.assertEqual(names(date(2025, 6, 30)), ["Always", "June", "Mid June on"])
+        self.assertEqual(names(date(2025, 7, 1)), ["Always", "Mid June on"])
+
+        class FixedRng:
+            def __init__(self, value):
+                self.value = value
+
+            def random(self):
+                return self.value
+
+        # Cumulative weights on June 10th: Always=1, June=4
+        self.assertEqual(index.choose(date(2025, 6, 10), FixedRng(0.2)), self.always)
+        self.assertEqual(index.choose(date(2025, 6, 10), FixedRng(0.3)), self.june)
+
+    def test_endpoints_serve_from_memory(self):
+        resp = self.client.get("/api/ads/live/", {"at": "2025-06-20T12:00:00Z"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([c["name"] for c in resp.data], ["Always", "June", "Mid June on"])
+        with self.assertNumQueries(0):
+            resp = self.client.get("/api/ads/select/", {"at": "2025-06-20"})
+        self.assertIn(resp.data["name"], {"Always", "June", "Mid June on"})
+
+        # Saving a campaign rebuilds the index
+        self.always.ends_at = date(2025, 1, 1)
+        self.always.save()
+        resp = self.client.get("/api/ads/live/", {"at": "2025-06-20"})
+        self.assertEqual([c["name"] for c in resp.data], ["June", "Mid June on"])
+        self.assertEqual(self.client.get("/api/ads/live/", {"at": "soon"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AdminScaleModeTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="root", password="pass1234", email="root@example.com")
+        self.client.login(username="root", password="pass1234")
+        self.track = create_sample_track()
+        self.tier = create_pricing_tier()
+
+    def _changelist_queries(self, path):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(path)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        License.objects.create(buyer=self.admin, track=self.track, tier=self.tier)
+        one = self._changelist_queries("/admin/app/license/")
+        for _ in range(5):
+            License.objects.create(buyer=self.admin, track=self.track, tier=self.tier)
+        self.assertEqual(self._changelist_queries("/admin/app/license/"), one)
+
+    def test_indexed_search(self):
+        lic = License.objects.create(buyer=self.admin, track=self.track, tier=self.tier)
+        resp = self.client.get("/admin/app/license/", {"q": "Test Tr"})
+        self.assertContains(resp, f"License[{lic.id}]")
+        resp = self.client.get("/admin/app/license/", {"q": str(lic.id)})
+        self.assertContains(resp, f"License[{lic.id}]")
+        resp = self.client.get("/admin/app/license/", {"q": "nobody"})
+        self.assertNotContains(resp, f"License[{lic.id}]")
+
+    def test_default_indexed_search_uses_first_search_field(self):
+        class TrackScaleAdmin(ScaleModeAdmin):
+            search_fields = ("^title", "album__title")
+
+        model_admin = TrackScaleAdmin(Track, django_admin.site)
+        found, _ = model_admin.get_search_results(None, Track.objects.all(), "test tr")
+        self.assertEqual(list(found), [self.track])
+        found, _ = model_admin.get_search_results(None, Track.objects.all(), "Album")
+        self.assertFalse(found.exists())
+
+
+class RecommendationTests(APITestCase):
+    def setUp(self):
+        first = create_sample_track()
+        self.tracks = [first] + [
+            Track.objects.create(title=f"T{i}", album=first.album, audio_file=first.audio_file.name) for i in range(2)
+        ]
+        self.tier = create_pricing_tier()
+        self.buyers = [User.objects.create_user(username=f"rb{i}") for i in range(3)]
+
+    def _license(self, buyer, *track_indexes):
+        for i in track_indexes:
+            License.objects.create(buyer=self.buyers[buyer], track=self.tracks[i], tier=self.tier)
+
+    def _pairs(self):
+        return set(TrackPairCount.objects.values_list("track_a_id", "track_b_id", "buyers"))
+
+    def test_incremental_matches_full_rebuild(self):
+        t0, t1, t2 = self.tracks
+        self._license(0, 0, 1)
+        self._license(1, 0, 1, 2)
+        self._license(2, 0)
+        recommendations.build(chunk_size=2)
+        self._license(2, 2, 0)  # re-licensing t0 must not double count
+        stats = recommendations.build(chunk_size=2)
+        self.assertEqual(stats["licenses"], 2)
+        incremental = self._pairs()
+
+        recommendations.build(full=True)
+        self.assertEqual(self._pairs(), incremental)
+        self.assertIn((t0.id, t0.id, 3), incremental)
+        self.assertIn((t0.id, t2.id, 2), incremental)
+        self.assertIn((t1.id, t2.id, 1), incremental)
+
+        resp = self.client.get(f"/api/tracks/{t1.id}/related/")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        # t1 buyers {0,1}: with t0 {0,1,2} -> 2/sqrt(6); with t2 {1,2} -> 1/2
+        self.assertEqual([r["track"]["id"] for r in resp.data], [t0.id, t2.id])
+        self.assertAlmostEqual(resp.data[0]["score"], 2 / 6 ** 0.5)
+
+
+class RevenueRollupTests(APITestCase):
+    def setUp(self):
+        self.track = create_sample_track()
+        self.tier = create_pricing_tier(price=500)
+        self.buyer = User.objects.create_user(username="rev-buyer")
+        self.legal = User.objects.create_user(username="rev-legal", password="pass1234")
+        self.legal.profile.role = "legal"
+        self.legal.profile.save()
+        self.staff = User.objects.create_user(username="finance", password="pass1234", is_staff=True)
+
+    def _order(self, quantity):
+        order = Order.objects.create(user=self.buyer)
+        order.items.create(track=self.track, tier=self.tier, price_cents_snapshot=500, quantity=quantity)
+        return order
+
+    def _rows(self):
+        return sorted(RevenueRollup.objects.values_list("status", "lines", "quantity", "revenue_cents"))
+
+    def test_review_updates_rollups_and_rebuild_matches(self):
+        self.client.login(username="rev-legal", password="pass1234")
+        for order in (self._order(1), self._order(2)):
+            self.client.post(f"/api/orders/{order.id}/approve/", {}, format="json")
+        self.client.post(f"/api/orders/{self._order(4).id}/reject/", {}, format="json")
+        self._order(8)  # still pending: not counted
+        self.assertEqual(
+            [(s, sum(l for st, l, q, r in self._rows() if st == s)) for s in ("approved", "rejected")],
+            [("approved", 2), ("rejected", 1)],
+        )
+        before = self._rows()
+        call_command("rebuild_rollups", "--chunk-size", "1", stdout=io.StringIO())
+        self.assertEqual(self._rows(), [("approved", 2, 3, 1500), ("rejected", 1, 4, 2000)])
+        self.assertEqual(sum(r[3] for r in before), 3500)
+
+        self.client.login(username="finance", password="pass1234")
+        today = timezone.now().date().isoformat()
+        resp = self.client.get("/api/reports/revenue/", {"start": today, "end": today, "group_by": "tier,artist"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data["results"], [
+            {"tier_id": self.tier.id, "artist_id": self.track.album.artist_id, "lines": 2, "quantity": 3, "revenue_cents": 1500},
+        ])
+        self.assertEqual(self.client.get("/api/reports/revenue/", {"group_by": "buyer"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/reports/revenue/", {"start": "yesterday"}).status_code, 400)
+
+
+class ReviewQueueTests(APITestCase):
+    def setUp(self):
+        track = create_sample_track()
+        tier = create_pricing_tier()
+        buyer = User.objects.create_user(username="qbuyer")
+        self.orders = []
+        for _ in range(5):
+            order = Order.objects.create(user=buyer)
+            order.items.create(track=track, tier=tier, price_cents_snapshot=999)
+            self.orders.append(order)
+        self.reviewers = []
+        for name in ("rev1", "rev2"):
+            user = User.objects.create_user(username=name, password="pass1234")
+            user.profile.role = "legal"
+            user.profile.save()
+            self.reviewers.append(user)
+
+    def test_keyset_pagination(self):
+        self.client.login(username="rev1", password="pass1234")
+        genres.get(0), pricing_tiers.get(0)  # warm the reference caches
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"after": cursor} if cursor else {})}
+            with self.assertNumQueries(5):  # session, user, profile, orders, prefetched items
+                resp = self.client.get("/api/orders/pending_review/", params)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            seen += [o["id"] for o in resp.data["results"]]
+            cursor = resp.data["next"]
+            if not cursor:
+                break
+        self.assertEqual(seen, [o.id for o in self.orders])
+        self.assertEqual(self.client.get("/api/orders/pending_review/", {"after": "garbage"}).status_code, 400)
+        for limit in ("0", "-1"):
+            self.assertEqual(self.client.get("/api/orders/pending_review/", {"limit": limit}).status_code, 400)
+
+    def test_claims_are_exclusive(self):
+        self.client.login(username="rev1", password="pass1234")
+        first = [o["id"] for o in self.client.post("/api/orders/claim/", {"limit": 3}, format="json").data]
+        self.assertEqual(first, [o.id for o in self.orders[:3]])
+        self.client.login(username="rev2", password="pass1234")
+        second = [o["id"] for o in self.client.post("/api/orders/claim/", {"limit": 3}, format="json").data]
+        self.assertEqual(second, [o.id for o in self.orders[3:]])
+
+        # rev2 cannot review rev1's claimed order until it is released
+        resp = self.client.post(f"/api/orders/{first[0]}/approve/", {}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.client.login(username="rev1", password="pass1234")
+        self.assertEqual(self.client.post(f"/api/orders/{first[0]}/release/").status_code, status.HTTP_200_OK)
+        self.client.login(username="rev2", password="pass1234")
+        resp = self.client.post(f"/api/orders/{first[0]}/approve/", {}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIsNone(resp.data["claimed_by"])
+
+
+class IdempotencyTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="retry", password="pass1234")
+        self.client.login(username="retry", password="pass1234")
+        self.track = create_sample_track()
+        self.tier = create_pricing_tier()
+        self.client.post("/api/cart/add_item/", {"track_id": self.track.id, "tier_id": self.tier.id}, format="json")
+
+    def test_checkout_retry_replays_response(self):
+        first = self.client.post("/api/cart/checkout/", {}, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        retry = self.client.post("/api/cart/checkout/", {}, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json()["id"], first.json()["id"])
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+        # Same key, different request
+        resp = self.client.post("/api/cart/checkout/", {"note": "x"}, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual(resp.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_in_progress_duplicate_is_locked_out_and_expired_keys_purge(self):
+        # Simulate a first attempt that is still running
+        fingerprint = hashlib.sha256(json.dumps(["POST", "/api/cart/checkout/", {}], sort_keys=True).encode()).hexdigest()
+        IdempotencyKey.objects.create(
+            user=self.user, scope="cart.checkout", key="k2",
+            request_hash=fingerprint, expires_at=timezone.now() + timedelta(minutes=5),
+        )
+        resp = self.client.post("/api/cart/checkout/", {}, format="json", HTTP_IDEMPOTENCY_KEY="k2")
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(resp["Retry-After"], "1")
+        self.assertFalse(Order.objects.filter(user=self.user).exists())
+
+        # The first attempt's worker died: once the row is stale a retry runs the action
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=3))
+        resp = self.client.post("/api/cart/checkout/", {}, format="json", HTTP_IDEMPOTENCY_KEY="k2")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command("purge_idempotency_keys", "--batch-size", "1", stdout=io.StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class RateLimitTests(APITestCase):
+    def setUp(self):
+        throttling.get_store().clear()
+        throttling.GCRAThrottle.rejected_keys.clear()
+
+    def tearDown(self):
+        throttling.get_store().clear()
+        throttling.GCRAThrottle.rejected_keys.clear()
+
+    def test_gcra_burst_then_steady_rate(self):
+        store = throttling.MemoryStore()
+        results = [store.update("k", 100.0, 1.0, 3)[0] for _ in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        self.assertEqual(store.update("k", 100.0, 1.0, 3), (False, 1.0))
+        self.assertTrue(store.update("k", 101.0, 1.0, 3)[0])
+
+    def test_memory_store_is_bounded(self):
+        store = throttling.MemoryStore(max_keys=3)
+        for i in range(10):
+            store.update(f"k{i}", 100.0, 60.0, 5)
+        self.assertLessEqual(len(store._tat), 3)
+        self.assertIn("k9", store._tat)
+
+    def test_sqlite_store_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "limits.sqlite3"
+            first, second = throttling.SQLiteStore(path), throttling.SQLiteStore(path)
+            self.assertTrue(first.update("k", 100.0, 10.0, 1)[0])
+            allowed, wait = second.update("k", 101.0, 10.0, 1)
+            self.assertFalse(allowed)
+            self.assertAlmostEqual(wait, 9.0)
+
+    def test_public_endpoints_return_429_with_retry_after(self):
+        rates = {"catalog": "2/min", "service_requests": "1/hour"}
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": rates}):
+            codes = [self.client.get("/api/genres/").status_code for _ in range(3)]
+            self.assertEqual(codes, [200, 200, 429])
+            resp = self.client.get("/api/genres/")
+            self.assertEqual(int(resp["Retry-After"]), 30)
+            # Budgets are per scope and per client; only issued tokens get their own via X-Api-Key
+            self.assertEqual(self.client.get("/api/genres/", HTTP_X_API_KEY="made-up").status_code, 429)
+            _, raw = authentication.issue_token(User.objects.create_user(username="fleet"))
+            self.assertEqual(self.client.get("/api/genres/", HTTP_X_API_KEY=raw).status_code, 200)
+            payload = {"email": "a@example.com", "subject": "s", "message": "m"}
+            self.assertEqual(self.client.post("/api/service-requests/", payload).status_code, 201)
+            self.assertEqual(self.client.post("/api/service-requests/", payload).status_code, 429)
+
+    def test_unknown_api_keys_and_forwarded_ips_do_not_open_new_buckets(self):
+        rates = {"catalog": "1/min", "service_requests": "1/hour"}
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": rates}):
+            self.assertEqual(self.client.get("/api/genres/").status_code, 200)
+            self.assertEqual(self.client.get("/api/genres/", HTTP_X_FORWARDED_FOR="203.0.113.9").status_code, 429)
+
+        # Keys that can't be tokens cost no query, and a failed lookup is remembered
+        throttle = throttling.GCRAThrottle()
+        guess = authentication.TOKEN_PREFIX + "guess"
+        for key, queries in (("made-up", 0), (guess, 1), (guess, 0)):
+            request = mock.Mock(user=None, headers={"X-Api-Key": key}, META={"REMOTE_ADDR": "10.0.0.1"})
+            with self.assertNumQueries(queries):
+                self.assertEqual(throttle.get_ident_key(request), "ip:10.0.0.1")
+
+
+class ResponseEncodingTests(APITestCase):
+    def setUp(self):
+        track = create_sample_track()
+        for i in range(3):
+            Track.objects.create(title=f"Track {i}", album=track.album, audio_file=track.audio_file, duration_seconds=60)
+
+    def test_accept_negotiates_binary_formats(self):
+        import cbor2
+        import msgpack
+
+        as_json = self.client.get("/api/tracks/").json()
+        resp = self.client.get("/api/tracks/", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(resp["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(resp.content), as_json)
+        resp = self.client.get("/api/tracks/", HTTP_ACCEPT="application/cbor")
+        self.assertEqual(cbor2.loads(resp.content), as_json)
+
+        body = msgpack.packb({"email": "a@example.com", "subject": "s", "message": "m"})
+        resp = self.client.generic("POST", "/api/service-requests/", body, content_type="application/msgpack")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+
+    def test_compression_respects_threshold_and_accept_encoding(self):
+        import gzip
+
+        plain = self.client.get("/api/tracks/")
+        with override_settings(RESPONSE_COMPRESSION_MIN_BYTES=10):
+            resp = self.client.get("/api/tracks/", HTTP_ACCEPT_ENCODING="gzip, br;q=0")
+            self.assertEqual(resp["Content-Encoding"], "gzip")
+            self.assertIn("Accept-Encoding", resp["Vary"])
+            self.assertEqual(gzip.decompress(resp.content), plain.content)
+            self.assertEqual(self.client.get("/api/tracks/", HTTP_ACCEPT_ENCODING="br")["Content-Encoding"], "br")
+            # HTML gets padded gzip, never brotli (BREACH)
+            first, second = (self.client.get("/", HTTP_ACCEPT_ENCODING="br, gzip") for _ in range(2))
+            self.assertEqual((first["Content-Encoding"], second["Content-Encoding"]), ("gzip", "gzip"))
+            self.assertEqual(gzip.decompress(first.content), gzip.decompress(second.content))
+            self.assertNotEqual(first.content, second.content)
+        with override_settings(RESPONSE_COMPRESSION_MIN_BYTES=len(plain.content) + 1):
+            resp = self.client.get("/api/tracks/", HTTP_ACCEPT_ENCODING="gzip")
+            self.assertFalse(resp.has_header("Content-Encoding"))
+
+
+class ContractGenerationTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.track = create_sample_track()
+        self.tier = create_pricing_tier()
+        self.buyer = User.objects.create_user(username="cbuyer", password="pass1234")
+        legal = User.objects.create_user(username="clegal", password="pass1234")
+        legal.profile.role = "legal"
+        legal.profile.save()
+
+    def _approved_order(self, quantity=1):
+        order = Order.objects.create(user=self.buyer)
+        order.items.create(track=self.track, tier=self.tier, price_cents_snapshot=999, quantity=quantity)
+        self.client.post(f"/api/orders/{order.id}/approve/", {}, format="json")
+        return order
+
+    def test_identical_terms_share_one_rendered_document(self):
+        self.client.login(username="clegal", password="pass1234")
+        first, second, other = self._approved_order(), self._approved_order(), self._approved_order(quantity=3)
+        self.assertEqual(contracts.ContractService().get_status(first), OrderContract.Status.PENDING)
+
+        with mock.patch.object(contracts, "POOL_THRESHOLD", 1):
+            out = io.StringIO()
+            call_command("generate_contracts", "--workers", "2", stdout=out)
+        self.assertIn("Orders: 3, rendered: 2, reused: 0, failed: 0", out.getvalue())
+        rows = {c.order_id: c for c in OrderContract.objects.all()}
+        self.assertEqual(rows[first.id].document.name, rows[second.id].document.name)
+        self.assertNotEqual(rows[first.id].document.name, rows[other.id].document.name)
+        self.assertIn("Total fee: 2997 cents", rows[other.id].document.read().decode())
+
+        # A later identical order reuses the stored document
+        stats = contracts.generate([self._approved_order().id])
+        self.assertEqual((stats["rendered"], stats["reused"]), (0, 1))
+
+        self.client.login(username="cbuyer", password="pass1234")
+        resp = self.client.get(f"/api/orders/{first.id}/contract/")
+        self.assertEqual(resp.data["status"], "generated")
+        self.assertTrue(resp.data["url"].endswith(rows[first.id].document.url))
+
+    def test_only_approved_orders_get_contracts(self):
+        order = Order.objects.create(user=self.buyer)
+        with self.assertRaises(ValueError):
+            contracts.ContractService().create_for_order(order)
+
+
+class PaymentTests(APITestCase):
+    def setUp(self):
+        track = create_sample_track()
+        tier = create_pricing_tier(price=700)
+        self.buyer = User.objects.create_user(username="payer", password="pass1234")
+        self.order = Order.objects.create(user=self.buyer)
+        self.order.items.create(track=track, tier=tier, price_cents_snapshot=700, quantity=2)
+        self.provider = payments.FakePaymentProvider()
+
+    def _webhook(self, body, headers):
+        return self.client.post("/api/payments/webhook/", body, content_type="application/json",
+                                **{f"HTTP_{k.upper().replace('-', '_')}": v for k, v in headers.items()})
+
+    def test_intent_lifecycle_through_batched_webhooks(self):
+        self.client.login(username="payer", password="pass1234")
+        resp = self.client.post(f"/api/orders/{self.order.id}/payment/")
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((resp.data["amount_cents"], resp.data["status"]), (1400, "requires_confirmation"))
+        # Creating again returns the open intent
+        self.assertEqual(self.client.post(f"/api/orders/{self.order.id}/payment/").data["provider_ref"], resp.data["provider_ref"])
+        ref = resp.data["provider_ref"]
+
+        resp = self.client.post(f"/api/orders/{self.order.id}/payment/confirm/", {"payment_method": "pm_card_visa"}, format="json")
+        self.assertEqual(resp.data["status"], "processing")
+        self.assertEqual(self.client.post(f"/api/orders/{self.order.id}/payment/confirm/", {}, format="json").status_code, 409)
+
+        body, headers = self.provider.outcome_webhook(ref, event_id="evt_1")
+        for _ in range(3):  # provider retries are deduplicated by event id
+            self.assertEqual(self._webhook(body, headers).status_code, status.HTTP_202_ACCEPTED)
+        stale = json.dumps({"events": [{"id": "evt_0", "type": "payment_intent.processing", "intent": ref}]}).encode()
+        self._webhook(stale, {"X-Fake-Signature": self.provider.sign(stale)})
+        self.assertEqual(self._webhook(body, {"X-Fake-Signature": "forged"}).status_code, 400)
+        self.assertEqual(WebhookEvent.objects.count(), 2)
+        self.assertEqual(Payment.objects.get().status, Payment.Status.PROCESSING)
+
+        out = io.StringIO()
+        call_command("process_payment_webhooks", stdout=out)
+        self.assertIn("Events: 2 in 1 batch(es); applied: 1, ignored: 1", out.getvalue())
+        self.assertEqual(Payment.objects.get().status, Payment.Status.SUCCEEDED)
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_failed_payment_can_be_retried_with_new_intent(self):
+        service = payments.PaymentsService(self.provider)
+        first = service.create_intent(self.order)
+        service.confirm_intent(self.order, {"payment_method": "pm_card_declined"})
+        ref = Payment.objects.get().provider_ref
+        service.receive_webhook(*self.provider.outcome_webhook(ref, payment_method="pm_card_declined"))
+        payments.apply_pending_events()
+        self.assertEqual(Payment.objects.get().status, Payment.Status.FAILED)
+
+        second = service.create_intent(self.order)
+        self.assertNotEqual(second.client_secret, first.client_secret)
+        self.assertEqual(second.status, "requires_confirmation")
+
+
+class ContentAddressedStorageTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.album = create_sample_track().album
+
+    def _track(self, data, name="master.WAV"):
+        return Track.objects.create(title="t", album=self.album, audio_file=SimpleUploadedFile(name, data))
+
+    def test_identical_uploads_share_one_refcounted_blob(self):
+        digest = hashlib.sha256(b"same master").hexdigest()
+        first, second = self._track(b"same master"), self._track(b"same master", "copy.wav")
+        self.assertEqual(first.audio_file.name, f"tracks/{digest[:2]}/{digest[2:4]}/{digest}.wav")
+        self.assertEqual(second.audio_file.name, first.audio_file.name)
+        self.assertEqual(MediaBlob.objects.get(name=first.audio_file.name).refs, 2)
+
+        path = Path(first.audio_file.path)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(path.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(path.exists())
+        self.assertFalse(MediaBlob.objects.filter(name=first.audio_file.name).exists())
+
+    def test_dedupe_media_collapses_existing_duplicates(self):
+        legacy = Path(self.media.name) / "tracks"
+        legacy.mkdir(exist_ok=True)
+        tracks = []
+        for i in range(3):
+            (legacy / f"legacy-{i}.wav").write_bytes(b"re-uploaded master")
+            track = self._track(b"placeholder")
+            Track.objects.filter(pk=track.pk).update(audio_file=f"tracks/legacy-{i}.wav")
+            tracks.append(track)
+
+        out = io.StringIO()
+        call_command("dedupe_media", stdout=out)
+        self.assertIn("duplicates removed: 2 (36 bytes)", out.getvalue())
+        names = {t.audio_file.name for t in Track.objects.filter(pk__in=[t.pk for t in tracks])}
+        digest = hashlib.sha256(b're-uploaded master').hexdigest()
+        self.assertEqual(names, {f"tracks/{digest[:2]}/{digest[2:4]}/{digest}.wav"})
+        self.assertEqual(len([p for p in legacy.rglob("*") if p.is_file() and p.read_bytes() == b"re-uploaded master"]), 1)
+        self.assertEqual(MediaBlob.objects.get(name=names.pop()).refs, 3)
+
+    def test_rebalance_media_moves_flat_files_resumably(self):
+        flat = "tracks/0a1b2c3d-0000-4000-8000-000000000000.wav"
+        (Path(self.media.name) / "tracks").mkdir(exist_ok=True)
+        (Path(self.media.name) / flat).write_bytes(b"flat master")
+        tracks = [self._track(b"placeholder") for _ in range(2)]
+        Track.objects.filter(pk__in=[t.pk for t in tracks]).update(audio_file=flat)
+        MediaBlob.objects.create(name=flat, refs=2)
+
+        # One row per chunk: the shared file must survive until its last row has moved.
+        call_command("rebalance_media", "--chunk-size", "1", "--workers", "2", stdout=io.StringIO())
+        sharded = "tracks/0a/1b/0a1b2c3d-0000-4000-8000-000000000000.wav"
+        self.assertEqual({t.audio_file.name for t in Track.objects.filter(pk__in=[t.pk for t in tracks])}, {sharded})
+        self.assertEqual((Path(self.media.name) / sharded).read_bytes(), b"flat master")
+        self.assertFalse((Path(self.media.name) / flat).exists())
+        self.assertEqual(MediaBlob.objects.get(name=sharded).refs, 2)
+
+        out = io.StringIO()
+        call_command("rebalance_media", "--restart", stdout=out)
+        self.assertIn("moved: 0, missing files: 0", out.getvalue())
+
+    def test_rebalance_media_leaves_rows_replaced_mid_chunk(self):
+        flat = "tracks/0a1b2c3d-0000-4000-8000-000000000000.wav"
+        (Path(self.media.name) / "tracks").mkdir(exist_ok=True)
+        (Path(self.media.name) / flat).write_bytes(b"flat master")
+        track = self._track(b"placeholder")
+        Track.objects.filter(pk=track.pk).update(audio_file=flat)
+        MediaBlob.objects.create(name=flat, refs=1)
+        fresh = self._track(b"fresh upload").audio_file.name
+
+        real_sharded_name = storage.sharded_name
+
+        def upload_while_linking(name):
+            # A new master lands after the chunk was read but before it is written.
+            Track.objects.filter(pk=track.pk).update(audio_file=fresh)
+            return real_sharded_name(name)
+
+        with mock.patch.object(storage, "sharded_name", side_effect=upload_while_linking):
+            out = io.StringIO()
+            call_command("rebalance_media", stdout=out)
+        track.refresh_from_db()
+        self.assertEqual(track.audio_file.name, fresh)
+        self.assertTrue((Path(self.media.name) / fresh).exists())
+        self.assertIn("moved: 0", out.getvalue())
+        self.assertEqual(MediaBlob.objects.get(name=flat).refs, 1)
+
+    def test_rebalance_media_merges_into_existing_sharded_blob(self):
+        uploaded = self._track(b"twice stored")
+        digest = hashlib.sha256(b"twice stored").hexdigest()
+        flat = f"tracks/{digest}.wav"
+        (Path(self.media.name) / flat).write_bytes(b"twice stored")
+        legacy = self._track(b"placeholder")
+        Track.objects.filter(pk=legacy.pk).update(audio_file=flat)
+        MediaBlob.objects.create(name=flat, refs=1)
+
+        call_command("rebalance_media", stdout=io.StringIO())
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.audio_file.name, uploaded.audio_file.name)
+        self.assertFalse(MediaBlob.objects.filter(name=flat).exists())
+        self.assertEqual(MediaBlob.objects.get(name=uploaded.audio_file.name).refs, 2)
+        self.assertFalse((Path(self.media.name) / flat).exists())
+
+
+class SignedMediaTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.track = create_sample_track()
+
+    def test_signed_url_is_offloaded_to_proxy(self):
+        url = self.client.get(f"/api/tracks/{self.track.id}/").data["audio_file"]
+        self.assertIn("/media-signed/tracks/", url)
+        path = url.split("testserver", 1)[1]
+        resp = self.client.get(path)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["X-Accel-Redirect"], f"/protected-media/{self.track.audio_file.name}")
+        self.assertEqual(resp.content, b"")
+
+        self.assertEqual(self.client.get(path.replace("sig=", "sig=0")).status_code, 403)
+        expires, sig = signed_media.sign(self.track.audio_file.name, now=0)
+        expired = f"/media-signed/{self.track.audio_file.name}?exp={expires}&sig={sig}"
+        self.assertEqual(self.client.get(expired).status_code, 403)
+        # Only protected directories can be signed
+        self.assertFalse(signed_media.verify("contracts/x.txt", *signed_media.sign("contracts/x.txt")))
+
+    def test_stub_proxy_serves_file_bytes(self):
+        from wsgiref.util import setup_testing_defaults
+        from django.core.wsgi import get_wsgi_application
+
+        path, query = signed_media.signed_url(self.track.audio_file.name).split("?")
+        environ = {"PATH_INFO": path, "QUERY_STRING": query, "HTTP_HOST": "testserver"}
+        setup_testing_defaults(environ)
+        seen = {}
+        body = SendfileProxy(get_wsgi_application())(environ, lambda status, headers: seen.update(status=status, headers=dict(headers)))
+        self.assertEqual(seen["status"], "200 OK")
+        self.assertEqual(b"".join(body), b"fake-audio-bytes")
+        self.assertNotIn("X-Accel-Redirect", seen["headers"])
+
+
+def make_wav(seconds, rate=8000, channels=2, value=1000, samples=None):
+    """16-bit PCM WAV bytes holding a constant ``value``, or ``samples`` in [-1, 1] (interleaved)."""
+    if samples is None:
+        frames = np.full(int(seconds * rate) * channels, value, dtype="<i2")
+    else:
+        frames = (np.asarray(samples) * 32767).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(frames.tobytes())
+    return buf.getvalue()
+
+
+@override_settings(PREVIEW_OFFSET_SECONDS=1, PREVIEW_LENGTH_SECONDS=1.5, PREVIEW_FADE_SECONDS=0.5)
+class PreviewTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.mp3_track = create_sample_track()
+        self.tracks = [
+            Track.objects.create(title=f"w{i}", album=self.mp3_track.album,
+                                 audio_file=SimpleUploadedFile("m.wav", make_wav(3, value=1000 + i)))
+            for i in range(2)
+        ]
+
+    def test_generate_previews_in_pool_then_skip_current(self):
+        with mock.patch.object(previews, "POOL_THRESHOLD", 1):
+            out = io.StringIO()
+            call_command("generate_previews", "--workers", "2", stdout=out)
+        self.assertIn("Tracks: 3, generated: 2, up to date: 0, failed (not PCM WAV): 1", out.getvalue())
+
+        track = Track.objects.get(pk=self.tracks[0].pk)
+        with track.preview_file.open("rb") as fh, wave.open(fh) as w:
+            self.assertEqual((w.getnframes(), w.getnchannels()), (12000, 2))
+            samples = np.frombuffer(w.readframes(w.getnframes()), "<i2").reshape(-1, 2)
+        self.assertLess(samples[0, 0], 10)
+        self.assertEqual(samples[6000, 0], 1000)
+        self.assertLess(samples[-1, 1], 10)
+
+        resp = APIClient().get(f"/api/tracks/{track.pk}/")
+        self.assertIn(f"/media-signed/{track.preview_file.name}?", resp.data["preview_file"])
+
+        stats = previews.generate([t.pk for t in self.tracks])
+        self.assertEqual((stats["generated"], stats["skipped"]), (0, 2))
+
+    def test_pcm_round_trip_24_bit(self):
+        samples = np.array([-8388608, -1, 0, 1, 8388607], dtype=np.float64)
+        self.assertEqual(previews.decode_pcm(previews.encode_pcm(samples, 3), 3).tolist(), samples.tolist())
+
+
+def make_click_wav(bpm, seconds=12, rate=8000):
+    samples = np.zeros(seconds * rate)
+    burst = 0.8 * np.sin(2 * np.pi * 1000 * np.arange(int(0.02 * rate)) / rate)
+    for start in np.arange(0, seconds, 60 / bpm):
+        i = int(start * rate)
+        samples[i:i + len(burst)] = burst[:len(samples) - i]
+    return make_wav(seconds, rate, channels=1, samples=samples)
+
+
+class AudioFeatureTests(TempMediaMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.album = create_sample_track().album
+
+    def test_loudness_and_peak_of_sine(self):
+        rate = 8000
+        t = np.arange(8 * rate) / rate
+        hops = np.full(800, 0.125)  # mean power of a 0.5-amplitude sine
+        self.assertAlmostEqual(audio_features.integrated_loudness(hops), -9.03, places=2)
+        path = Path(self.media.name) / "sine.wav"
+        path.write_bytes(make_wav(8, rate, channels=1, samples=0.5 * np.sin(2 * np.pi * 440 * t)))
+        features = audio_features.analyze(str(path))
+        self.assertAlmostEqual(features["loudness_db"], -9.03, delta=0.05)
+        self.assertAlmostEqual(features["peak_db"], -6.02, delta=0.05)
+
+    def test_command_estimates_tempo_and_api_filters(self):
+        fast, slow = (
+            Track.objects.create(title=f"{bpm} bpm", album=self.album, audio_file=SimpleUploadedFile("c.wav", make_click_wav(bpm)))
+            for bpm in (128, 90)
+        )
+        with mock.patch.object(audio_features, "POOL_THRESHOLD", 1):
+            out = io.StringIO()
+            call_command("analyze_tracks", "--workers", "2", stdout=out)
+        self.assertIn("Analyzed tracks: 3 (unreadable: 1)", out.getvalue())
+        fast.refresh_from_db()
+        slow.refresh_from_db()
+        self.assertAlmostEqual(fast.bpm, 128, delta=2)
+        self.assertAlmostEqual(slow.bpm, 90, delta=2)
+
+        # Resumes: already analyzed tracks are skipped
+        out = io.StringIO()
+        call_command("analyze_tracks", stdout=out)
+        self.assertIn("Analyzed tracks: 0", out.getvalue())
+
+        # A replaced master drops its stale features and is analyzed again
+        fast.audio_file = SimpleUploadedFile("c.wav", make_click_wav(128))
+        fast.save(update_fields=["audio_file"])
+        fast.refresh_from_db()
+        self.assertIsNone(fast.analyzed_at)
+        self.assertIsNone(fast.bpm)
+        out = io.StringIO()
+        call_command("analyze_tracks", stdout=out)
+        self.assertIn("Analyzed tracks: 1", out.getvalue())
+
+        resp = self.client.get("/api/tracks/", {"bpm_min": 100})
+        self.assertEqual([t["id"] for t in resp.data], [fast.id])
+        resp = self.client.get("/api/tracks/", {"ordering": "bpm"})
+        self.assertEqual([t["id"] for t in resp.data], [slow.id, fast.id])
+        self.assertEqual(self.client.get("/api/tracks/", {"bpm_max": "fast"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/tracks/", {"ordering": "title"}).status_code, 400)
+
+    def test_master_replaced_mid_batch_is_not_stamped(self):
+        track = Track.objects.create(title="t", album=self.album, audio_file=SimpleUploadedFile("c.wav", make_click_wav(128)))
+        real_job = audio_features._analyze_job
+
+        def replace_during_analysis(job):
+            # reset_replaced_features has already cleared the row for the new master
+            Track.objects.filter(pk=track.pk).update(audio_file="tracks/new-master.wav")
+            return real_job(job)
+
+        with mock.patch.object(audio_features, "_analyze_job", side_effect=replace_during_analysis):
+            stats = audio_features.analyze_tracks([track.pk])
+        self.assertEqual(stats["tracks"], 0)
+        track.refresh_from_db()
+        self.assertIsNone(track.analyzed_at)
+        self.assertIsNone(track.bpm)
+
+
+class FacetTests(APITestCase):
+    def setUp(self):
+        self.pop_track = create_sample_track()
+        self.rock = Genre.objects.create(name="Rock")
+        artist = Artist.objects.create(name="Band")
+        album = Album.objects.create(title="Loud", artist=artist, genre=self.rock, release_date=date(2020, 5, 1))
+        self.short = Track.objects.create(title="Short", album=album, audio_file="tracks/s.wav", duration_seconds=100)
+        self.long = Track.objects.create(title="Long", album=album, audio_file="tracks/l.wav", duration_seconds=300)
+
+    def test_track_facets_are_disjunctive_and_free_of_count_queries(self):
+        resp = self.client.get("/api/tracks/", {"genre": self.rock.id, "facets": 1})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual({t["id"] for t in resp.data["results"]}, {self.short.id, self.long.id})
+        counts = {name: {c["value"]: c["count"] for c in values} for name, values in resp.data["facets"].items()}
+        # The genre facet ignores the genre filter itself; the others are narrowed by it.
+        self.assertEqual(counts["genre"], {self.rock.id: 2, self.pop_track.album.genre_id: 1})
+        self.assertEqual(counts["year"], {2020: 2})
+        self.assertEqual(counts["duration"], {"under_2m": 1, "4_6m": 1})
+
+        resp = self.client.get("/api/tracks/", {"genre": self.rock.id, "duration": "4_6m,over_6m", "year": 2020})
+        self.assertEqual([t["id"] for t in resp.data], [self.long.id])
+        with self.assertNumQueries(1):
+            self.client.get("/api/tracks/", {"genre": self.rock.id, "facets": 1})
+
+        # Writes invalidate the index
+        Track.objects.create(title="Epic", album=self.long.album, audio_file="tracks/e.wav", duration_seconds=900)
+        resp = self.client.get("/api/tracks/", {"duration": "over_6m", "facets": 1})
+        self.assertEqual(len(resp.data["results"]), 1)
+        self.assertIn({"value": "over_6m", "count": 1}, resp.data["facets"]["duration"])
+
+    def test_album_duration_facet_and_bad_values(self):
+        resp = self.client.get("/api/albums/", {"duration": "under_20m", "facets": "true"})
+        self.assertEqual(len(resp.data["results"]), 2)
+        self.assertEqual(resp.data["facets"]["duration"], [{"value": "under_20m", "count": 2}])
+        resp = self.client.get("/api/albums/", {"year": 2020})
+        self.assertEqual([a["title"] for a in resp.data], ["Loud"])
+        self.assertEqual(self.client.get("/api/albums/", {"genre": "rock"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/tracks/", {"duration": "forever"}).status_code, 400)
+
+    def test_only_facet_moves_rebuild_the_indexes(self):
+        index = facets.track_facets.get()
+        self.short.title = "Shorter"
+        self.short.save()
+        self.long.album.title = "Louder"
+        self.long.album.save(update_fields=["title"])
+        self.assertIs(facets.track_facets.get(), index)
+
+        self.long.album.genre = None
+        self.long.album.save()
+        self.assertIsNot(facets.track_facets.get(), index)
+        self.assertEqual(facets.track_facets.get().count({"genre": {self.rock.id}}), 0)
+        self.assertEqual(facets.album_facets.get().counts({})["genre"], [{"value": self.pop_track.album.genre_id, "count": 1}])
+
+
+class ApiTokenTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tv", password="pass1234")
+        self.token, self.raw = authentication.issue_token(self.user, name="living room")
+
+    def auth(self, raw=None):
+        return {"HTTP_AUTHORIZATION": f"Bearer {raw or self.raw}"}
+
+    def test_token_authenticates_from_cache_and_stores_only_digest(self):
+        self.assertNotIn(self.raw, str(ApiToken.objects.values_list()))
+        self.assertEqual(self.client.get("/api/cart/", **self.auth()).status_code, 200)
+        # Principal is cached: no token or user lookup on the next request
+        with mock.patch.object(ApiToken.objects, "select_related", side_effect=AssertionError):
+            self.assertEqual(self.client.get("/api/cart/", **self.auth()).status_code, 200)
+        self.assertEqual(self.client.get("/api/cart/", **self.auth("ctv_wrong")).status_code, 401)
+        self.assertEqual(self.client.get("/api/cart/", HTTP_AUTHORIZATION="Basic dHY6cGFzczEyMzQ=").status_code, 401)
+
+    def test_revocation_and_deactivation_drop_cached_principal(self):
+        self.assertEqual(self.client.get("/api/cart/", **self.auth()).status_code, 200)
+        out = io.StringIO()
+        call_command("revoke_token", self.token.prefix, stdout=out)
+        self.assertIn("Revoked tokens: 1", out.getvalue())
+        self.assertEqual(self.client.get("/api/cart/", **self.auth()).status_code, 401)
+
+        out = io.StringIO()
+        call_command("issue_token", "tv", "--ttl-days", "30", stdout=out)
+        raw = out.getvalue().strip()
+        self.assertEqual(self.client.get("/api/cart/", **self.auth(raw)).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/cart/", **self.auth(raw)).status_code, 401)
+
+
+class CatalogCounterTests(APITestCase):
+    def test_counters_follow_track_and_album_changes(self):
+        track = create_sample_track()
+        album, artist = track.album, track.album.artist
+        other = Album.objects.create(title="B-sides", artist=artist)
+        Track.objects.create(title="Two", album=album, audio_file="tracks/2.wav", duration_seconds=77)
+        # A stale in-memory album must not overwrite the counters on save
+        album.title = "Renamed"
+        album.save()
+        album.refresh_from_db()
+        self.assertEqual((album.title, album.track_count, album.total_duration_seconds), ("Renamed", 2, 200))
+
+        track.album, track.duration_seconds = other, 100
+        track.save()
+        other.refresh_from_db()
+        artist.refresh_from_db()
+        self.assertEqual((other.track_count, other.total_duration_seconds), (1, 100))
+        self.assertEqual((artist.album_count, artist.track_count), (2, 2))
+
+        newcomer = Artist.objects.create(name="Guest")
+        other.artist = newcomer
+        other.save()
+        album.delete()
+        artist.refresh_from_db()
+        newcomer.refresh_from_db()
+        self.assertEqual((artist.album_count, artist.track_count), (0, 0))
+        self.assertEqual((newcomer.album_count, newcomer.track_count), (1, 1))
+        resp = self.client.get(f"/api/albums/{other.id}/")
+        self.assertEqual((resp.data["track_count"], resp.data["total_duration_seconds"]), (1, 100))
+
+    def test_update_fields_saves_leave_counters_alone(self):
+        track = create_sample_track()
+        track.preview_key = "abc"
+        track.save(update_fields=["preview_key"])
+        track.album.title = "Renamed"
+        track.album.save(update_fields=["title"])
+        album = Album.objects.get()
+        artist = Artist.objects.get()
+        self.assertEqual((album.track_count, album.total_duration_seconds), (1, track.duration_seconds))
+        self.assertEqual((artist.album_count, artist.track_count), (1, 1))
+
+        track.duration_seconds = 200
+        track.save(update_fields=["duration_seconds"])
+        album.refresh_from_db()
+        self.assertEqual((album.track_count, album.total_duration_seconds), (1, 200))
+
+    def test_counted_row_is_locked_for_the_whole_save(self):
+        track = create_sample_track()
+        track.duration_seconds = 200
+        with mock.patch.object(QuerySet, "select_for_update", autospec=True, side_effect=QuerySet.select_for_update) as lock, \
+                CaptureQueriesContext(connection) as ctx:
+            track.save()
+        self.assertEqual(lock.call_args.args[0].model, Track)
+        # The lock is taken inside the save's own transaction (a savepoint under TestCase)
+        self.assertTrue(ctx.captured_queries[0]["sql"].startswith("SAVEPOINT"))
+
+    def test_recount_repairs_drift(self):
+        track = create_sample_track()
+        Album.objects.update(track_count=9, total_duration_seconds=0)
+        Artist.objects.update(album_count=3)
+        out = io.StringIO()
+        call_command("recount", stdout=out)
+        self.assertIn("Fixed albums: 1, artists: 1", out.getvalue())
+        album = Album.objects.get()
+        self.assertEqual((album.track_count, album.total_duration_seconds), (1, track.duration_seconds))
+        self.assertEqual(Artist.objects.get().album_count, 1)
+
+
+class DiscographyTests(APITestCase):
+    def setUp(self):
+        self.track = create_sample_track()
+        self.artist = self.track.album.artist
+        self.newer = Album.objects.create(title="Second", artist=self.artist, release_date=date(2024, 1, 1))
+        Track.objects.create(title="Opener", album=self.newer, audio_file="tracks/o.wav", duration_seconds=60)
+
+    def test_discography_nests_albums_and_tracks_in_fixed_queries(self):
+        url = f"/api/artists/{self.artist.id}/discography/"
+        genres.get(self.track.album.genre_id)  # warm the process-local genre table
+        with self.assertNumQueries(3):
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.data["album_count"], resp.data["track_count"]), (2, 2))
+        self.assertEqual([a["title"] for a in resp.data["albums"]], ["Second", "Test Album"])
+        self.assertEqual(resp.data["albums"][1]["genre"], {"id": self.track.album.genre_id, "name": "Pop"})
+        self.assertEqual(set(resp.data["albums"][0]["tracks"][0]), {"id", "title", "duration_seconds", "bpm", "preview_file"})
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        # Catalog edits invalidate the cached response
+        self.track.title = "Retitled"
+        self.track.save()
+        resp = self.client.get(url)
+        self.assertEqual(resp.data["albums"][1]["tracks"][0]["title"], "Retitled")
+        self.assertEqual(self.client.get("/api/artists/999/discography/").status_code, 404)
+
+        # Bulk writes send no signals; the repairs that follow them retire the response
+        Track.objects.bulk_create([Track(title="Bonus", album=self.newer, audio_file="tracks/b.wav")])
+        self.assertEqual(self.client.get(url).data["track_count"], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            counters.recount()
+        self.assertEqual(self.client.get(url).data["track_count"], 3)
+
+
+class BatchTests(APITestCase):
+    def test_batch_runs_get_subrequests_with_shared_auth(self):
+        create_sample_track()
+        user = User.objects.create_user(username="ctv", password="pass1234")
+        _, raw = authentication.issue_token(user)
+        resp = self.client.post("/api/batch/", {"requests": [
+            "/api/genres/",
+            {"id": "cart", "path": "/api/cart/"},
+            "/api/tracks/?genre=999",
+            "/api/nope/",
+            "/admin/",
+        ]}, format="json", HTTP_AUTHORIZATION=f"Bearer {raw}")
+        self.assertEqual(resp.status_code, 200)
+        results = resp.data["responses"]
+        self.assertEqual([r["status"] for r in results], [200, 200, 200, 404, 400])
+        self.assertEqual(results[0]["body"][0]["name"], "Pop")
+        self.assertEqual((results[1]["id"], results[1]["body"]["user"]), ("cart", user.id))
+        self.assertEqual(results[2]["body"], [])
+        self.assertTrue(all(r["duration_ms"] >= 0 for r in results))
+
+        # Anonymous batches get each view's own auth answer
+        resp = self.client.post("/api/batch/", {"requests": ["/api/cart/"]}, format="json")
+        self.assertIn(resp.data["responses"][0]["status"], (401, 403))
+
+    def test_batch_reports_a_crashing_subrequest_as_its_own_500(self):
+        create_sample_track()
+        with mock.patch.object(GenreViewSet, "list", side_effect=RuntimeError("boom")), \
+                self.assertLogs("app.api", level="ERROR"):
+            resp = self.client.post("/api/batch/", {"requests": ["/api/genres/", "/api/tracks/"]}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        results = resp.data["responses"]
+        self.assertEqual([r["status"] for r in results], [500, 200])
+        self.assertEqual(results[0]["body"], {"detail": "Internal error"})
+
+    def test_batch_rejects_bad_envelopes(self):
+        self.assertEqual(self.client.post("/api/batch/", {"requests": []}, format="json").status_code, 400)
+        body = {"requests": [{"path": "/api/cart/clear/", "method": "POST"}]}
+        self.assertEqual(self.client.post("/api/batch/", body, format="json").status_code, 400)
+        with override_settings(BATCH_MAX_REQUESTS=2):
+            body = {"requests": ["/api/genres/"] * 3}
+            self.assertEqual(self.client.post("/api/batch/", body, format="json").status_code, 400)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_MAX_FILES=2)
+class ProfilingTests(TempMediaMixin, APITestCase):
+    temp_dir_setting = "PROFILING_DIR"
+
+    def test_middleware_unloads_itself_when_disabled(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                profiling.ProfilingMiddleware(lambda request: None)
+
+    def test_signed_header_profiles_into_ring_buffer(self):
+        self.assertNotIn("X-Profile-Id", self.client.get("/api/genres/"))
+        forged = self.client.get("/api/genres/", HTTP_X_PROFILE="9999999999.bad")
+        self.assertNotIn("X-Profile-Id", forged)
+        header = profiling.sign_header()
+        names = [self.client.get("/api/genres/", HTTP_X_PROFILE=header)["X-Profile-Id"] for _ in range(3)]
+        self.assertEqual([p["name"] for p in profiling.list_profiles()], names[:0:-1])
+        self.assertEqual(profiling.list_profiles()[0]["path"], "api_genres")
+
+        User.objects.create_superuser(username="ops", password="pass1234", email="ops@example.com")
+        self.client.login(username="ops", password="pass1234")
+        self.assertContains(self.client.get("/profiles/"), "GET api_genres", count=2)
+        resp = self.client.get(f"/profiles/{names[-1]}", {"format": "text"})
+        self.assertContains(resp, "function calls")
+        self.assertEqual(self.client.get("/profiles/../settings.py").status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get("/profiles/").status_code, 302)
+
+    def test_sampling(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1.0):
+            self.assertIn("X-Profile-Id", self.client.get("/api/genres/"))
@@ -0,0 +1,194 @@
+"""
+GCRA (generic cell rate algorithm) rate limiting for public endpoints.
+
+A rate of ``N/period`` allows bursts of N requests and then one request every
+``period / N`` seconds. GCRA keeps a single number per client, the theoretical
+arrival time (TAT), so each check is one atomic read-modify-write.
+
+State lives in a store shared by all workers:
+- SQLiteStore (RATE_LIMIT_STORE_PATH set): a WAL-mode SQLite file updated under
+  ``BEGIN IMMEDIATE``, shared by every worker process on the host.
+- MemoryStore (default): per-process dict, for tests and single-process dev.
+  It holds at most MAX_KEYS buckets: refilled ones are dropped first, then the
+  least recently used.
+
+Client IPs come from DRF's ``get_ident``, which honours ``X-Forwarded-For`` only
+as far as REST_FRAMEWORK['NUM_PROXIES'] allows; with the default of 0 the socket
+address is used and clients cannot choose their own bucket.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .authentication import TOKEN_PREFIX, ApiTokenAuthentication, token_digest
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'100/min' -> (100, 60.0), same format as DRF's DEFAULT_THROTTLE_RATES."""
+    num, period = rate.split('/')
+    return int(num), float(PERIODS[period[0]])
+
+
+def gcra(tat, now, interval, burst):
+    """Return (allowed, new_tat, retry_after_seconds)."""
+    tat = max(tat, now)
+    allow_at = tat + interval - burst * interval
+    if allow_at > now:
+        return False, tat, allow_at - now
+    return True, tat + interval, 0.0
+
+
+class MemoryStore:
+    MAX_KEYS = 100_000
+
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self._tat = {}
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # A bucket whose TAT has passed is full again, so forgetting it changes nothing.
+        for key in [k for k, tat in self._tat.items() if tat < now]:
+            del self._tat[key]
+        for key in list(self._tat)[:max(0, len(self._tat) - self.max_keys + 1)]:
+            del self._tat[key]
+
+    def update(self, key, now, interval, burst):
+        with self._lock:
+            allowed, tat, wait = gcra(self._tat.pop(key, now), now, interval, burst)
+            if len(self._tat) >= self.max_keys:
+                self._evict(now)
+            # Re-inserting keeps the dict in least-recently-used order.
+            self._tat[key] = tat
+        return allowed, wait
+
+    def clear(self):
+        with self._lock:
+            self._tat.clear()
+
+
+class SQLiteStore:
+    # Roughly one update in this many also deletes buckets that have fully refilled.
+    vacuum_every = 1000
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS gcra (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def update(self, key, now, interval, burst):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tat FROM gcra WHERE key = ?', (key,)).fetchone()
+            allowed, tat, wait = gcra(row[0] if row else now, now, interval, burst)
+            if allowed:
+                conn.execute(
+                    'INSERT INTO gcra (key, tat) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET tat = excluded.tat',
+                    (key, tat),
+                )
+            if random.randrange(self.vacuum_every) == 0:
+                conn.execute('DELETE FROM gcra WHERE tat < ?', (now,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, wait
+
+    def clear(self):
+        self._connection().execute('DELETE FROM gcra')
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        path = getattr(settings, 'RATE_LIMIT_STORE_PATH', '')
+        _store = SQLiteStore(path) if path else MemoryStore()
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_store(setting, **kwargs):
+    global _store
+    if setting == 'RATE_LIMIT_STORE_PATH':
+        _store = None
+
+
+class GCRAThrottle(BaseThrottle):
+    """Per-route budgets keyed by user, API token (X-Api-Key) or client IP.
+
+    Views opt in with ``throttle_scope``; the budget is
+    ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'][scope]``. DRF turns a refusal into
+    429 with a ``Retry-After`` header taken from ``wait()``.
+    """
+    api_key_header = 'X-Api-Key'
+    # digest -> monotonic expiry of X-Api-Key values that failed to authenticate, so
+    # a client cycling random keys costs one lookup per key and then none
+    rejected_keys = {}
+    rejected_key_seconds = 60
+    rejected_key_limit = 10_000
+
+    def __init__(self):
+        self._wait = None
+
+    def get_ident_key(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f"user:{user.pk}"
+        api_key = request.headers.get(self.api_key_header)
+        if api_key and api_key.startswith(TOKEN_PREFIX):
+            # Only an issued API token earns its own budget; anything else would let a
+            # client pick a fresh bucket per request, so unknown keys count against the IP.
+            key_user = self._token_user(api_key)
+            if key_user is not None:
+                return f"user:{key_user.pk}"
+        return f"ip:{self.get_ident(request)}"
+
+    def _token_user(self, api_key):
+        digest, now = token_digest(api_key), time.monotonic()
+        if self.rejected_keys.get(digest, 0) > now:
+            return None
+        try:
+            return ApiTokenAuthentication().authenticate_credentials(api_key)[0]
+        except AuthenticationFailed:
+            if len(self.rejected_keys) >= self.rejected_key_limit:
+                self.rejected_keys.clear()
+            self.rejected_keys[digest] = now + self.rejected_key_seconds
+            return None
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if not rate:
+            return True
+        num_requests, duration = parse_rate(rate)
+        allowed, self._wait = get_store().update(
+            f"{scope}:{self.get_ident_key(request)}", time.time(), duration / num_requests, num_requests,
+        )
+        return allowed
+
+    def wait(self):
+        return self._wait
@@ -7,9 +7,15 @@ from .api import (
     AlbumViewSet,
     TrackViewSet,
     PricingTierViewSet,
+    CatalogChangesViewSet,
     ServiceRequestViewSet,
     CartViewSet,
     OrderViewSet,
+    EntitlementViewSet,
+    AdSelectionViewSet,
+    RevenueReportViewSet,
+    PaymentWebhookViewSet,
+    BatchViewSet,
 )
 
 router = DefaultRouter()
@@ -18,10 +24,16 @@ router.register(r'artists', ArtistViewSet, basename='artist')
 router.register(r'albums', AlbumViewSet, basename='album')
 router.register(r'tracks', TrackViewSet, basename='track')
 router.register(r'pricing-tiers', PricingTierViewSet, basename='pricingtier')
+router.register(r'catalog/changes', CatalogChangesViewSet, basename='catalogchange')
 router.register(r'service-requests', ServiceRequestViewSet, basename='servicerequest')
 # Cart as non-model viewset
 router.register(r'cart', CartViewSet, basename='cart')
 router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'entitlements', EntitlementViewSet, basename='entitlement')
+router.register(r'ads', AdSelectionViewSet, basename='ad')
+router.register(r'reports/revenue', RevenueReportViewSet, basename='revenuereport')
+router.register(r'payments/webhook', PaymentWebhookViewSet, basename='paymentwebhook')
+router.register(r'batch', BatchViewSet, basename='batch')
 
 urlpatterns = [
     # Web views (optional; not used by Vite frontend)
@@ -32,6 +44,9 @@ urlpatterns = [
     path('upload/ad/', views.upload_ad_video, name='upload_ad_video'),
     path('service-request/', views.service_request, name='service_request'),
     path('success/', views.upload_success, name='upload_success'),
+    path('media-signed/<path:name>', views.serve_signed_media, name='signed_media'),
+    path('profiles/', views.profiles, name='profiles'),
+    path('profiles/<str:name>', views.profile_download, name='profile_download'),
 
     # API routes for React/Vite
     path('api/', include(router.urls)),
@@ -1,7 +1,10 @@
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.mail import send_mail
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
 from django.shortcuts import render, redirect
 from django.urls import reverse
+from django.views.decorators.http import require_safe
 
 from .forms import (
     ArtistImageForm,
@@ -11,6 +14,8 @@ from .forms import (
     ServiceRequestForm,
 )
 from .models import Artist, Album, Track, AdCampaign
+from . import profiling
+from .signed_media import offload_headers, verify
 
 
 def home(request):
@@ -88,3 +93,35 @@ def service_request(request):
     else:
         form = ServiceRequestForm()
     return render(request, "service_request.html", {"form": form})
+
+
+@require_safe
+def serve_signed_media(request, name):
+    """Check a signed media link and hand the file off to the front proxy (see app/signed_media.py)."""
+    if not verify(name, request.GET.get("exp"), request.GET.get("sig")):
+        return HttpResponseForbidden("Invalid or expired link")
+    return HttpResponse(headers=offload_headers(name))
+
+
+@staff_member_required
+@require_safe
+def profiles(request):
+    """Stored request profiles (see app/profiling.py), newest first."""
+    context = {
+        "profiles": profiling.list_profiles(),
+        "enabled": settings.PROFILING_ENABLED,
+        "sample_rate": settings.PROFILING_SAMPLE_RATE,
+        "header": profiling.sign_header() if settings.PROFILING_ENABLED else "",
+    }
+    return render(request, "profiles.html", context)
+
+
+@staff_member_required
+@require_safe
+def profile_download(request, name):
+    path = profiling.profile_path(name)
+    if path is None:
+        raise Http404("No such profile")
+    if request.GET.get("format") == "text":
+        return HttpResponse(profiling.summary(path), content_type="text/plain; charset=utf-8")
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=name, content_type="application/octet-stream")
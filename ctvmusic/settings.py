@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 import os
 
@@ -54,6 +55,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,6 +63,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Removes itself unless PROFILING_ENABLED
+    'app.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'ctvmusic.urls'
@@ -136,6 +140,26 @@ STATICFILES_DIRS = [BASE_DIR / 'static'] if (BASE_DIR / 'static').exists() else
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads under artists/, albums/, tracks/ and ads/ are stored once per distinct content
+# (app/storage.py); collapse pre-existing duplicates with `manage.py dedupe_media`
+STORAGES = {
+    'default': {'BACKEND': 'app.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Signed media URLs for tracks/ and ads/ (app/signed_media.py). The front proxy serves the file
+# named by X-Accel-Redirect (nginx: an `internal` location at the prefix aliased to MEDIA_ROOT)
+# or by X-Sendfile (Apache/lighttpd); `python -m app.sendfile_proxy` emulates it locally.
+MEDIA_SIGNING_KEY = os.getenv('MEDIA_SIGNING_KEY', SECRET_KEY)
+MEDIA_URL_TTL_SECONDS = int(os.getenv('MEDIA_URL_TTL_SECONDS', '3600'))
+MEDIA_SENDFILE_HEADER = os.getenv('MEDIA_SENDFILE_HEADER', 'X-Accel-Redirect')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+# Track preview clips (app/previews.py, `manage.py generate_previews`)
+PREVIEW_OFFSET_SECONDS = float(os.getenv('PREVIEW_OFFSET_SECONDS', '30'))
+PREVIEW_LENGTH_SECONDS = float(os.getenv('PREVIEW_LENGTH_SECONDS', '30'))
+PREVIEW_FADE_SECONDS = float(os.getenv('PREVIEW_FADE_SECONDS', '2'))
+
 # Email configuration for development
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEVELOPER_EMAIL = os.getenv('DEVELOPER_EMAIL', 'developer@tfnms.co')
@@ -143,6 +167,37 @@ DEVELOPER_EMAIL = os.getenv('DEVELOPER_EMAIL', 'developer@tfnms.co')
 # Pexels API (optional)
 PEXELS_API_KEY = os.getenv('PEXELS_API_KEY')
 
+# Cache backend. The default LocMemCache is per-process; point CACHE_BACKEND/CACHE_LOCATION at a
+# shared backend (e.g. django.core.cache.backends.redis.RedisCache) so version keys reach all workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Process-local reference caches (app/refcache.py): seconds between shared version checks
+REFERENCE_CACHE_CHECK_SECONDS = float(os.getenv('REFERENCE_CACHE_CHECK_SECONDS', '1'))
+
+# Artist discography responses (/api/artists/{id}/discography/) stay in the shared cache this long
+# unless a catalog edit invalidates them first; keep it well under MEDIA_URL_TTL_SECONDS (signed links).
+DISCOGRAPHY_CACHE_SECONDS = int(os.getenv('DISCOGRAPHY_CACHE_SECONDS', '300'))
+
+# Playback entitlement index (app/entitlements.py): seconds between incremental refreshes
+ENTITLEMENT_REFRESH_SECONDS = float(os.getenv('ENTITLEMENT_REFRESH_SECONDS', '5'))
+
+# Legal review queue: how long a claimed order stays reserved for its reviewer
+REVIEW_CLAIM_LEASE_SECONDS = int(os.getenv('REVIEW_CLAIM_LEASE_SECONDS', '900'))
+
+# Idempotency-Key responses are replayed for this long; purge with `manage.py purge_idempotency_keys`
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_KEY_TTL_SECONDS', str(24 * 3600)))
+# An IN_PROGRESS key older than this is treated as abandoned (crashed worker) and can be claimed again
+IDEMPOTENCY_IN_PROGRESS_TIMEOUT_SECONDS = int(os.getenv('IDEMPOTENCY_IN_PROGRESS_TIMEOUT_SECONDS', '120'))
+
+# Payments (app/payments.py): provider class and the secret its webhooks are signed with
+PAYMENTS_PROVIDER = os.getenv('PAYMENTS_PROVIDER', 'app.payments.FakePaymentProvider')
+PAYMENTS_WEBHOOK_SECRET = os.getenv('PAYMENTS_WEBHOOK_SECRET', 'dev-webhook-secret')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -151,14 +206,66 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # Bearer tokens (app/authentication.py); BasicAuthentication hashed a password per request.
+        # Listed first so unauthenticated API calls get 401 with WWW-Authenticate: Bearer.
+        'app.authentication.ApiTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # Views opt in with `throttle_scope`; budgets are per user, API key (X-Api-Key) or client IP
+    'DEFAULT_THROTTLE_CLASSES': [
+        'app.throttling.GCRAThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'catalog': os.getenv('THROTTLE_RATE_CATALOG', '1200/min'),
+        'service_requests': os.getenv('THROTTLE_RATE_SERVICE_REQUESTS', '10/min'),
+    },
+    # Reverse proxies in front of the app; X-Forwarded-For is only trusted that many hops deep.
+    # 0 keys anonymous budgets on REMOTE_ADDR (set to 1 behind a single nginx/load balancer).
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
+    # JSON goes through orjson when installed; MessagePack/CBOR are offered only if their package is
+    'DEFAULT_RENDERER_CLASSES': [
+        'app.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        *(['app.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+        *(['app.renderers.CBORRenderer'] if find_spec('cbor2') else []),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        *(['app.renderers.MessagePackParser'] if find_spec('msgpack') else []),
+        *(['app.renderers.CBORParser'] if find_spec('cbor2') else []),
+    ],
 }
 
+# POST /api/batch/ (app/api.py): most GET sub-requests accepted in one batch
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '20'))
+
+# API tokens: resolved users are cached per process for this many seconds (revocation
+# still takes effect within REFERENCE_CACHE_CHECK_SECONDS); the cache holds at most SIZE tokens.
+API_TOKEN_CACHE_SECONDS = float(os.getenv('API_TOKEN_CACHE_SECONDS', '60'))
+API_TOKEN_CACHE_SIZE = int(os.getenv('API_TOKEN_CACHE_SIZE', '10000'))
+
+# Request profiling (app/profiling.py). Off by default; when off the middleware unloads itself.
+# Requests are profiled with a signed X-Profile header (see /profiles/) or at PROFILING_SAMPLE_RATE (0-1).
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_SIGNING_KEY = os.getenv('PROFILING_SIGNING_KEY', SECRET_KEY)
+PROFILING_DIR = os.getenv('PROFILING_DIR', str(BASE_DIR / 'profiles'))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', '50'))
+
+# Response compression (app/middleware.py): gzip, or brotli when installed and accepted.
+# Bodies smaller than this many bytes are sent as-is.
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+RESPONSE_COMPRESSION_BROTLI_QUALITY = int(os.getenv('RESPONSE_COMPRESSION_BROTLI_QUALITY', '5'))
+
+# Shared rate-limit state: path to a SQLite file used by all workers on the host.
+# Empty keeps limits per process (fine for tests and runserver).
+RATE_LIMIT_STORE_PATH = os.getenv('RATE_LIMIT_STORE_PATH', '')
+
 # CORS configuration for Vite dev server
 CORS_ALLOW_CREDENTIALS = True
 